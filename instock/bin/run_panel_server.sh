@@ -0,0 +1,5 @@
+#!/bin/bash
+
+/usr/local/bin/python3 /data/InStock/instock/core/panel_server.py
+
+echo ------行情数据服务已启动 请不要关闭------
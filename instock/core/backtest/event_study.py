@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+from instock.lib.simple_logger import get_logger
+
+# 获取logger
+logger = get_logger(__name__)
+
+import statistics
+import numpy as np
+import pandas as pd
+import instock.core.tablestructure as tbs
+import instock.core.stockfetch as stf
+from instock.core.market_panel import to_datetime64
+from instock.lib.database_factory import read_sql_to_df
+
+__author__ = 'myh '
+__date__ = '2026/10/16 '
+
+# 事件研究：统计信号(K线形态、策略选股、指标买卖点)出现后N日的收益表现。
+#   收益口径与 rate_stats.get_rates 一致：以信号当日收盘价为基准，第N根有效K线(跳过停牌)的收盘涨跌幅(%)；
+#   超额收益为同一日期、同一持有期的全市场等权平均收益之差。
+#   每个持有期先在面板上整体算出 代码×交易日 的远期收益矩阵，事件只按(行, 列)下标取值，不逐股计算。
+
+HORIZONS = (1, 2, 3, 5, 10, 20, 60)
+CONFIDENCE = 0.95
+
+
+def forward_returns(panel, horizon):
+    """
+    远期收益矩阵
+
+    Returns:
+        (代码数, 交易日数) 数组：第t个交易日收盘买入、持有horizon根有效K线后的收益率(%)，
+        t日停牌或之后K线不足时为NaN
+    """
+    close = panel.fields['close']
+    n, t = close.shape
+    valid = panel.valid
+    valid_count = panel.valid_count
+    k = valid_count - 1 + horizon
+    ok = valid & (k < valid_count[:, -1:])
+    rows = np.arange(n)[:, None]
+    cols = panel.compact_index[rows, np.where(ok, k, 0)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = (close[rows, cols] / close - 1) * 100
+    out[~ok] = np.nan
+    return out
+
+
+def market_returns(forward):
+    """每个交易日全市场等权平均远期收益，没有样本的交易日为NaN"""
+    ok = ~np.isnan(forward)
+    count = ok.sum(axis=0)
+    total = np.where(ok, forward, 0.0).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def locate(panel, events):
+    """
+    事件的面板下标
+
+    Returns:
+        (rows, cols, found)：found为事件当日在面板中有该股K线的掩码，rows/cols只对found为True的事件有效
+    """
+    rows = np.array([panel.code_index.get(c, -1) for c in events['code'].values], dtype=np.int64)
+    dates = pd.to_datetime(events['date']).values.astype('datetime64[D]')
+    cols = np.searchsorted(panel.dates, dates)
+    found = (rows >= 0) & (cols < len(panel.dates))
+    cols = np.where(found, cols, 0)
+    found &= panel.dates[cols] == dates
+    rows = np.where(found, rows, 0)
+    found &= panel.valid[rows, cols]
+    return rows, cols, found
+
+
+def gather(panel, events, horizons=HORIZONS):
+    """
+    取每个事件各持有期的收益和超额收益
+
+    Args:
+        panel: market_panel，至少含close字段，需覆盖事件日期之后最长持有期的K线
+        events: DataFrame，含 group、date、code 列，可选 direction 列(1看多/-1看空，默认1)
+
+    Returns:
+        长表DataFrame，列为 group、direction、horizon、ret、excess，只含收益可计算的事件
+    """
+    rows, cols, found = locate(panel, events)
+    missing = int((~found).sum())
+    if missing > 0:
+        logger.info(f"event_study.gather有{missing}个事件当日没有K线，已跳过")
+    rows, cols = rows[found], cols[found]
+    group = events['group'].values[found]
+    if 'direction' in events.columns:
+        direction = np.sign(events['direction'].values[found]).astype(np.int8)
+        direction[direction == 0] = 1
+    else:
+        direction = np.ones(len(rows), dtype=np.int8)
+    out = []
+    for h in horizons:
+        forward = forward_returns(panel, h)
+        market = market_returns(forward)
+        ret = forward[rows, cols]
+        ok = ~np.isnan(ret)
+        out.append(pd.DataFrame({'group': group[ok], 'direction': direction[ok], 'horizon': h,
+                                 'ret': ret[ok], 'excess': ret[ok] - market[cols[ok]]}))
+    if not out:
+        return pd.DataFrame(columns=['group', 'direction', 'horizon', 'ret', 'excess'])
+    return pd.concat(out, ignore_index=True)
+
+
+def summarize(samples, confidence=CONFIDENCE):
+    """
+    按 group、direction、horizon 汇总
+
+    Returns:
+        DataFrame：count、mean、median、std、hit_rate(收益方向与信号方向一致的比例)、
+        ci_low/ci_high(均值的正态近似置信区间)，以及超额收益的 excess_mean、excess_median、
+        excess_hit_rate、excess_ci_low、excess_ci_high
+    """
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+    samples = samples.assign(hit=(samples['ret'] * samples['direction']) > 0,
+                             excess_hit=(samples['excess'] * samples['direction']) > 0)
+    grouped = samples.groupby(['group', 'direction', 'horizon'], sort=True)
+    data = grouped.agg(count=('ret', 'size'), mean=('ret', 'mean'), median=('ret', 'median'), std=('ret', 'std'),
+                       hit_rate=('hit', 'mean'), excess_mean=('excess', 'mean'),
+                       excess_median=('excess', 'median'), excess_std=('excess', 'std'),
+                       excess_hit_rate=('excess_hit', 'mean'))
+    se = data['std'] / np.sqrt(data['count'])
+    data['ci_low'] = data['mean'] - z * se
+    data['ci_high'] = data['mean'] + z * se
+    se = data['excess_std'] / np.sqrt(data['count'])
+    data['excess_ci_low'] = data['excess_mean'] - z * se
+    data['excess_ci_high'] = data['excess_mean'] + z * se
+    data = data.drop(columns=['excess_std'])
+    return data.reset_index()
+
+
+def study(panel, events, horizons=HORIZONS, confidence=CONFIDENCE):
+    """对一组事件做事件研究，参数见 gather 和 summarize"""
+    try:
+        if events is None or len(events.index) == 0:
+            return None
+        return summarize(gather(panel, events, horizons), confidence)
+    except Exception as e:
+        logger.error(f"event_study.study处理异常：{e}")
+    return None
+
+
+def run(events, horizons=HORIZONS, confidence=CONFIDENCE):
+    """读取事件最早日期起的收盘价面板后做事件研究"""
+    try:
+        if events is None or len(events.index) == 0:
+            return None
+        date_start = pd.to_datetime(events['date']).min().strftime("%Y%m%d")
+        panel = stf.get_stock_hist_panel(date_start, fields=('close',))
+        if panel is None:
+            return None
+        return study(panel, events, horizons, confidence)
+    except Exception as e:
+        logger.error(f"event_study.run处理异常：{e}")
+    return None
+
+
+def _date_where(date_start, date_end):
+    where = []
+    params = {}
+    if date_start is not None:
+        where.append("`date` >= %(date_start)s")
+        params['date_start'] = str(to_datetime64(date_start))
+    if date_end is not None:
+        where.append("`date` <= %(date_end)s")
+        params['date_end'] = str(to_datetime64(date_end))
+    return (f" WHERE {' AND '.join(where)}" if where else ""), (params if params else None)
+
+
+def pattern_events(date_start=None, date_end=None):
+    """K线形态出现记录作为事件，看多/看空由信号正负决定"""
+    where, params = _date_where(date_start, date_end)
+    sql = (f"SELECT `pattern` AS `group`, `date`, `code`, `signal` AS `direction` "
+           f"FROM {tbs.TABLE_CN_STOCK_PATTERN_OCCURRENCE['name']}{where}")
+    return read_sql_to_df(sql, params)
+
+
+def table_events(table, date_start=None, date_end=None, direction=1):
+    """选股结果表(策略、指标买卖点)中的记录作为事件，组名为表的中文名"""
+    where, params = _date_where(date_start, date_end)
+    data = read_sql_to_df(f"SELECT `date`, `code` FROM `{table['name']}`{where}", params)
+    if data is None or len(data.index) == 0:
+        return None
+    data.insert(0, 'group', table['cn'])
+    data['direction'] = direction
+    return data
+
+
+def strategy_events(date_start=None, date_end=None):
+    """全部策略和指标买卖点的选股记录"""
+    frames = [table_events(t, date_start, date_end) for t in tbs.TABLE_CN_STOCK_STRATEGIES]
+    frames.append(table_events(tbs.TABLE_CN_STOCK_INDICATORS_BUY, date_start, date_end))
+    frames.append(table_events(tbs.TABLE_CN_STOCK_INDICATORS_SELL, date_start, date_end, direction=-1))
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+from instock.lib.simple_logger import get_logger
+
+# 获取logger
+logger = get_logger(__name__)
+
+import math
+import numpy as np
+import pandas as pd
+import instock.core.stockfetch as stf
+from instock.core.market_panel import code_suffix, to_datetime64
+from instock.core.backtest import event_study
+
+__author__ = 'myh '
+__date__ = '2026/10/16 '
+
+# 组合回测：按交易日逐日撮合，模拟一个资金账户依信号买入、按规则卖出。
+#   信号：代码×交易日 的布尔矩阵，信号日收盘后确认，下一交易日开盘买入；来源可以是选股结果表(signal_matrix)
+#         或策略在面板上的逐日计算结果(strategy_signals)。
+#   T+1：买入当日不能卖出，最早在下一交易日开盘卖出；停牌日不能买卖，顺延到复牌日。
+#   涨跌停：开盘价达到涨停价不能买入，达到跌停价不能卖出；涨跌幅按板块区分，
+#           科创板20%、创业板2020-08-24起20%、北交所30%、其他10%(面板中没有ST标记，ST股按10%处理)。
+#   仓位：最多持有max_positions只，每只买入金额为前一日总资产的1/max_positions(不超过可用现金)，按100股整数倍成交。
+#   费用：买卖双向佣金(不足最低佣金按最低收取)、卖出印花税，成交价在开盘价基础上计入滑点。
+#   卖出：持有满hold_days根K线，或收盘收益达到止损/止盈线后的下一交易日开盘。
+#   每日只处理持仓和当天的候选股票，10年全市场回测在秒级完成，可用于参数扫描。
+
+HOLD_DAYS = 5
+MAX_POSITIONS = 10
+INITIAL_CASH = 1000000.0
+COMMISSION = 0.00025  # 佣金费率，买卖双向
+MIN_COMMISSION = 5.0  # 单笔最低佣金
+STAMP_DUTY = 0.0005  # 印花税，仅卖出
+SLIPPAGE = 0.001  # 滑点，买入价上浮、卖出价下浮的比例
+LOT = 100  # 每手股数
+TRADING_DAYS = 252  # 每年交易日数，用于年化
+CHINEXT_REFORM = np.datetime64('2020-08-24', 'D')  # 创业板涨跌幅改为20%的日期
+BACKTEST_FIELDS = ('open', 'close', 'preclose')
+
+EQUITY_COLUMNS = ('date', 'cash', 'market_value', 'equity', 'positions', 'turnover')
+TRADE_COLUMNS = ('code', 'name', 'entry_date', 'entry_price', 'exit_date', 'exit_price', 'shares', 'bars',
+                 'fee', 'pnl', 'ret', 'reason')
+
+
+def limit_rates(codes, date):
+    """每只股票在date的涨跌幅限制比例"""
+    rates = np.full(len(codes), 0.1)
+    date = to_datetime64(date)
+    for i, code in enumerate(codes):
+        code = code_suffix(code)
+        if code.startswith('688'):
+            rates[i] = 0.2
+        elif code.startswith(('300', '301')):
+            rates[i] = 0.2 if date >= CHINEXT_REFORM else 0.1
+        elif code.startswith(('8', '4', '92')):
+            rates[i] = 0.3
+    return rates
+
+
+def signal_matrix(panel, events):
+    """
+    选股记录转为信号矩阵
+
+    Args:
+        panel: market_panel
+        events: DataFrame，含date、code列，如 event_study.table_events 的结果
+
+    Returns:
+        (代码数, 交易日数) 布尔数组，信号当日没有K线的记录忽略
+    """
+    signals = np.zeros(panel.shape, dtype=bool)
+    if events is None or len(events.index) == 0:
+        return signals
+    rows, cols, found = event_study.locate(panel, events)
+    signals[rows[found], cols[found]] = True
+    return signals
+
+
+def strategy_signals(panel, strategy, dates=None):
+    """
+    在面板上逐日计算策略的选股结果作为信号
+
+    Args:
+        panel: market_panel，需含策略所需字段及其回看窗口
+        strategy: tablestructure.TABLE_CN_STOCK_STRATEGIES 中的策略字典
+        dates: 计算的交易日，默认面板的全部交易日
+
+    Returns:
+        (代码数, 交易日数) 布尔数组
+    """
+    from instock.core.strategy import strategy_panel as stp
+    if dates is None:
+        dates = panel.dates
+    signals = np.zeros(panel.shape, dtype=bool)
+    selected, _ = stp.run_fused(panel, list(dates), [strategy])
+    for date, masks in selected.items():
+        t = panel.date_loc(date)
+        if t >= 0 and strategy['name'] in masks:
+            signals[:, t] = masks[strategy['name']]
+    return signals
+
+
+def _fee(amount, rate, minimum):
+    return max(amount * rate, minimum) if amount > 0 else 0.0
+
+
+def simulate(panel, signals, scores=None, date_start=None, date_end=None, hold_days=HOLD_DAYS,
+             max_positions=MAX_POSITIONS, stop_loss=None, take_profit=None, initial_cash=INITIAL_CASH,
+             commission=COMMISSION, min_commission=MIN_COMMISSION, stamp_duty=STAMP_DUTY, slippage=SLIPPAGE):
+    """
+    逐日模拟组合交易
+
+    Args:
+        panel: market_panel，需含open、close字段，preclose可选(缺少时用前一根K线收盘价)
+        signals: (代码数, 交易日数) 布尔数组，信号日收盘后确认
+        scores: 可选，与signals同形的数组，同一天候选股票超过可用仓位时按分值从高到低买入，默认按面板行顺序
+        date_start/date_end: 回测区间，默认面板全部交易日
+        hold_days: 持有K线根数(含买入当日)，到期后下一交易日开盘卖出
+        stop_loss/take_profit: 收盘收益率(小数)不高于-stop_loss或不低于take_profit时，下一交易日开盘卖出，None不启用
+        其余为资金和费用参数，含义见模块常量
+
+    Returns:
+        (equity, trades)：equity为每日资金曲线，列为 EQUITY_COLUMNS；
+        trades为交易明细，列为 TRADE_COLUMNS，回测结束时仍持有的股票按最后收盘价计算，reason为open
+    """
+    opens = panel.fields['open']
+    close = panel.fields['close']
+    preclose = panel.fields.get('preclose')
+    valid = panel.valid
+    valid_count = panel.valid_count
+    compact_index = panel.compact_index
+    dates = panel.dates
+    t_start = 0 if date_start is None else int(np.searchsorted(dates, to_datetime64(date_start), side='left'))
+    t_end = panel.date_loc(date_end)
+    rates_old = limit_rates(panel.codes, CHINEXT_REFORM - 1)
+    rates_new = limit_rates(panel.codes, CHINEXT_REFORM)
+
+    def previous_close(r, t):
+        if preclose is not None and not np.isnan(preclose[r, t]):
+            return preclose[r, t]
+        k = valid_count[r, t] - 2
+        return close[r, compact_index[r, k]] if k >= 0 else np.nan
+
+    def limit_price(r, t, direction):
+        pre = previous_close(r, t)
+        if np.isnan(pre):
+            return np.nan
+        rate = (rates_new if dates[t] >= CHINEXT_REFORM else rates_old)[r]
+        return round(pre * (1 + direction * rate) + 1e-9, 2)
+
+    cash = float(initial_cash)
+    equity_prev = cash
+    positions = {}  # 行 -> 持仓
+    trades = []
+    curve = []
+    for t in range(t_start, t_end + 1):
+        traded = 0.0
+        # 停牌或缺少开盘价时不能成交
+        tradable = valid[:, t] & ~np.isnan(opens[:, t])
+        # 卖出：上一交易日收盘后满足卖出条件的持仓，开盘卖出
+        for r in list(positions):
+            p = positions[r]
+            ret = p['last'] / p['cost'] - 1
+            if p['bars'] >= hold_days:
+                reason = 'hold'
+            elif stop_loss is not None and ret <= -stop_loss:
+                reason = 'stop_loss'
+            elif take_profit is not None and ret >= take_profit:
+                reason = 'take_profit'
+            else:
+                continue
+            if not tradable[r] or opens[r, t] <= limit_price(r, t, -1) + 0.005:
+                continue
+            price = opens[r, t] * (1 - slippage)
+            amount = price * p['shares']
+            fee = _fee(amount, commission, min_commission) + amount * stamp_duty
+            cash += amount - fee
+            traded += amount
+            trades.append((panel.codes[r], panel.names[r], p['date'], p['price'], dates[t], price, p['shares'],
+                           p['bars'], p['fee'] + fee, amount - fee - p['amount'], (amount - fee) / p['amount'] - 1,
+                           reason))
+            del positions[r]
+
+        # 买入：上一交易日的信号，开盘买入
+        slots = max_positions - len(positions)
+        if slots > 0 and t > 0:
+            candidates = np.flatnonzero(signals[:, t - 1] & tradable)
+            if scores is not None and len(candidates) > slots:
+                candidates = candidates[np.argsort(-scores[candidates, t - 1], kind='stable')]
+            budget = equity_prev / max_positions
+            for r in candidates:
+                if slots == 0:
+                    break
+                if r in positions or opens[r, t] >= limit_price(r, t, 1) - 0.005:
+                    continue
+                price = opens[r, t] * (1 + slippage)
+                shares = math.floor(min(budget, cash) / (price * (1 + commission)) / LOT) * LOT
+                if shares <= 0:
+                    continue
+                amount = price * shares
+                fee = _fee(amount, commission, min_commission)
+                if amount + fee > cash:
+                    continue
+                cash -= amount + fee
+                traded += amount
+                positions[r] = {'date': dates[t], 'price': price, 'shares': shares, 'amount': amount + fee,
+                                'cost': (amount + fee) / shares, 'fee': fee, 'last': close[r, t], 'bars': 0}
+                slots -= 1
+
+        # 收盘估值，停牌的持仓按最后收盘价计算
+        market_value = 0.0
+        for r, p in positions.items():
+            if valid[r, t]:
+                p['last'] = close[r, t]
+                p['bars'] += 1
+            market_value += p['last'] * p['shares']
+        equity_prev = cash + market_value
+        curve.append((dates[t], cash, market_value, equity_prev, len(positions), traded))
+
+    for r, p in positions.items():
+        amount = p['last'] * p['shares']
+        trades.append((panel.codes[r], panel.names[r], p['date'], p['price'], None, p['last'], p['shares'],
+                       p['bars'], p['fee'], amount - p['amount'], amount / p['amount'] - 1, 'open'))
+    return pd.DataFrame(curve, columns=EQUITY_COLUMNS), pd.DataFrame(trades, columns=TRADE_COLUMNS)
+
+
+def summarize(equity, trades, initial_cash=INITIAL_CASH):
+    """
+    回测指标
+
+    Returns:
+        dict：total_return 总收益率、annual_return 年化收益率、max_drawdown 最大回撤(负数)、
+        sharpe 年化夏普比率(无风险利率按0)、turnover 年化换手率(买卖金额均值/平均总资产)、
+        trades 已平仓笔数、win_rate 胜率、avg_return 每笔平均收益率
+    """
+    stats = {'total_return': 0.0, 'annual_return': 0.0, 'max_drawdown': 0.0, 'sharpe': 0.0, 'turnover': 0.0,
+             'trades': 0, 'win_rate': np.nan, 'avg_return': np.nan}
+    if equity is None or len(equity.index) == 0:
+        return stats
+    values = equity['equity'].values
+    years = len(values) / TRADING_DAYS
+    total = values[-1] / initial_cash - 1
+    stats['total_return'] = float(total)
+    stats['annual_return'] = float((1 + total) ** (1 / years) - 1) if total > -1 else -1.0
+    stats['max_drawdown'] = float((values / np.maximum.accumulate(values) - 1).min())
+    daily = np.diff(values, prepend=initial_cash) / np.concatenate(([initial_cash], values[:-1]))
+    std = daily.std(ddof=1) if len(daily) > 1 else 0.0
+    stats['sharpe'] = float(daily.mean() / std * math.sqrt(TRADING_DAYS)) if std > 0 else 0.0
+    stats['turnover'] = float(equity['turnover'].sum() / 2 / values.mean() / years)
+    closed = trades[trades['reason'] != 'open'] if trades is not None else None
+    if closed is not None and len(closed.index) > 0:
+        stats['trades'] = len(closed.index)
+        stats['win_rate'] = float((closed['pnl'] > 0).mean())
+        stats['avg_return'] = float(closed['ret'].mean())
+    return stats
+
+
+def backtest(panel, signals, **kwargs):
+    """模拟交易并汇总指标，参数见 simulate，返回 (equity, trades, stats)"""
+    equity, trades = simulate(panel, signals, **kwargs)
+    return equity, trades, summarize(equity, trades, kwargs.get('initial_cash', INITIAL_CASH))
+
+
+def run(events, date_start=None, date_end=None, **kwargs):
+    """
+    读取回测区间的行情面板，以选股记录为信号做组合回测
+
+    Args:
+        events: DataFrame，含date、code列，如 event_study.table_events(tbs.TABLE_CN_STOCK_STRATEGIES[0])
+        date_start/date_end: 回测区间，默认从最早的信号日期到最新交易日
+        kwargs: 其余参数见 simulate
+
+    Returns:
+        (equity, trades, stats)，没有数据时返回None
+    """
+    try:
+        if events is None or len(events.index) == 0:
+            return None
+        if date_start is None:
+            date_start = pd.to_datetime(events['date']).min()
+        date_start = str(to_datetime64(date_start)).replace('-', '')
+        panel = stf.get_stock_hist_panel(date_start, date_end, fields=BACKTEST_FIELDS)
+        if panel is None:
+            return None
+        return backtest(panel, signal_matrix(panel, events), date_end=date_end, **kwargs)
+    except Exception as e:
+        logger.error(f"portfolio.run处理异常：{e}")
+    return None
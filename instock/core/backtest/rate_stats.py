@@ -7,8 +7,12 @@ from instock.lib.simple_logger import get_logger
 # 获取logger
 logger = get_logger(__name__)
 
+import threading
 import numpy as np
 import pandas as pd
+import instock.core.stockfetch as stf
+import instock.core.panel_server as psv
+import instock.lib.trade_time as trd
 
 __author__ = 'myh '
 __date__ = '2023/3/10 '
@@ -53,3 +57,93 @@ def get_rates(code_name, data, stock_column, threshold=101):
         logger.error(f"rate_stats.get_rates处理异常：{code}代码{e}")
 
     return pd.Series(stock_data_list, index=stock_column)
+
+
+def get_rates_panel(panel, signals, threshold=101):
+    """
+    按历史面板一次算出全部信号的收益率，口径与 get_rates 逐行一致：
+    以信号当日(停牌则为其后第一根有效K线)收盘价为基准，之后第1..threshold-1根有效K线的收盘涨跌幅(%)
+
+    Args:
+        panel: market_panel，需含close字段
+        signals: DataFrame，含date、code列
+        threshold: 基准K线加收益K线的根数
+
+    Returns:
+        (found, rates)：found为可计算(股票在面板中且基准之后至少还有1根K线)的信号掩码；
+        rates为 (信号数, threshold-1) 数组，不可计算的信号及尚未走完的K线为NaN
+    """
+    m = len(signals.index)
+    rates = np.full((m, threshold - 1), np.nan)
+    if m == 0 or len(panel.dates) == 0:
+        return np.zeros(m, dtype=bool), rates
+    rows = np.array([panel.code_index.get(c, -1) for c in signals['code'].values], dtype=np.int64)
+    dates = pd.to_datetime(signals['date']).values.astype('datetime64[D]')
+    # 信号日及之后的第一个交易日，其前面的有效K线数即基准K线的序号
+    t0 = np.searchsorted(panel.dates, dates, side='left')
+    r = np.where(rows >= 0, rows, 0)
+    valid_count = panel.valid_count
+    k0 = np.where(t0 > 0, valid_count[r, np.maximum(t0 - 1, 0)], 0)
+    available = valid_count[r, -1]
+    found = (rows >= 0) & (available - k0 >= 2)
+    k = k0[:, None] + np.arange(threshold)[None, :]
+    ok = found[:, None] & (k < available[:, None])
+    cols = panel.compact_index[r[:, None], np.where(ok, k, 0)]
+    close = panel.fields['close'][r[:, None], cols]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = np.around(100 * (close[:, 1:] - close[:, :1]) / close[:, :1], decimals=2)
+    rates[ok[:, 1:]] = values[ok[:, 1:]]
+    return found, rates
+
+
+# 信号表只保存 (date, code, name)，N日收益率在读取时按交易日偏移从收盘价面板计算，不再逐日回写。
+#   面板优先取行情数据服务的共享内存面板，服务未启动时读取一次收盘价面板缓存在进程内，交易日变化或需要更早的日期时重新读取。
+_rate_cache = {'run_date': None, 'date_start': None, 'panel': None}
+_rate_lock = threading.Lock()
+
+
+def get_rate_panel(date_start):
+    """
+    覆盖date_start至今的收盘价面板
+
+    Args:
+        date_start: 最早的信号日期(YYYY-MM-DD)
+
+    Returns:
+        market_panel，没有数据时返回None
+    """
+    date_start = str(date_start)[0:10]
+    panel = psv.get_panel()
+    if panel is not None and len(panel.dates) > 0 and str(panel.dates[0]) <= date_start:
+        return panel
+    run_date, _ = trd.get_trade_date_last()
+    with _rate_lock:
+        cached = _rate_cache['panel']
+        if cached is None or _rate_cache['run_date'] != run_date or date_start < _rate_cache['date_start']:
+            cached = stf.get_stock_hist_panel(date_start.replace('-', ''), fields=('close',))
+            _rate_cache.update(run_date=run_date, date_start=date_start, panel=cached)
+        return cached
+
+
+def attach_rates(data, columns):
+    """
+    给信号补上N日收益率列，口径同 get_rates_panel
+
+    Args:
+        data: DataFrame，含date、code列
+        columns: 收益率列名，依次为1..N日
+
+    Returns:
+        DataFrame，columns列为计算结果(不可计算时为NaN)，data中已有的同名列被覆盖
+    """
+    rates = np.full((len(data.index), len(columns)), np.nan)
+    try:
+        if len(data.index) > 0:
+            date_start = pd.to_datetime(data['date']).min().strftime("%Y-%m-%d")
+            panel = get_rate_panel(date_start)
+            if panel is not None:
+                _, rates = get_rates_panel(panel, data, len(columns) + 1)
+    except Exception as e:
+        logger.error(f"rate_stats.attach_rates处理异常：{e}")
+    data = data.drop(columns=[c for c in columns if c in data.columns])
+    return pd.concat([data, pd.DataFrame(rates, columns=list(columns), index=data.index)], axis=1)
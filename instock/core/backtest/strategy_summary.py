@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+from instock.lib.simple_logger import get_logger
+
+# 获取logger
+logger = get_logger(__name__)
+
+import numpy as np
+import pandas as pd
+import instock.core.tablestructure as tbs
+import instock.lib.database as mdb
+from instock.lib.database_factory import execute_sql, execute_sql_fetch, insert_db_from_df
+from instock.core.backtest import event_study
+from instock.core.backtest import rate_stats
+
+__author__ = 'myh '
+__date__ = '2026/10/16 '
+
+# 策略表现月度汇总(cn_stock_strategy_summary)：按信号所在月份汇总各策略的信号数、N日胜率、平均/中位收益率和最大不利偏移。
+#   增量维护：每个策略只重算最后一个已完整月份之后的信号；月末之后已有最长持有期根数的交易日时，该月标记为已完整，
+#   其信号的收益率都已走完，之后不再读取。首次运行时读取策略表的全部信号。
+
+HORIZONS = tbs.SUMMARY_HORIZONS
+
+
+def summarize_months(events, rates, dates):
+    """
+    按月汇总信号表现
+
+    Args:
+        events: DataFrame，含date列，与rates逐行对应
+        rates: rate_stats.get_rates_panel 的收益率数组(%)，列数不少于max(HORIZONS)
+        dates: 收益率面板的交易日，用于判断月份是否已完整
+
+    Returns:
+        DataFrame，列为 TABLE_CN_STOCK_STRATEGY_SUMMARY 中除 strategy、cn 外的列，每月一行
+    """
+    horizon = max(HORIZONS)
+    month = pd.to_datetime(events['date']).values.astype('datetime64[M]')
+    data = {'date': month}
+    for h in HORIZONS:
+        r = rates[:, h - 1]
+        data[f'win_{h}'] = np.where(np.isnan(r), np.nan, r > 0)
+        data[f'ret_{h}'] = r
+    # 最大不利偏移：持有期内最低的收益率，没有一根收益K线时为NaN
+    lowest = np.where(np.isnan(rates[:, :horizon]), np.inf, rates[:, :horizon]).min(axis=1)
+    data['mae'] = np.where(np.isinf(lowest), np.nan, np.minimum(lowest, 0))
+    grouped = pd.DataFrame(data).groupby('date', sort=True)
+    result = pd.DataFrame({'signals': grouped.size()})
+    for h in HORIZONS:
+        result[f'win_rate_{h}'] = grouped[f'win_{h}'].mean()
+        result[f'avg_return_{h}'] = grouped[f'ret_{h}'].mean()
+        result[f'median_return_{h}'] = grouped[f'ret_{h}'].median()
+    result['mae'] = grouped['mae'].mean()
+    # 月末之后至少还有horizon个交易日时，当月信号的收益率都已走完(停牌股票除外)
+    month_end = (result.index.values.astype('datetime64[M]') + 1).astype('datetime64[D]')
+    after = len(dates) - np.searchsorted(dates, month_end, side='left')
+    result['complete'] = (after >= horizon).astype(int)
+    result = result.reset_index()
+    result['date'] = result['date'].values.astype('datetime64[D]')
+    return result
+
+
+def last_complete_month(strategy):
+    """汇总表中该策略最后一个已完整的月份，没有时为None"""
+    table_name = tbs.TABLE_CN_STOCK_STRATEGY_SUMMARY['name']
+    if not mdb.checkTableIsExist(table_name):
+        return None
+    rows = execute_sql_fetch(f"SELECT MAX(`date`) AS `date` FROM `{table_name}` "
+                             f"WHERE `strategy` = '{strategy['name']}' AND `complete` = 1")
+    if not rows or rows[0].get('date') is None:
+        return None
+    return np.datetime64(pd.Timestamp(rows[0]['date']).date(), 'M')
+
+
+def update(strategies=None):
+    """
+    增量更新策略表现汇总
+
+    Args:
+        strategies: 策略字典列表，默认 tbs.TABLE_CN_STOCK_STRATEGIES
+    """
+    if strategies is None:
+        strategies = tbs.TABLE_CN_STOCK_STRATEGIES
+    pending = []
+    for strategy in strategies:
+        try:
+            if not mdb.checkTableIsExist(strategy['name']):
+                continue
+            last = last_complete_month(strategy)
+            date_start = None if last is None else (last + 1).astype('datetime64[D]')
+            events = event_study.table_events(strategy, date_start)
+            if events is not None:
+                pending.append((strategy, date_start, events))
+        except Exception as e:
+            logger.error(f"strategy_summary.update处理异常：{strategy['name']}策略{e}")
+    if not pending:
+        return
+    # 全部策略共用一个收盘价面板
+    first = min(pd.to_datetime(events['date']).min() for _, _, events in pending)
+    panel = rate_stats.get_rate_panel(first.strftime("%Y-%m-%d"))
+    if panel is None:
+        return
+    for strategy, date_start, events in pending:
+        try:
+            _, rates = rate_stats.get_rates_panel(panel, events, max(HORIZONS) + 1)
+            data = summarize_months(events, rates, panel.dates)
+            data.insert(1, 'strategy', strategy['name'])
+            data.insert(2, 'cn', strategy['cn'])
+            save(strategy, data, date_start)
+        except Exception as e:
+            logger.error(f"strategy_summary.update处理异常：{strategy['name']}策略{e}")
+
+
+def save(strategy, data, date_start):
+    """替换该策略date_start(含)之后的汇总行，date_start为None时替换全部"""
+    table = tbs.TABLE_CN_STOCK_STRATEGY_SUMMARY
+    table_name = table['name']
+    if mdb.checkTableIsExist(table_name):
+        where = f"`strategy` = '{strategy['name']}'"
+        if date_start is not None:
+            where += f" AND `date` >= '{date_start}'"
+        execute_sql(f"DELETE FROM `{table_name}` WHERE {where}")
+        cols_type = None
+    else:
+        cols_type = tbs.get_field_types(table['columns'])
+    insert_db_from_df(data[list(table['columns'])], table_name, cols_type, False, "`date`,`strategy`")
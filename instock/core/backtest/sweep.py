@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+from instock.lib.simple_logger import get_logger
+
+# 获取logger
+logger = get_logger(__name__)
+
+import itertools
+import json
+import os.path
+import random
+import numpy as np
+import pandas as pd
+import instock.core.panel_executor as pex
+from instock.core.market_panel import to_datetime64
+from instock.core.backtest import portfolio
+
+__author__ = 'myh '
+__date__ = '2026/10/16 '
+
+# 策略参数寻优：在多年的历史行情面板上对策略阈值做网格、随机或进化搜索，逐个参数点做组合回测并按指标排名。
+#   信号：面板按股票行分块并发(panel_executor.map_rows)，每块逐日只建一个 strategy_context，
+#         当日全部参数点共用其中缓存的窗口、均线、滚动最高价等中间结果；只返回信号的位置，不为每个参数点保留整个信号矩阵。
+#   回测：各参数点的组合回测(portfolio.backtest)互相独立，按参数点并发(panel_executor.map_tasks)。
+#   搜索空间：内置策略见 SWEEP_SPACES，键为策略面板实现的关键字参数；
+#         声明式条件模板见 config/strategy_sweeps.json，表达式中的 {参数} 按取值替换后编译，
+#         如 [{"name": ..., "cn": ..., "expr": "close >= rolling_max(close, {n})", "space": {"n": [20, 60]}}]。
+#   高而窄的旗形依赖逐日龙虎榜，历史区间内无法取得，不参与寻优。
+#   参数点越多越容易拟合到历史噪声上，排名靠前的参数宜在样本外区间复核。
+
+SWEEP_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'config',
+                          'strategy_sweeps.json')
+SWEEP_METHODS = ('grid', 'random', 'evolve')
+SWEEP_METRIC = 'sharpe'
+SWEEP_POINTS = 16  # 随机搜索的参数点数，进化搜索的种群大小
+SWEEP_GENERATIONS = 4  # 进化搜索的代数
+STATS_COLUMNS = ('total_return', 'annual_return', 'max_drawdown', 'sharpe', 'turnover', 'trades', 'win_rate',
+                 'avg_return')
+
+# 内置策略的搜索空间：策略表名 -> 参数 -> 候选值(升序，进化搜索在相邻取值间变异)，包含策略的默认值
+SWEEP_SPACES = {
+    'cn_stock_strategy_enter': {'amount': (1e8, 2e8, 5e8), 'vol_ratio': (1.5, 2, 3), 'p_change': (2, 3, 5)},
+    'cn_stock_strategy_keep_increasing': {'threshold': (20, 30, 60), 'increase': (1.1, 1.2, 1.3)},
+    'cn_stock_strategy_parking_apron': {'threshold': (10, 15, 20), 'limit_up': (7, 9.5)},
+    'cn_stock_strategy_backtrace_ma250': {'vol_ratio': (1.5, 2, 3), 'back_ratio': (0.7, 0.8, 0.9)},
+    'cn_stock_strategy_breakthrough_platform': {'amount': (1e8, 2e8, 5e8), 'vol_ratio': (1.5, 2, 3)},
+    'cn_stock_strategy_low_backtrace_increase': {'threshold': (40, 60, 90), 'increase': (0.4, 0.6, 0.8)},
+    'cn_stock_strategy_turtle_trade': {'threshold': (20, 40, 60, 120)},
+    'cn_stock_strategy_climax_limitdown': {'amount': (1e8, 2e8, 5e8), 'vol_ratio': (2, 3, 4, 6),
+                                           'limit_down': (-9.5, -7, -5)},
+    'cn_stock_strategy_low_atr': {'max_atr': (5, 10, 15), 'min_ratio': (1.05, 1.1, 1.2)},
+}
+
+
+def builtin_specs(names=None):
+    """
+    内置策略的寻优定义
+
+    Args:
+        names: 策略表名列表，默认 SWEEP_SPACES 中的全部策略
+
+    Returns:
+        寻优定义列表：dict name、cn、space、lookback
+    """
+    import instock.core.tablestructure as tbs
+    specs = []
+    for strategy in tbs.TABLE_CN_STOCK_STRATEGIES:
+        name = strategy['name']
+        if name not in SWEEP_SPACES or (names is not None and name not in names):
+            continue
+        specs.append({'name': name, 'cn': strategy['cn'], 'space': SWEEP_SPACES[name],
+                      'lookback': strategy['lookback']})
+    return specs
+
+
+def load_templates(path=SWEEP_FILE):
+    """
+    读取声明式条件模板，定义有误的模板记录日志后跳过
+
+    Returns:
+        寻优定义列表：dict name、cn、space、expr、lookback(全部参数点所需K线根数的最大值)、fields
+    """
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            specs = json.load(f)
+    except Exception as e:
+        logger.error(f"sweep.load_templates处理异常：{path}{e}")
+        return []
+    from instock.core.strategy.strategy_screen import screen
+    templates = []
+    for spec in specs:
+        if not spec.get('enabled', True):
+            continue
+        try:
+            space = {k: tuple(v) for k, v in spec['space'].items()}
+            screens = [screen(spec['expr'].format(**p)) for p in grid_points(space)]
+            templates.append({'name': spec['name'], 'cn': spec.get('cn', spec['name']), 'space': space,
+                              'expr': spec['expr'], 'lookback': max(s.lookback for s in screens),
+                              'fields': tuple(set().union(*[s.fields for s in screens]))})
+        except Exception as e:
+            logger.error(f"sweep.load_templates处理异常：{spec}{e}")
+    return templates
+
+
+def grid_points(space):
+    """全部参数组合"""
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*[space[k] for k in keys])]
+
+
+def random_points(space, count, rng, exclude=()):
+    """
+    不重复地随机抽取参数组合
+
+    Args:
+        count: 抽取个数，不超过组合总数
+        rng: random.Random
+        exclude: 已评估过的参数键(point_key)，不再抽取
+    """
+    points = [p for p in grid_points(space) if point_key(p) not in exclude]
+    return rng.sample(points, min(count, len(points)))
+
+
+def mutate(point, space, rng):
+    """随机选一个参数移到相邻的候选值"""
+    point = dict(point)
+    keys = [k for k in space if len(space[k]) > 1]
+    if not keys:
+        return point
+    key = rng.choice(keys)
+    values = list(space[key])
+    i = values.index(point[key])
+    step = rng.choice((-1, 1))
+    if not 0 <= i + step < len(values):
+        step = -step
+    point[key] = values[i + step]
+    return point
+
+
+def point_key(point):
+    return json.dumps(point, sort_keys=True)
+
+
+def _evaluators(spec, points):
+    # 每个参数点一个 ctx -> 按行掩码 的函数；模板的各参数点取相同的窗口宽度，共用 ctx 中缓存的滚动函数结果
+    from instock.core.strategy import strategy_panel as stp
+    if spec.get('expr') is None:
+        import instock.core.tablestructure as tbs
+        strategy = next(s for s in tbs.TABLE_CN_STOCK_STRATEGIES if s['name'] == spec['name'])
+        return [lambda ctx, p=p: stp.run_panel(strategy, ctx, params=p) for p in points]
+    from instock.core.strategy.strategy_screen import screen
+    screens = [screen(spec['expr'].format(**p)) for p in points]
+    return [lambda ctx, s=s: s.check_panel(ctx, spec['lookback']) for s in screens]
+
+
+def signal_rows(panel, dates, spec, points):
+    """
+    对一块股票逐日计算全部参数点的信号，供 evaluate 按行分块调用(可在子进程中执行)
+
+    Args:
+        panel: market_panel(或其按行截取的一块)
+        dates: 交易日列表
+        spec: 寻优定义，见 builtin_specs/load_templates
+        points: 参数点列表
+
+    Returns:
+        (块的行数, [各参数点信号的 (行号数组, 交易日列号数组)])
+    """
+    from instock.core.strategy import strategy_panel as stp
+    evaluators = _evaluators(spec, points)
+    hits = [([], []) for _ in points]
+    failed = set()
+    for date in dates:
+        t = panel.date_loc(date)
+        if t < 0:
+            continue
+        ctx = stp.strategy_context(panel, date, length=spec['lookback'])
+        for i, evaluate in enumerate(evaluators):
+            if i in failed:
+                continue
+            try:
+                rows = np.flatnonzero(evaluate(ctx))
+            except Exception as e:
+                logger.error(f"sweep.signal_rows处理异常：{spec['name']}策略{points[i]}参数{e}")
+                failed.add(i)
+                continue
+            hits[i][0].append(rows)
+            hits[i][1].append(np.full(len(rows), t, dtype=np.int64))
+    result = []
+    for rows, cols in hits:
+        if rows:
+            result.append((np.concatenate(rows), np.concatenate(cols)))
+        else:
+            result.append((np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)))
+    return len(panel), result
+
+
+def backtest_point(panel, task, kwargs):
+    """回测一个参数点，task 为信号的 (行号数组, 列号数组)，返回回测指标，另加 signals 信号数"""
+    rows, cols = task
+    signals = np.zeros(panel.shape, dtype=bool)
+    signals[rows, cols] = True
+    _, _, stats = portfolio.backtest(panel, signals, **kwargs)
+    stats['signals'] = len(rows)
+    return stats
+
+
+def evaluate(panel, spec, points, date_start=None, date_end=None, **kwargs):
+    """
+    计算一批参数点的信号并逐个回测
+
+    Args:
+        panel: market_panel，需含策略所需字段、回看窗口及 portfolio.BACKTEST_FIELDS
+        spec: 寻优定义
+        points: 参数点列表
+        date_start/date_end: 信号和回测的区间，默认面板全部交易日
+        kwargs: 其余回测参数，见 portfolio.simulate
+
+    Returns:
+        DataFrame，列为 params、signals 及 STATS_COLUMNS，与points顺序一致
+    """
+    dates = panel.dates
+    if date_start is not None:
+        dates = dates[dates >= to_datetime64(date_start)]
+    if date_end is not None:
+        dates = dates[dates <= to_datetime64(date_end)]
+    executor = pex.get_executor(panel)
+    parts = executor.map_rows(signal_rows, args=(list(dates), spec, points))
+    tasks = []
+    for i in range(len(points)):
+        rows, cols, offset = [], [], 0
+        for size, hits in parts:
+            rows.append(hits[i][0] + offset)
+            cols.append(hits[i][1])
+            offset += size
+        tasks.append((np.concatenate(rows), np.concatenate(cols)))
+    kwargs = dict(kwargs, date_start=date_start, date_end=date_end)
+    results = executor.map_tasks(backtest_point, tasks, args=(kwargs,))
+    data = []
+    for point, stats in zip(points, results):
+        if stats is None:
+            stats = {c: np.nan for c in STATS_COLUMNS}
+        data.append(dict(stats, params=point_key(point)))
+    return pd.DataFrame(data, columns=('params', 'signals') + STATS_COLUMNS)
+
+
+def rank(data, metric=SWEEP_METRIC):
+    """按指标从高到低排名，指标为NaN的排在最后，最大回撤越接近0越好"""
+    data = data.sort_values(metric, ascending=False, na_position='last', kind='stable').reset_index(drop=True)
+    data.insert(0, 'rank', np.arange(1, len(data.index) + 1))
+    return data
+
+
+def search(panel, spec, method='grid', count=SWEEP_POINTS, generations=SWEEP_GENERATIONS, metric=SWEEP_METRIC,
+           seed=None, date_start=None, date_end=None, **kwargs):
+    """
+    在一个策略的搜索空间上寻优
+
+    Args:
+        panel: market_panel
+        spec: 寻优定义
+        method: grid 全部组合；random 随机抽取count个组合；
+                evolve 随机抽取count个组合为初始种群，之后每代由指标排名前一半的参数点各变异出一个新参数点，共generations代
+        metric: 排名指标，STATS_COLUMNS 之一
+        seed: 随机数种子
+        其余参数见 evaluate
+
+    Returns:
+        按metric排名的DataFrame，列为 rank、params、signals 及 STATS_COLUMNS
+    """
+    if method not in SWEEP_METHODS:
+        raise ValueError(f"未知的寻优方式：{method}")
+    space = spec['space']
+    rng = random.Random(seed)
+    if method == 'grid':
+        points = grid_points(space)
+    else:
+        points = random_points(space, count, rng)
+    data = evaluate(panel, spec, points, date_start, date_end, **kwargs)
+    if method == 'evolve':
+        for _ in range(generations):
+            seen = set(data['params'])
+            parents = rank(data, metric)['params'].head(max(1, count // 2))
+            children = {}
+            for parent in parents:
+                child = mutate(json.loads(parent), space, rng)
+                if point_key(child) not in seen:
+                    children[point_key(child)] = child
+            if not children:
+                # 前一半的邻域已全部评估过，补充随机参数点
+                children = {point_key(p): p for p in random_points(space, max(1, count // 2), rng, seen)}
+            if not children:
+                break
+            data = pd.concat([data, evaluate(panel, spec, list(children.values()), date_start, date_end, **kwargs)],
+                             ignore_index=True)
+    return rank(data, metric)
+
+
+def run(panel, specs=None, method='grid', date_start=None, date_end=None, **kwargs):
+    """
+    依次对多个策略寻优
+
+    Args:
+        panel: market_panel
+        specs: 寻优定义列表，默认全部内置策略及启用的模板
+        其余参数见 search
+
+    Returns:
+        DataFrame，列为 strategy、cn 及 search 的结果列，各策略分别排名
+    """
+    if specs is None:
+        specs = builtin_specs() + load_templates()
+    frames = []
+    for spec in specs:
+        try:
+            data = search(panel, spec, method, date_start=date_start, date_end=date_end, **kwargs)
+            data.insert(0, 'cn', spec['cn'])
+            data.insert(0, 'strategy', spec['name'])
+            frames.append(data)
+            if len(data.index) > 0:
+                best = data.iloc[0]
+                logger.info(f"策略{spec['cn']}寻优{len(data.index)}个参数点，最优参数{best['params']}："
+                            f"{', '.join(f'{c}={best[c]}' for c in STATS_COLUMNS)}")
+        except Exception as e:
+            logger.error(f"sweep.run处理异常：{spec['name']}策略{e}")
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True)
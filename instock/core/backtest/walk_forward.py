@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+from instock.lib.simple_logger import get_logger
+
+# 获取logger
+logger = get_logger(__name__)
+
+import datetime
+import gc
+import time
+import numpy as np
+import pandas as pd
+import instock.core.stockfetch as stf
+import instock.core.panel_executor as pex
+import instock.lib.trade_time as trd
+from instock.core.market_panel import to_datetime64
+from instock.core.singleton_stock import lookback_days
+from instock.core.backtest import portfolio
+from instock.core.backtest import rate_stats
+from instock.lib.progress_tracker import update as progress_update
+
+__author__ = 'myh '
+__date__ = '2026/10/16 '
+
+# 分段滚动回测：全部历史一次读入内存放不下，按日期顺序分段(默认每段1个自然年)从ClickHouse(或本地列式缓存)读取行情面板，
+#   逐段计算策略信号、信号的N日收益率和组合回测，再合并各段的统计量，内存只与段长有关，与历史总长度无关。
+#   每段面板向前多读策略所需的K线根数作为预热，向后多读 max(horizons) 根K线(含停牌余量)用于计算段末信号的收益率；
+#   信号只取段内的交易日，各段之间不重复计数。
+#   组合回测：各段依次模拟，前一段的期末总资产作为后一段的初始资金；段末仍持有的股票按段末收盘价计值后视为清仓，
+#   下一段从空仓开始，与连续回测相比少了段末持仓的后续收益和一次卖出费用。
+#   高而窄的旗形依赖逐日龙虎榜，历史区间内无法取得，不参与回测。
+# 进度通过 progress_tracker 报送，任务名为 PROGRESS_TASK。
+
+CHUNK_YEARS = 1
+HORIZONS = (1, 5, 10, 20, 60)
+MEMORY_LIMIT = 2 * 1024 ** 3  # 单段面板的内存上限(字节)，超过时提示减小分段
+PROGRESS_TASK = 'walk_forward'
+BASE_FIELDS = ('open', 'high', 'low', 'close', 'preclose', 'volume', 'p_change')
+
+
+def chunk_ranges(date_start, date_end, years=CHUNK_YEARS):
+    """
+    按自然年切分回测区间
+
+    Returns:
+        [(段开始日期, 段结束日期)]，首段从date_start开始，末段到date_end结束
+    """
+    date_start = pd.Timestamp(date_start).date()
+    date_end = pd.Timestamp(date_end).date()
+    ranges = []
+    start = date_start
+    while start <= date_end:
+        end = min(datetime.date(start.year + years - 1, 12, 31), date_end)
+        ranges.append((start, end))
+        start = end + datetime.timedelta(days=1)
+    return ranges
+
+
+def get_strategies(names=None):
+    """参与回测的策略，默认全部有面板实现的策略(不含高而窄的旗形)"""
+    import instock.core.tablestructure as tbs
+    from instock.core.strategy import strategy_panel as stp
+    return [s for s in tbs.TABLE_CN_STOCK_STRATEGIES if s.get('panel_func') is not None and
+            not stp._is_high_tight(s) and (names is None or s['name'] in names)]
+
+
+def load_chunk(start, end, lookback, forward, fields):
+    """读取一段的行情面板：start往前lookback根K线至end往后forward根K线，按 lookback_days 计入停牌余量"""
+    load_start = trd.get_trade_date_before(start, lookback_days(lookback)).strftime("%Y%m%d")
+    load_end = trd.get_trade_date_after(end, lookback_days(forward + 1)).strftime("%Y%m%d")
+    return stf.get_stock_hist_panel(load_start, load_end, fields=fields)
+
+
+def panel_nbytes(panel):
+    """面板各数组占用的内存(字节)"""
+    arrays = list(panel.fields.values()) + [panel.valid, panel.valid_count, panel.compact_index]
+    return sum(a.nbytes for a in arrays if a is not None)
+
+
+def signal_stats(rates, horizons=HORIZONS):
+    """
+    一段信号收益率的可合并统计量
+
+    Args:
+        rates: rate_stats.get_rates_panel 的收益率数组(%)
+    Returns:
+        dict：signals 信号数，以及每个持有期h的 n_h 有收益率的信号数、win_h 上涨数、sum_h 收益率之和
+    """
+    stats = {'signals': len(rates)}
+    for h in horizons:
+        r = rates[:, h - 1]
+        ok = ~np.isnan(r)
+        stats[f'n_{h}'] = int(ok.sum())
+        stats[f'win_{h}'] = int((r[ok] > 0).sum())
+        stats[f'sum_{h}'] = float(r[ok].sum())
+    return stats
+
+
+def merge_stats(total, stats):
+    """按键累加两段的统计量"""
+    for k, v in stats.items():
+        total[k] = total.get(k, 0) + v
+    return total
+
+
+def finalize_stats(total, horizons=HORIZONS):
+    """由累加的统计量算出各持有期的胜率和平均收益率(%)"""
+    result = {'signals': total.get('signals', 0)}
+    for h in horizons:
+        n = total.get(f'n_{h}', 0)
+        result[f'win_rate_{h}'] = total[f'win_{h}'] / n if n > 0 else np.nan
+        result[f'avg_return_{h}'] = total[f'sum_{h}'] / n if n > 0 else np.nan
+    return result
+
+
+def run_chunk(panel, start, end, strategies, horizons, cash, **kwargs):
+    """
+    在一段面板上计算信号、收益率和组合回测
+
+    Args:
+        cash: dict 策略表名 -> 本段的初始资金
+
+    Returns:
+        dict 策略表名 -> (收益率统计量, 资金曲线, 交易明细)
+    """
+    from instock.core.strategy import strategy_panel as stp
+    dates = panel.dates[(panel.dates >= to_datetime64(start)) & (panel.dates <= to_datetime64(end))]
+    result = {}
+    if len(dates) == 0:
+        return result
+    selected, _ = stp.run_fused(panel, list(dates), strategies)
+    cols = np.searchsorted(panel.dates, dates)
+    for strategy in strategies:
+        name = strategy['name']
+        signals = np.zeros(panel.shape, dtype=bool)
+        for date, t in zip(dates, cols):
+            mask = selected.get(date, {}).get(name)
+            if mask is not None:
+                signals[:, t] = mask
+        rows, sig_cols = np.nonzero(signals)
+        events = pd.DataFrame({'date': panel.dates[sig_cols], 'code': panel.codes[rows]})
+        _, rates = rate_stats.get_rates_panel(panel, events, max(horizons) + 1)
+        equity, trades = portfolio.simulate(panel, signals, date_start=start, date_end=end,
+                                            initial_cash=cash[name], **kwargs)
+        result[name] = (signal_stats(rates, horizons), equity, trades)
+    return result
+
+
+def run(date_start, date_end=None, strategies=None, chunk_years=CHUNK_YEARS, horizons=HORIZONS,
+        initial_cash=portfolio.INITIAL_CASH, **kwargs):
+    """
+    分段滚动回测
+
+    Args:
+        date_start/date_end: 回测区间，date_end默认最近交易日
+        strategies: 策略字典列表，默认 get_strategies()
+        chunk_years: 每段的自然年数
+        horizons: 统计信号收益率的持有期(交易日)
+        initial_cash: 组合回测的初始资金
+        kwargs: 其余组合回测参数，见 portfolio.simulate
+
+    Returns:
+        (stats, equity)：stats为每个策略一行的DataFrame，列为 strategy、cn、signals、各持有期的 win_rate_h/avg_return_h
+        及组合回测指标(portfolio.summarize)；equity为 dict 策略表名 -> 全区间资金曲线
+    """
+    if date_end is None:
+        date_end = trd.get_trade_date_last()[0]
+    if strategies is None:
+        strategies = get_strategies()
+    ranges = chunk_ranges(date_start, date_end, chunk_years)
+    lookback = max([s['lookback'] for s in strategies], default=0)
+    fields = set(BASE_FIELDS).union(portfolio.BACKTEST_FIELDS, *[s.get('fields', ()) for s in strategies])
+    totals = {s['name']: {} for s in strategies}
+    cash = {s['name']: initial_cash for s in strategies}
+    equities = {s['name']: [] for s in strategies}
+    trades = {s['name']: [] for s in strategies}
+    progress_update(PROGRESS_TASK, current=0, total=len(ranges), message=f'分段回测{date_start}至{date_end}')
+    for i, (start, end) in enumerate(ranges):
+        begin = time.perf_counter()
+        panel = None
+        try:
+            panel = load_chunk(start, end, lookback, max(horizons), fields)
+            if panel is None:
+                logger.warning(f"walk_forward.run没有{start}至{end}的行情数据")
+                continue
+            nbytes = panel_nbytes(panel)
+            if nbytes > MEMORY_LIMIT:
+                logger.warning(f"walk_forward.run第{i + 1}段面板占用{nbytes / 1024 ** 3:.2f}GB，超过上限，宜减小分段")
+            for name, (stats, equity, trade) in run_chunk(panel, start, end, strategies, horizons, cash,
+                                                          **kwargs).items():
+                merge_stats(totals[name], stats)
+                if len(equity.index) > 0:
+                    cash[name] = float(equity['equity'].iloc[-1])
+                    equities[name].append(equity)
+                if len(trade.index) > 0:
+                    trades[name].append(trade)
+            logger.info(f"walk_forward.run第{i + 1}/{len(ranges)}段{start}至{end}股票数{len(panel)}，"
+                        f"面板{nbytes / 1024 ** 2:.0f}MB，耗时{time.perf_counter() - begin:.1f}秒")
+        except Exception as e:
+            logger.error(f"walk_forward.run处理异常：{start}至{end}{e}")
+        finally:
+            if panel is not None:
+                pex.release_executor(panel)
+            del panel
+            gc.collect()
+            progress_update(PROGRESS_TASK, current=i + 1, total=len(ranges), message=f'已完成{start}至{end}')
+
+    rows = []
+    curves = {}
+    for strategy in strategies:
+        name = strategy['name']
+        curve = pd.concat(equities[name], ignore_index=True) if equities[name] else None
+        trade = pd.concat(trades[name], ignore_index=True) if trades[name] else None
+        stats = finalize_stats(totals[name], horizons)
+        stats.update(portfolio.summarize(curve, trade, initial_cash))
+        rows.append(dict(stats, strategy=name, cn=strategy['cn']))
+        curves[name] = curve
+    progress_update(PROGRESS_TASK, current=len(ranges), total=len(ranges), message='分段回测完成', success=True)
+    data = pd.DataFrame(rows)
+    return data[['strategy', 'cn'] + [c for c in data.columns if c not in ('strategy', 'cn')]], curves
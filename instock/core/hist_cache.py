@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from instock.lib.simple_logger import get_logger
+
+# 获取logger
+logger = get_logger(__name__)
+
+import os
+import datetime
+import tempfile
+import threading
+import numpy as np
+from instock.core.market_panel import to_datetime64
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+    pc = None
+
+__author__ = 'myh '
+__date__ = '2026/10/16 '
+
+# 本地日K线列式缓存：cn_stock_history 按月分区存为Arrow IPC文件(cache/hist/YYYYMM.arrow)，读取时内存映射；
+#   每次使用前按月与ClickHouse核对行数，只补读新增交易日，行数仍不一致的月份整月重读；
+#   ClickHouse不可用时直接使用本地缓存；请求区间内任何一个月的分区缺失或不完整时返回None，由调用方回退到数据库。
+# 环境变量：HIST_CACHE=off 关闭缓存
+
+cache_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache', 'hist')
+if not os.path.exists(cache_path):
+    os.makedirs(cache_path)  # 创建多个文件夹结构。
+
+HIST_COLUMNS = ("code", "date", "open", "high", "low", "close", "preclose", "volume", "amount", "turn", "p_change")
+NUMERIC_COLUMNS = HIST_COLUMNS[2:]
+
+# 同一进程内多个线程同时核对时串行执行，避免重复拉取同一个月
+_sync_lock = threading.Lock()
+
+
+def is_enabled():
+    return pa is not None and os.environ.get('HIST_CACHE', '').lower() != 'off'
+
+
+def _month(date):
+    return to_datetime64(date).astype('datetime64[M]')
+
+
+def _month_range(month):
+    start = month.astype('datetime64[D]')
+    end = (month + 1).astype('datetime64[D]') - 1
+    return str(start), str(end)
+
+
+def _partition_file(month):
+    return os.path.join(cache_path, f"{str(month).replace('-', '')}.arrow")
+
+
+def _schema():
+    fields = [pa.field('code', pa.string()), pa.field('date', pa.date32())]
+    fields.extend(pa.field(c, pa.float64()) for c in NUMERIC_COLUMNS)
+    return pa.schema(fields)
+
+
+def read_partition(month):
+    """内存映射读取一个月的分区，不存在返回None"""
+    file = _partition_file(month)
+    if not os.path.exists(file):
+        return None
+    try:
+        return pa.ipc.open_file(pa.memory_map(file, 'r')).read_all()
+    except Exception as e:
+        logger.error(f"hist_cache.read_partition处理异常：{file}{e}")
+    return None
+
+
+def write_partition(month, table):
+    # 先写临时文件再替换，避免并发读取到写了一半的文件
+    #   临时文件名由mkstemp生成，多进程、多线程同时写同一个月也不会互相覆盖
+    file = _partition_file(month)
+    fd, tmp = tempfile.mkstemp(dir=cache_path, suffix='.tmp')
+    os.close(fd)
+    try:
+        with pa.OSFile(tmp, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, file)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _date_scalar(date):
+    return pa.scalar(to_datetime64(date).astype(datetime.date), type=pa.date32())
+
+
+def _fetch(client, date_start, date_end):
+    # 直接取Arrow列，类型已在SQL中转换，code由字典编码转为普通字符串存储
+    table = client.get_stock_data_arrow(None, date_start, date_end, columns=list(HIST_COLUMNS))
+    if table is None or table.num_rows == 0:
+        return None
+    return table.select(list(HIST_COLUMNS)).cast(_schema())
+
+
+def _db_month_stats(client, date_start):
+    # 每月行数和最后交易日，用于核对缓存
+    sql = ("SELECT toYYYYMM(date) AS month, count() AS cnt, max(date) AS last FROM cn_stock_history "
+           "WHERE date >= %(start_date)s GROUP BY month ORDER BY month")
+    month_start, _ = _month_range(_month(date_start))
+    data = client.query_to_dataframe(sql, {'start_date': month_start})
+    if data is None:
+        return None
+    return {np.datetime64(f"{str(m)[0:4]}-{str(m)[4:6]}", 'M'): (int(c), np.datetime64(last, 'D'))
+            for m, c, last in data[['month', 'cnt', 'last']].values}
+
+
+def sync(date_start):
+    """
+    与ClickHouse核对 date_start 所在月起的所有分区并补齐
+
+    Returns:
+        dict 月份 -> (行数, 最后交易日)，ClickHouse中date_start所在月起各月的统计；
+        ClickHouse不可用或核对中途失败时返回None，缓存可能只补齐了一部分
+    """
+    with _sync_lock:
+        return _sync(date_start)
+
+
+def _sync(date_start):
+    from instock.lib.clickhouse_client import create_clickhouse_client
+    try:
+        with create_clickhouse_client() as client:
+            stats = _db_month_stats(client, date_start)
+            if stats is None:
+                return None
+            for month, (count, last) in stats.items():
+                table = read_partition(month)
+                if table is not None and table.num_rows == count:
+                    continue
+                month_start, month_end = _month_range(month)
+                if table is not None and table.num_rows < count:
+                    # 只补读缓存最后交易日之后的数据
+                    cached_last = np.datetime64(pc.max(table['date']).as_py(), 'D')
+                    if cached_last < last:
+                        new = _fetch(client, str(cached_last + 1), month_end)
+                        if new is not None:
+                            merged = pa.concat_tables([table, new])
+                            if merged.num_rows == count:
+                                write_partition(month, merged)
+                                continue
+                # 缺失或行数不一致(数据被修正/去重)时整月重读
+                table = _fetch(client, month_start, month_end)
+                if table is not None:
+                    write_partition(month, table)
+                    logger.info(f"hist_cache重建分区{month}：{table.num_rows}行")
+            return stats
+    except Exception as e:
+        logger.error(f"hist_cache.sync处理异常：{e}")
+    return None
+
+
+def _cached_months():
+    return {np.datetime64(f"{f[0:4]}-{f[4:6]}", 'M') for f in os.listdir(cache_path)
+            if f.endswith('.arrow') and len(f) == 12}
+
+
+def _read_months(first, last, stats):
+    """
+    读取 [first, last] 内的全部分区，任何一个月缺失或不完整时返回None，由调用方回退到数据库
+
+    Args:
+        last: 结束月份，None时到最新的月份
+        stats: sync 的核对结果，各月须有分区且行数与ClickHouse一致；
+               为None(未能核对)时只能要求从first起到last(或缓存中最新的月份)逐月都有分区
+
+    Returns:
+        [pyarrow.Table]，按月份顺序
+    """
+    cached = _cached_months()
+    if stats is not None:
+        months = [m for m in sorted(stats) if m >= first and (last is None or m <= last)]
+    else:
+        end = max(cached, default=None) if last is None else last
+        if end is None or end < first:
+            return None
+        months = list(np.arange(first, end + 1, dtype='datetime64[M]'))
+    if not months:
+        return None
+    tables = []
+    for m in months:
+        table = read_partition(m) if m in cached else None
+        if table is None or (stats is not None and table.num_rows != stats[m][0]):
+            logger.warning(f"hist_cache缺少{m}月的完整分区，回退到数据库读取")
+            return None
+        tables.append(table)
+    return tables
+
+
+def load_hist(date_start, date_end=None, verify=True, columns=None):
+    """
+    从本地缓存读取 [date_start, date_end] 的全市场日K线
+
+    Args:
+        date_start: 开始日期，YYYYMMDD 或 YYYY-MM-DD
+        date_end: 结束日期，默认到最新
+        verify: 读取前先与ClickHouse核对并追加新交易日
+        columns: 只取这些数值列(code、date始终包含)，默认全部
+
+    Returns:
+        pyarrow.Table，列为 HIST_COLUMNS(或其中的columns部分)；缓存不可用或区间内有月份缺失、不完整时返回None
+    """
+    if not is_enabled():
+        return None
+    try:
+        stats = sync(date_start) if verify else None
+        if verify and stats is None:
+            logger.warning("hist_cache无法连接ClickHouse核对，使用本地缓存")
+        first = _month(date_start)
+        last = _month(date_end) if date_end is not None else None
+        tables = _read_months(first, last, stats)
+        if tables is None:
+            return None
+        if columns is not None:
+            # 分区是内存映射的，只选需要的列，其余列不会被读入
+            tables = [t.select([c for c in HIST_COLUMNS if c in ('code', 'date') or c in columns]) for t in tables]
+        table = pa.concat_tables(tables)
+        mask = pc.greater_equal(table['date'], _date_scalar(date_start))
+        if date_end is not None:
+            mask = pc.and_(mask, pc.less_equal(table['date'], _date_scalar(date_end)))
+        table = table.filter(mask)
+        if table.num_rows == 0:
+            return None
+        return table
+    except Exception as e:
+        logger.error(f"hist_cache.load_hist处理异常：{e}")
+    return None
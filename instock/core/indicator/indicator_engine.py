@@ -0,0 +1,551 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+from instock.lib.simple_logger import get_logger
+
+# 获取logger
+logger = get_logger(__name__)
+
+import numpy as np
+import pandas as pd
+import talib as tl
+from numpy.lib.stride_tricks import sliding_window_view
+import instock.core.tablestructure as tbs
+
+__author__ = 'myh '
+__date__ = '2026/10/16 '
+
+# 全市场横截面指标计算：输入为 股票数×K线数 的二维数组，一次算出所有股票的指标。
+# 计算口径与 calculate_indicator.get_indicators 逐列一致：
+#   SUM/MA/EMA/MAX/MIN 按TA-Lib相同的累加顺序在二维数组上按列递推；
+#   MACD/KDJ/RSI/ATR等递推算法复杂的指标，按行调用TA-Lib（连续内存，无pandas开销）。
+#   每个指标登记为计算核(产出列+依赖列)，调用方可只请求部分列。
+
+INPUT_FIELDS = ('open', 'high', 'low', 'close', 'volume', 'amount', 'p_change')
+
+
+def _zero_nan(x):
+    x[np.isnan(x)] = 0.0
+    return x
+
+
+def _zero_nan_inf(x):
+    x[~np.isfinite(x)] = 0.0
+    return x
+
+
+def _shift(x, n=1, fill=0.0):
+    out = np.full(x.shape, fill, dtype=np.float64)
+    if n < x.shape[1]:
+        out[:, n:] = x[:, :-n]
+    return out
+
+
+def _diff(x):
+    # 等价于 np.insert(np.diff(x), 0, 0.0)
+    out = np.zeros(x.shape, dtype=np.float64)
+    out[:, 1:] = x[:, 1:] - x[:, :-1]
+    return out
+
+
+def _talib_rows(func, *inputs, n_out=1, **kwargs):
+    # 逐行调用TA-Lib，行切片为连续内存
+    m, size = inputs[0].shape
+    outs = [np.empty((m, size), dtype=np.float64) for _ in range(n_out)]
+    for i in range(m):
+        r = func(*[x[i] for x in inputs], **kwargs)
+        if n_out == 1:
+            outs[0][i] = r
+        else:
+            for k in range(n_out):
+                outs[k][i] = r[k]
+    return outs[0] if n_out == 1 else outs
+
+
+def _leading_nan_fix(out, x, func, period):
+    # TA-Lib的python封装会跳过开头的NaN再计算，此类行直接用TA-Lib重算
+    for i in np.flatnonzero(np.isnan(x[:, 0])):
+        out[i] = func(x[i], timeperiod=period)
+    return out
+
+
+def _sum_kernel(x, period):
+    m, size = x.shape
+    out = np.full((m, size), np.nan, dtype=np.float64)
+    if size < period:
+        return out
+    total = np.zeros(m, dtype=np.float64)
+    for j in range(period - 1):
+        total += x[:, j]
+    for j in range(period - 1, size):
+        total += x[:, j]
+        out[:, j] = total
+        total -= x[:, j - period + 1]
+    return out
+
+
+def SUM(x, period):
+    return _leading_nan_fix(_sum_kernel(x, period), x, tl.SUM, period)
+
+
+def MA(x, period):
+    return _leading_nan_fix(_sum_kernel(x, period) / period, x, tl.MA, period)
+
+
+def EMA(x, period):
+    m, size = x.shape
+    out = np.full((m, size), np.nan, dtype=np.float64)
+    if size >= period:
+        k = 2.0 / (period + 1)
+        total = np.zeros(m, dtype=np.float64)
+        for j in range(period):
+            total += x[:, j]
+        prev = total / period
+        out[:, period - 1] = prev
+        for j in range(period, size):
+            prev = ((x[:, j] - prev) * k) + prev
+            out[:, j] = prev
+    return _leading_nan_fix(out, x, tl.EMA, period)
+
+
+def MAX(x, period):
+    # 仅用于不含NaN的输入(close、已置0的rsi)
+    out = np.full(x.shape, np.nan, dtype=np.float64)
+    if x.shape[1] >= period:
+        out[:, period - 1:] = sliding_window_view(x, period, axis=1).max(axis=2)
+    return out
+
+
+def MIN(x, period):
+    out = np.full(x.shape, np.nan, dtype=np.float64)
+    if x.shape[1] >= period:
+        out[:, period - 1:] = sliding_window_view(x, period, axis=1).min(axis=2)
+    return out
+
+
+def _supertrend(close, b_ub, b_lb):
+    m, size = close.shape
+    ub = np.empty((m, size), dtype=np.float64)
+    lb = np.empty((m, size), dtype=np.float64)
+    st = np.full((m, size), np.nan, dtype=np.float64)
+    if size == 0:
+        return ub, lb, st
+    ub[:, 0] = b_ub[:, 0]
+    lb[:, 0] = b_lb[:, 0]
+    st[:, 0] = np.where(close[:, 0] <= ub[:, 0], ub[:, 0], lb[:, 0])
+    for i in range(1, size):
+        last_close = close[:, i - 1]
+        curr_close = close[:, i]
+        last_ub = ub[:, i - 1]
+        last_lb = lb[:, i - 1]
+        last_st = st[:, i - 1]
+        ub[:, i] = np.where((b_ub[:, i] < last_ub) | (last_close > last_ub), b_ub[:, i], last_ub)
+        lb[:, i] = np.where((b_lb[:, i] > last_lb) | (last_close < last_lb), b_lb[:, i], last_lb)
+        on_ub = last_st == last_ub
+        on_lb = ~on_ub & (last_st == last_lb)
+        st[:, i] = np.where(on_ub, np.where(curr_close <= ub[:, i], ub[:, i], lb[:, i]),
+                            np.where(on_lb, np.where(curr_close > lb[:, i], lb[:, i], ub[:, i]), np.nan))
+    return ub, lb, st
+
+
+# 指标注册表：每个计算核声明产出列和依赖列，按需只运行被请求列所依赖的核
+KERNELS = {}
+
+# 中间列，只作为其他指标的依赖，不出现在结果中
+INTERMEDIATE_COLUMNS = ('m_price', 'm_price_sf1', 'prev_close', 'h_l', 'h_cy', 'cy_l', 'hl_avg', 'prev_high',
+                        'prev_low')
+
+
+def kernel(outputs, deps):
+    def register(func):
+        for name in outputs:
+            KERNELS[name] = (tuple(outputs), tuple(deps), func)
+        return func
+
+    return register
+
+
+@kernel(('macd', 'macds', 'macdh'), ('close',))
+def _macd(d):
+    d['macd'], d['macds'], d['macdh'] = _talib_rows(tl.MACD, d['close'], n_out=3, fastperiod=12, slowperiod=26,
+                                                    signalperiod=9)
+    for k in ('macd', 'macds', 'macdh'):
+        _zero_nan(d[k])
+
+
+@kernel(('kdjk', 'kdjd', 'kdjj'), ('high', 'low', 'close'))
+def _kdj(d):
+    d['kdjk'], d['kdjd'] = _talib_rows(tl.STOCH, d['high'], d['low'], d['close'], n_out=2, fastk_period=9,
+                                       slowk_period=5, slowk_matype=1, slowd_period=5, slowd_matype=1)
+    _zero_nan(d['kdjk'])
+    _zero_nan(d['kdjd'])
+    d['kdjj'] = 3 * d['kdjk'] - 2 * d['kdjd']
+
+
+@kernel(('boll_ub', 'boll', 'boll_lb'), ('close',))
+def _boll(d):
+    d['boll_ub'], d['boll'], d['boll_lb'] = _talib_rows(tl.BBANDS, d['close'], n_out=3, timeperiod=20, nbdevup=2,
+                                                        nbdevdn=2, matype=0)
+    for k in ('boll_ub', 'boll', 'boll_lb'):
+        _zero_nan(d[k])
+
+
+@kernel(('trix',), ('close',))
+def _trix(d):
+    d['trix'] = _zero_nan(_talib_rows(tl.TRIX, d['close'], timeperiod=12))
+
+
+@kernel(('trix_20_sma',), ('trix',))
+def _trix_sma(d):
+    d['trix_20_sma'] = _zero_nan(MA(d['trix'], 20))
+
+
+@kernel(('m_price', 'm_price_sf1'), ('amount', 'volume'))
+def _m_price(d):
+    d['m_price'] = d['amount'] / d['volume']
+    d['m_price_sf1'] = _shift(d['m_price'], 1)
+
+
+@kernel(('cr', 'cr-ma1', 'cr-ma2', 'cr-ma3'), ('high', 'low', 'm_price_sf1'))
+def _cr(d):
+    m_price_sf1 = d['m_price_sf1']
+    h_m = d['high'] - np.minimum(m_price_sf1, d['high'])
+    m_l = m_price_sf1 - np.minimum(m_price_sf1, d['low'])
+    d['cr'] = _zero_nan_inf(SUM(h_m, 26) / SUM(m_l, 26)) * 100
+    d['cr-ma1'] = _zero_nan(MA(d['cr'], 5))
+    d['cr-ma2'] = _zero_nan(MA(d['cr'], 10))
+    d['cr-ma3'] = _zero_nan(MA(d['cr'], 20))
+
+
+def _rsi_kernel(name, period):
+    @kernel((name,), ('close',))
+    def _rsi(d):
+        d[name] = _zero_nan(_talib_rows(tl.RSI, d['close'], timeperiod=period))
+
+    return _rsi
+
+
+for _name, _period in (('rsi', 14), ('rsi_6', 6), ('rsi_12', 12), ('rsi_24', 24)):
+    _rsi_kernel(_name, _period)
+
+
+@kernel(('vr', 'vr_6_sma'), ('p_change', 'volume'))
+def _vr(d):
+    p_change = d['p_change']
+    volume = d['volume']
+    avs = SUM(np.where(p_change > 0, volume, 0), 26)
+    bvs = SUM(np.where(p_change < 0, volume, 0), 26)
+    cvs = SUM(np.where(p_change == 0, volume, 0), 26)
+    d['vr'] = _zero_nan_inf((avs + cvs / 2) / (bvs + cvs / 2)) * 100
+    d['vr_6_sma'] = _zero_nan(MA(d['vr'], 6))
+
+
+@kernel(('prev_close', 'h_l', 'h_cy', 'cy_l'), ('high', 'low', 'close'))
+def _prev_close(d):
+    d['prev_close'] = _shift(d['close'], 1)
+    d['h_l'] = d['high'] - d['low']
+    d['h_cy'] = d['high'] - d['prev_close']
+    d['cy_l'] = d['prev_close'] - d['low']
+
+
+@kernel(('tr',), ('h_l', 'h_cy', 'cy_l'))
+def _tr(d):
+    d['tr'] = _zero_nan(np.fmax(np.fmax(d['h_l'], np.abs(d['h_cy'])), np.abs(d['cy_l'])))
+
+
+@kernel(('atr',), ('high', 'low', 'close'))
+def _atr(d):
+    d['atr'] = _zero_nan(_talib_rows(tl.ATR, d['high'], d['low'], d['close'], timeperiod=14))
+
+
+# DMI stockstats计算公式
+@kernel(('pdi', 'mdi', 'dx', 'adx', 'adxr'), ('high', 'low', 'atr'))
+def _dmi(d):
+    high_delta = _diff(d['high'])
+    high_m = (high_delta + np.abs(high_delta)) / 2
+    low_delta = -_diff(d['low'])
+    low_m = (low_delta + np.abs(low_delta)) / 2
+    pdm = _zero_nan(EMA(np.where(high_m > low_m, high_m, 0), 14))
+    d['pdi'] = _zero_nan_inf(pdm / d['atr']) * 100
+    mdm = _zero_nan(EMA(np.where(low_m > high_m, low_m, 0), 14))
+    d['mdi'] = _zero_nan_inf(mdm / d['atr']) * 100
+    d['dx'] = _zero_nan_inf(np.abs(d['pdi'] - d['mdi']) / (d['pdi'] + d['mdi'])) * 100
+    d['adx'] = _zero_nan(EMA(d['dx'], 6))
+    d['adxr'] = _zero_nan(EMA(d['adx'], 6))
+
+
+def _hlc_kernel(name, func, period):
+    @kernel((name,), ('high', 'low', 'close'))
+    def _hlc(d):
+        d[name] = _zero_nan(_talib_rows(func, d['high'], d['low'], d['close'], timeperiod=period))
+
+    return _hlc
+
+
+for _name, _func, _period in (('wr_6', tl.WILLR, 6), ('wr_10', tl.WILLR, 10), ('wr_14', tl.WILLR, 14),
+                              ('cci', tl.CCI, 14), ('cci_84', tl.CCI, 84)):
+    _hlc_kernel(_name, _func, _period)
+
+
+def _ma_kernel(name, src, period):
+    @kernel((name,), (src,))
+    def _ma(d):
+        d[name] = _zero_nan(MA(d[src], period))
+
+    return _ma
+
+
+for _name, _src, _period in (('ma10', 'close', 10), ('ma20', 'close', 20), ('ma50', 'close', 50),
+                             ('ma200', 'close', 200), ('vol_5', 'volume', 5), ('vol_10', 'volume', 10)):
+    _ma_kernel(_name, _src, _period)
+
+
+@kernel(('dma', 'dma_10_sma'), ('ma10', 'ma50'))
+def _dma(d):
+    d['dma'] = d['ma10'] - d['ma50']
+    d['dma_10_sma'] = _zero_nan(MA(d['dma'], 10))
+
+
+@kernel(('tema',), ('close',))
+def _tema(d):
+    d['tema'] = _zero_nan(_talib_rows(tl.TEMA, d['close'], timeperiod=14))
+
+
+@kernel(('mfi', 'mfisma'), ('high', 'low', 'close', 'volume'))
+def _mfi(d):
+    d['mfi'] = _zero_nan(_talib_rows(tl.MFI, d['high'], d['low'], d['close'], d['volume'], timeperiod=14))
+    d['mfisma'] = MA(d['mfi'], 6)
+
+
+@kernel(('vwma', 'mvwma'), ('amount', 'volume'))
+def _vwma(d):
+    d['vwma'] = _zero_nan_inf(SUM(d['amount'], 14) / SUM(d['volume'], 14))
+    d['mvwma'] = MA(d['vwma'], 6)
+
+
+@kernel(('ppo', 'ppos', 'ppoh'), ('close',))
+def _ppo(d):
+    d['ppo'] = _zero_nan(_talib_rows(tl.PPO, d['close'], fastperiod=12, slowperiod=26, matype=1))
+    d['ppos'] = _zero_nan(EMA(d['ppo'], 9))
+    d['ppoh'] = d['ppo'] - d['ppos']
+
+
+@kernel(('stochrsi_k', 'stochrsi_d'), ('rsi',))
+def _stochrsi(d):
+    rsi_min = MIN(d['rsi'], 14)
+    rsi_max = MAX(d['rsi'], 14)
+    d['stochrsi_k'] = _zero_nan_inf((d['rsi'] - rsi_min) / (rsi_max - rsi_min)) * 100
+    d['stochrsi_d'] = MA(d['stochrsi_k'], 3)
+
+
+@kernel(('wt1', 'wt2'), ('m_price',))
+def _wt(d):
+    m_price = d['m_price']
+    esa = _zero_nan(EMA(m_price, 10))
+    esa_d = EMA(np.abs(m_price - esa), 10)
+    esa_ci = _zero_nan_inf((m_price - esa) / (0.015 * esa_d))
+    d['wt1'] = _zero_nan(EMA(esa_ci, 21))
+    d['wt2'] = _zero_nan(MA(d['wt1'], 4))
+
+
+@kernel(('hl_avg',), ('high', 'low'))
+def _hl_avg(d):
+    d['hl_avg'] = (d['high'] + d['low']) / 2.0
+
+
+@kernel(('supertrend_ub', 'supertrend', 'supertrend_lb'), ('close', 'atr', 'hl_avg'))
+def _supertrend_kernel(d):
+    m_atr = d['atr'] * 3
+    d['supertrend_ub'], d['supertrend_lb'], d['supertrend'] = _supertrend(d['close'], d['hl_avg'] + m_atr,
+                                                                          d['hl_avg'] - m_atr)
+
+
+@kernel(('roc', 'rocma', 'rocema'), ('close',))
+def _roc(d):
+    d['roc'] = _zero_nan(_talib_rows(tl.ROC, d['close'], timeperiod=12))
+    d['rocma'] = _zero_nan(MA(d['roc'], 6))
+    d['rocema'] = _zero_nan(EMA(d['roc'], 9))
+
+
+@kernel(('obv',), ('close', 'volume'))
+def _obv(d):
+    d['obv'] = _zero_nan(_talib_rows(tl.OBV, d['close'], d['volume']))
+
+
+@kernel(('sar',), ('high', 'low'))
+def _sar(d):
+    d['sar'] = _zero_nan(_talib_rows(tl.SAR, d['high'], d['low']))
+
+
+@kernel(('psy', 'psyma'), ('close', 'prev_close'))
+def _psy(d):
+    price_up = np.where(d['close'] > d['prev_close'], 1.0, 0.0)
+    d['psy'] = _zero_nan(SUM(price_up, 12) / 12.0) * 100
+    d['psyma'] = MA(d['psy'], 6)
+
+
+@kernel(('br', 'ar'), ('open', 'high', 'low', 'h_cy', 'cy_l'))
+def _brar(d):
+    d['ar'] = _zero_nan_inf(SUM(d['high'] - d['open'], 26) / SUM(d['open'] - d['low'], 26)) * 100
+    d['br'] = _zero_nan_inf(SUM(d['h_cy'], 26) / SUM(d['cy_l'], 26)) * 100
+
+
+@kernel(('prev_high', 'prev_low'), ('high', 'low'))
+def _prev_hl(d):
+    d['prev_high'] = _shift(d['high'], 1)
+    d['prev_low'] = _shift(d['low'], 1)
+
+
+@kernel(('emv', 'emva'), ('amount', 'hl_avg', 'prev_high', 'prev_low', 'h_l'))
+def _emv(d):
+    phl_avg = (d['prev_high'] + d['prev_low']) / 2.0
+    emva_em = (d['hl_avg'] - phl_avg) * d['h_l'] / d['amount']
+    d['emv'] = _zero_nan(SUM(emva_em, 14))
+    d['emva'] = _zero_nan(MA(d['emv'], 9))
+
+
+@kernel(('bias', 'bias_12', 'bias_24'), ('close',))
+def _bias(d):
+    close = d['close']
+    ma6 = _zero_nan(MA(close, 6))
+    ma12 = _zero_nan(MA(close, 12))
+    ma24 = _zero_nan(MA(close, 24))
+    d['bias'] = _zero_nan_inf((close - ma6) / ma6) * 100
+    d['bias_12'] = _zero_nan_inf((close - ma12) / ma12) * 100
+    d['bias_24'] = _zero_nan_inf((close - ma24) / ma24) * 100
+
+
+@kernel(('dpo', 'madpo'), ('close',))
+def _dpo(d):
+    d['dpo'] = _zero_nan(d['close'] - _shift(MA(d['close'], 11), 1))
+    d['madpo'] = _zero_nan(MA(d['dpo'], 6))
+
+
+@kernel(('vhf',), ('close', 'prev_close'))
+def _vhf(d):
+    hcp_lcp = _zero_nan(MAX(d['close'], 28) - MIN(d['close'], 28))
+    d['vhf'] = _zero_nan(np.divide(hcp_lcp, SUM(np.abs(d['close'] - d['prev_close']), 28)))
+
+
+@kernel(('rvi', 'rvis'), ('open', 'high', 'low', 'close', 'prev_close', 'prev_high', 'prev_low'))
+def _rvi(d):
+    o = d['open']
+    close = d['close']
+    high = d['high']
+    low = d['low']
+    rvi_x = ((close - o) +
+             2 * (d['prev_close'] - _shift(o, 1)) +
+             2 * (_shift(close, 2) - _shift(o, 2)) +
+             (_shift(close, 3) - _shift(o, 3))) / 6
+    rvi_y = ((high - low) +
+             2 * (d['prev_high'] - d['prev_low']) +
+             2 * (_shift(high, 2) - _shift(low, 2)) +
+             (_shift(high, 3) - _shift(low, 3))) / 6
+    d['rvi'] = _zero_nan_inf(MA(rvi_x, 10) / MA(rvi_y, 10))
+    d['rvis'] = (d['rvi'] + 2 * _shift(d['rvi'], 1) + 2 * _shift(d['rvi'], 2) + _shift(d['rvi'], 3)) / 6
+
+
+@kernel(('fi', 'force_2', 'force_13'), ('close', 'volume'))
+def _fi(d):
+    d['fi'] = _diff(d['close']) * d['volume']
+    d['force_2'] = _zero_nan(EMA(d['fi'], 2))
+    d['force_13'] = _zero_nan(EMA(d['fi'], 13))
+
+
+@kernel(('ene_ue', 'ene', 'ene_le'), ('ma10',))
+def _ene(d):
+    d['ene_ue'] = (1 + 11 / 100) * d['ma10']
+    d['ene_le'] = (1 - 9 / 100) * d['ma10']
+    d['ene'] = (d['ene_ue'] + d['ene_le']) / 2
+
+
+# 可输出的全部指标列
+INDICATOR_COLUMNS = tuple(k for k in KERNELS if k not in INTERMEDIATE_COLUMNS)
+
+
+def resolve(columns):
+    """按依赖关系展开，返回需要依次运行的计算核"""
+    funcs = []
+    done = set(INPUT_FIELDS)
+
+    def visit(name):
+        if name in done:
+            return
+        if name not in KERNELS:
+            raise KeyError(f"未注册的指标：{name}")
+        outputs, deps, func = KERNELS[name]
+        for dep in deps:
+            visit(dep)
+        done.update(outputs)
+        funcs.append(func)
+
+    for col in columns:
+        visit(col)
+    return funcs
+
+
+def calc_block(block, columns=None):
+    """
+    计算一个无缺口数据块的指标，只运行所请求列依赖的计算核
+
+    Args:
+        block: 字段 -> (股票数, K线数) 的连续float64数组，每行都是完整的K线序列
+        columns: 需要的指标列，默认 INDICATOR_COLUMNS
+
+    Returns:
+        dict 指标名 -> (股票数, K线数) 数组，只含请求的列，不含中间列
+    """
+    if columns is None:
+        columns = INDICATOR_COLUMNS
+    d = dict(block)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for func in resolve(columns):
+            func(d)
+    return {k: d[k] for k in columns}
+
+
+def get_indicators_panel(panel, date=None, calc_threshold=90, columns=None):
+    """
+    计算全市场在date当天的指标值，结果与逐股调用 calculate_indicator.get_indicator 一致
+
+    Args:
+        panel: market_panel
+        date: 计算日期，默认取面板最后一个交易日
+        calc_threshold: 每只股票参与计算的K线数量
+        columns: 输出的指标列，默认 STOCK_STATS_DATA
+
+    Returns:
+        DataFrame，列为 date、code、name + 指标列
+    """
+    if columns is None:
+        columns = list(tbs.STOCK_STATS_DATA['columns'])
+    try:
+        if date is None:
+            end_date = str(panel.dates[-1]) if len(panel.dates) > 0 else panel.date
+        else:
+            end_date = date.strftime("%Y-%m-%d")
+
+        window, counts, _ = panel.window(calc_threshold, end_date, fields=INPUT_FIELDS)
+        total = panel.valid_count[:, -1] if len(panel.dates) > 0 else np.zeros(len(panel), dtype=np.int32)
+        result = np.zeros((len(panel), len(columns)), dtype=np.float64)
+
+        # 只有一条历史数据或截至date没有数据的股票返回0值
+        calc = (counts > 0) & (total > 1)
+        # 按K线数量分组，保证每个数据块内没有填充值，计算结果与逐股计算完全一致
+        for size in np.unique(counts[calc]):
+            rows = np.flatnonzero(calc & (counts == size))
+            block = {f: np.ascontiguousarray(window[f][rows, -size:]) for f in INPUT_FIELDS}
+            d = calc_block(block, columns)
+            for j, col in enumerate(columns):
+                result[rows, j] = d[col][:, -1]
+        _zero_nan_inf(result)
+
+        data = pd.DataFrame(result, columns=columns)
+        data.insert(0, 'name', panel.names)
+        data.insert(0, 'code', panel.codes)
+        data.insert(0, 'date', end_date)
+        return data
+    except Exception as e:
+        logger.error(f"indicator_engine.get_indicators_panel处理异常：{e}")
+    return None
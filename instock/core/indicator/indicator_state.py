@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+from instock.lib.simple_logger import get_logger
+
+# 获取logger
+logger = get_logger(__name__)
+
+import numpy as np
+import pandas as pd
+import instock.core.tablestructure as tbs
+import instock.lib.database as mdb
+import instock.core.indicator.indicator_engine as ide
+from instock.lib.database_factory import execute_sql, insert_db_from_df, read_sql_to_df
+
+__author__ = 'myh '
+__date__ = '2026/10/16 '
+
+# 递推类指标的增量计算：每只股票保存一行递推状态（EMA值、预热累加值、Wilder平均值、SAR方向等），
+# 每日只用当天一根K线把状态向前推进一步。递推口径与TA-Lib一致（种子、预热长度、运算顺序），
+# 在同一段完整历史上重建的状态与批量计算结果逐值相等。
+# 注意：状态是从历史起点一直递推下来的，与日常批量计算（每日只取最后90根K线重新播种）数值不同。
+
+RECURSIVE_COLUMNS = ('macd', 'macds', 'macdh', 'trix', 'kdjk', 'kdjd', 'kdjj',
+                     'rsi_6', 'rsi_12', 'rsi', 'rsi_24', 'atr',
+                     'supertrend_ub', 'supertrend', 'supertrend_lb', 'obv', 'sar')
+
+STATE_FIELDS = tbs.INDICATORS_STATE_FIELDS
+
+_RSI_PERIODS = ((6, 'rsi_6'), (12, 'rsi_12'), (14, 'rsi'), (24, 'rsi_24'))
+_SAR_ACCELERATION = 0.02
+_SAR_MAXIMUM = 0.2
+
+
+def new_state(size):
+    s = {k: np.full(size, np.nan, dtype=np.float64) for k in STATE_FIELDS}
+    for k in STATE_FIELDS:
+        if k.endswith('_sum') or k.endswith('_gain') or k.endswith('_loss'):
+            s[k][:] = 0.0
+    s['bars'][:] = 0
+    for k in RECURSIVE_COLUMNS:
+        s[f'o_{k}'] = np.full(size, np.nan, dtype=np.float64)
+    s['last_date'] = np.full(size, np.datetime64('NaT'), dtype='datetime64[D]')
+    return s
+
+
+def _ema(s, key, x, n, period):
+    # n为该EMA已接收的输入数(含本次)，前period个输入求和作为种子
+    k = 2.0 / (period + 1)
+    total = np.where((n >= 1) & (n <= period), s[key + '_sum'] + x, s[key + '_sum'])
+    s[key + '_sum'] = total
+    prev = s[key]
+    s[key] = np.where(n == period, total / period, np.where(n > period, ((x - prev) * k) + prev, np.nan))
+    return s[key]
+
+
+def _wilder(avg, total, x, n, period):
+    # ATR平滑：前period个值的均值为种子，之后 (avg*(period-1)+x)/period
+    total = np.where((n >= 1) & (n <= period), total + x, total)
+    avg = np.where(n == period, total / period, np.where(n > period, (avg * (period - 1) + x) / period, np.nan))
+    return avg, total
+
+
+def step(s, bar, highest, lowest):
+    """
+    用一根新K线推进状态
+
+    Args:
+        s: 状态字典（只含本次有K线的股票），原地更新
+        bar: 字段 -> 一维数组，当天K线
+        highest: 最近9根K线(含当天)的最高价
+        lowest: 最近9根K线(含当天)的最低价
+
+    Returns:
+        dict 指标名 -> 一维数组，未到输出长度的为NaN
+    """
+    high = bar['high']
+    low = bar['low']
+    close = bar['close']
+    volume = bar['volume']
+    prev_close = s['close']
+    prev_high = s['high']
+    prev_low = s['low']
+    b = s['bars'] + 1
+    first = b == 1
+    out = {}
+
+    # macd，TA-Lib的快线从 slow-fast 处开始播种
+    ema26 = _ema(s, 's_ema26', close, b, 26)
+    ema12 = _ema(s, 's_ema12', close, b - 14, 12)
+    macd = ema12 - ema26
+    macds = _ema(s, 's_macds', macd, b - 25, 9)
+    out['macd'] = np.where(b >= 34, macd, np.nan)
+    out['macds'] = macds
+    out['macdh'] = out['macd'] - macds
+
+    # trix
+    e1 = _ema(s, 's_trix1', close, b, 12)
+    e2 = _ema(s, 's_trix2', e1, b - 11, 12)
+    e3 = _ema(s, 's_trix3', e2, b - 22, 12)
+    prev_e3 = s['s_trix_prev']
+    out['trix'] = np.where(b >= 35, np.where(prev_e3 != 0, ((e3 / prev_e3) - 1.0) * 100.0, 0.0), np.nan)
+    s['s_trix_prev'] = e3
+
+    # rsi
+    diff = close - prev_close
+    n = b - 1
+    neg = diff < 0
+    for period, name in _RSI_PERIODS:
+        gain = s[f's_rsi{period}_gain']
+        loss = s[f's_rsi{period}_loss']
+        warm = (n >= 1) & (n <= period)
+        w_gain = np.where(neg, gain, gain + diff)
+        w_loss = np.where(neg, loss - diff, loss)
+        r_gain = gain * (period - 1)
+        r_gain = np.where(neg, r_gain, r_gain + diff) / period
+        r_loss = loss * (period - 1)
+        r_loss = np.where(neg, r_loss - diff, r_loss) / period
+        gain = np.where(warm, w_gain, np.where(n > period, r_gain, gain))
+        loss = np.where(warm, w_loss, np.where(n > period, r_loss, loss))
+        gain = np.where(n == period, gain / period, gain)
+        loss = np.where(n == period, loss / period, loss)
+        s[f's_rsi{period}_gain'] = gain
+        s[f's_rsi{period}_loss'] = loss
+        total = gain + loss
+        rsi = np.where((-0.00000001 < total) & (total < 0.00000001), 0.0, 100 * (gain / total))
+        out[name] = np.where(n >= period, rsi, np.nan)
+
+    # kdj
+    diff_hl = (highest - lowest) / 100.0
+    fastk = np.where(diff_hl != 0.0, (close - lowest) / diff_hl, 0.0)
+    slowk = _ema(s, 's_kdjk', fastk, b - 8, 5)
+    slowd = _ema(s, 's_kdjd', slowk, b - 12, 5)
+    out['kdjk'] = np.where(b >= 17, slowk, np.nan)
+    out['kdjd'] = slowd
+    out['kdjj'] = 3 * np.nan_to_num(out['kdjk']) - 2 * np.nan_to_num(out['kdjd'])
+
+    # atr
+    tr = high - low
+    v2 = np.abs(prev_close - high)
+    tr = np.where(v2 > tr, v2, tr)
+    v3 = np.abs(prev_close - low)
+    tr = np.where(v3 > tr, v3, tr)
+    s['s_atr'], s['s_atr_sum'] = _wilder(s['s_atr'], s['s_atr_sum'], tr, b - 1, 14)
+    out['atr'] = s['s_atr']
+
+    # supertrend
+    m_atr = np.nan_to_num(out['atr']) * 3
+    hl_avg = (high + low) / 2.0
+    b_ub = hl_avg + m_atr
+    b_lb = hl_avg - m_atr
+    last_ub = s['s_st_ub']
+    last_lb = s['s_st_lb']
+    last_st = s['s_st']
+    ub = np.where((b_ub < last_ub) | (prev_close > last_ub), b_ub, last_ub)
+    lb = np.where((b_lb > last_lb) | (prev_close < last_lb), b_lb, last_lb)
+    on_ub = last_st == last_ub
+    on_lb = ~on_ub & (last_st == last_lb)
+    st = np.where(on_ub, np.where(close <= ub, ub, lb), np.where(on_lb, np.where(close > lb, lb, ub), np.nan))
+    ub = np.where(first, b_ub, ub)
+    lb = np.where(first, b_lb, lb)
+    st = np.where(first, np.where(close <= ub, ub, lb), st)
+    s['s_st_ub'], s['s_st_lb'], s['s_st'] = ub, lb, st
+    out['supertrend_ub'], out['supertrend_lb'], out['supertrend'] = ub, lb, st
+
+    # obv
+    obv = s['s_obv']
+    obv = np.where(close > prev_close, obv + volume, np.where(close < prev_close, obv - volume, obv))
+    s['s_obv'] = np.where(first, volume, obv)
+    out['obv'] = s['s_obv']
+
+    # sar，第二根K线按MINUS_DM确定初始方向
+    init = b == 2
+    diff_p = high - prev_high
+    diff_m = prev_low - low
+    minus_dm = np.where((diff_m > 0) & (diff_p < diff_m), diff_m, 0.0)
+    is_long = np.where(init, minus_dm <= 0, s['s_sar_long'] == 1)
+    ep = np.where(init, np.where(is_long, high, low), s['s_sar_ep'])
+    sar = np.where(init, np.where(is_long, prev_low, prev_high), s['s_sar'])
+    af = np.where(init, _SAR_ACCELERATION, s['s_sar_af'])
+    p_high = np.where(init, high, prev_high)
+    p_low = np.where(init, low, prev_low)
+
+    long_switch = is_long & (low <= sar)
+    long_keep = is_long & ~(low <= sar)
+    short_switch = ~is_long & (high >= sar)
+
+    # 多头反转为空头
+    ls = np.where(ep < p_high, p_high, ep)
+    ls = np.where(ls < high, high, ls)
+    ls_next = ls + _SAR_ACCELERATION * (low - ls)
+    ls_next = np.where(ls_next < p_high, p_high, ls_next)
+    ls_next = np.where(ls_next < high, high, ls_next)
+    # 多头延续
+    lk_up = high > ep
+    lk_ep = np.where(lk_up, high, ep)
+    lk_af = np.where(lk_up, np.minimum(af + _SAR_ACCELERATION, _SAR_MAXIMUM), af)
+    lk_next = sar + lk_af * (lk_ep - sar)
+    lk_next = np.where(lk_next > p_low, p_low, lk_next)
+    lk_next = np.where(lk_next > low, low, lk_next)
+    # 空头反转为多头
+    ss = np.where(ep > p_low, p_low, ep)
+    ss = np.where(ss > low, low, ss)
+    ss_next = ss + _SAR_ACCELERATION * (high - ss)
+    ss_next = np.where(ss_next > p_low, p_low, ss_next)
+    ss_next = np.where(ss_next > low, low, ss_next)
+    # 空头延续
+    sk_down = low < ep
+    sk_ep = np.where(sk_down, low, ep)
+    sk_af = np.where(sk_down, np.minimum(af + _SAR_ACCELERATION, _SAR_MAXIMUM), af)
+    sk_next = sar + sk_af * (sk_ep - sar)
+    sk_next = np.where(sk_next < p_high, p_high, sk_next)
+    sk_next = np.where(sk_next < high, high, sk_next)
+
+    sar_out = np.select([long_switch, long_keep, short_switch], [ls, sar, ss], sar)
+    sar_next = np.select([long_switch, long_keep, short_switch], [ls_next, lk_next, ss_next], sk_next)
+    ep_next = np.select([long_switch, long_keep, short_switch], [low, lk_ep, high], sk_ep)
+    af_next = np.select([long_switch, long_keep, short_switch],
+                        [_SAR_ACCELERATION, lk_af, _SAR_ACCELERATION], sk_af)
+    long_next = np.where(long_switch, False, np.where(short_switch, True, is_long))
+    active = b >= 2
+    s['s_sar'] = np.where(active, sar_next, np.nan)
+    s['s_sar_ep'] = np.where(active, ep_next, np.nan)
+    s['s_sar_af'] = np.where(active, af_next, np.nan)
+    s['s_sar_long'] = np.where(active, long_next.astype(np.float64), np.nan)
+    out['sar'] = np.where(active, sar_out, np.nan)
+
+    s['close'] = close
+    s['high'] = high
+    s['low'] = low
+    s['bars'] = b
+    return out
+
+
+def _take(d, idx):
+    return {k: v[idx] for k, v in d.items()}
+
+
+def _put(d, idx, sub):
+    for k, v in sub.items():
+        d[k][idx] = v
+
+
+def rebuild_state(panel, date=None):
+    """
+    从面板的完整历史重新递推出截至date的状态
+
+    Returns:
+        (状态字典, 指标字典)，均按面板股票顺序
+    """
+    t = panel.date_loc(date)
+    size = len(panel)
+    s = new_state(size)
+    out = {k: np.full(size, np.nan, dtype=np.float64) for k in RECURSIVE_COLUMNS}
+    if t < 0 or size == 0:
+        return s, out
+    counts = panel.valid_count[:, t]
+    length = int(counts.max())
+    rows = np.arange(size)[:, None]
+    ks = np.arange(length)[None, :]
+    cols = panel.compact_index[rows, np.minimum(ks, panel.shape[1] - 1)]
+    ok = ks < counts[:, None]
+    # 左对齐的紧凑K线序列，第k列是每只股票的第k根有效K线
+    compact = {}
+    for f in ('high', 'low', 'close', 'volume'):
+        vals = panel.fields[f][rows, cols]
+        vals[~ok] = np.nan
+        compact[f] = vals
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for k in range(length):
+            idx = np.flatnonzero(counts > k)
+            lo = max(0, k - 8)
+            highest = compact['high'][idx, lo:k + 1].max(axis=1)
+            lowest = compact['low'][idx, lo:k + 1].min(axis=1)
+            sub = _take(s, idx)
+            o = step(sub, {f: compact[f][idx, k] for f in compact}, highest, lowest)
+            _put(s, idx, sub)
+            _put(out, idx, o)
+    has = counts > 0
+    s['last_date'][has] = panel.dates[cols[np.flatnonzero(has), counts[has] - 1]]
+    return s, out
+
+
+def update_state(panel, s, date=None):
+    """
+    用date当天的K线把上一交易日的状态推进一步；状态与面板不衔接的股票从完整历史重建
+
+    Args:
+        panel: market_panel
+        s: 上一交易日的状态字典，按面板股票顺序
+        date: 计算日期
+
+    Returns:
+        (状态字典, 指标字典)
+    """
+    window, counts, cols = panel.window(9, date, fields=('high', 'low', 'close', 'volume'))
+    last_col = cols[:, -1]
+    prev_col = cols[:, -2]
+    has_bar = counts > 0
+    last_date = np.where(has_bar, panel.dates[np.maximum(last_col, 0)], np.datetime64('NaT'))
+    prev_date = np.where(counts > 1, panel.dates[np.maximum(prev_col, 0)], np.datetime64('NaT'))
+    state_date = s['last_date']
+
+    # 当天有新K线且状态停在前一根K线：推进一步；状态已是最新K线(停牌)：保持不变；其余重建
+    advance = has_bar & (state_date == prev_date) & (s['bars'] > 0)
+    unchanged = has_bar & (state_date == last_date)
+    stale = has_bar & ~advance & ~unchanged
+
+    out = state_outputs(s)
+    if advance.any():
+        idx = np.flatnonzero(advance)
+        sub = _take(s, idx)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # 窗口左侧不足9根K线的部分为NaN(上市不满9个交易日)，与重建时一样只在有效K线上取最高、最低价
+            o = step(sub, {f: window[f][idx, -1] for f in ('high', 'low', 'close', 'volume')},
+                     np.nanmax(window['high'][idx], axis=1), np.nanmin(window['low'][idx], axis=1))
+        _put(s, idx, sub)
+        _put(out, idx, o)
+        s['last_date'][idx] = last_date[idx]
+    if stale.any():
+        codes = panel.codes[stale]
+        logger.info(f"indicator_state.update_state重建{len(codes)}只股票的状态")
+        r_s, r_out = rebuild_state(panel.view(codes=codes), date)
+        idx = np.flatnonzero(stale)
+        _put(s, idx, r_s)
+        _put(out, idx, r_out)
+    return s, out
+
+
+def state_outputs(s):
+    # 状态中保存的上一根K线的指标值
+    return {k: s[f'o_{k}'].copy() for k in RECURSIVE_COLUMNS}
+
+
+def check_state(panel, out, date=None):
+    """
+    与完整历史上的批量计算结果比对，返回各指标的最大绝对误差
+    """
+    t = panel.date_loc(date)
+    length = int(panel.valid_count[:, t].max()) if t >= 0 else 0
+    if length == 0:
+        return {}
+    end_date = None if date is None else pd.to_datetime(date)
+    batch = ide.get_indicators_panel(panel, date=end_date, calc_threshold=length, columns=list(RECURSIVE_COLUMNS))
+    errors = {}
+    for k in RECURSIVE_COLUMNS:
+        a = np.nan_to_num(out[k], nan=0.0, posinf=0.0, neginf=0.0)
+        errors[k] = float(np.max(np.abs(a - batch[k].values))) if len(a) > 0 else 0.0
+    return errors
+
+
+def state_to_frame(panel, s, out, date_str):
+    data = pd.DataFrame({k: s[k] for k in STATE_FIELDS})
+    for k in RECURSIVE_COLUMNS:
+        data[f'o_{k}'] = out[k]
+    data.insert(0, 'last_date', pd.to_datetime(s['last_date']).date)
+    data.insert(0, 'code', panel.codes)
+    data.insert(0, 'date', date_str)
+    return data
+
+
+def frame_to_state(panel, data):
+    s = new_state(len(panel))
+    if data is None or len(data.index) == 0:
+        return s
+    data = data.drop_duplicates(subset="code", keep="last")
+    pos = np.array([panel.code_index.get(c, -1) for c in data['code'].values], dtype=np.int64)
+    keep = pos >= 0
+    pos = pos[keep]
+    for k in STATE_FIELDS:
+        s[k][pos] = np.asarray(data[k].values, dtype=np.float64)[keep]
+    for k in RECURSIVE_COLUMNS:
+        s[f'o_{k}'][pos] = np.asarray(data[f'o_{k}'].values, dtype=np.float64)[keep]
+    s['last_date'][pos] = pd.to_datetime(data['last_date']).values.astype('datetime64[D]')[keep]
+    return s
+
+
+def load_state():
+    """读取每只股票最近一次保存的状态，状态与计算日期是否衔接由 update_state 按 last_date 判断"""
+    table_name = tbs.TABLE_CN_STOCK_INDICATORS_STATE['name']
+    try:
+        if not mdb.checkTableIsExist(table_name):
+            return None
+        return read_sql_to_df(f"SELECT * FROM `{table_name}` ORDER BY `date`")
+    except Exception as e:
+        logger.error(f"indicator_state.load_state处理异常：{e}")
+    return None
+
+
+def save_state(data, date_str):
+    """保存date_str的状态，写入成功后删除其他日期的行，表中每只股票只保留一行"""
+    table_name = tbs.TABLE_CN_STOCK_INDICATORS_STATE['name']
+    try:
+        if mdb.checkTableIsExist(table_name):
+            execute_sql(f"DELETE FROM `{table_name}` WHERE `date` = '{date_str}'")
+            cols_type = None
+        else:
+            cols_type = tbs.get_field_types(tbs.TABLE_CN_STOCK_INDICATORS_STATE['columns'])
+        if insert_db_from_df(data, table_name, cols_type, False, "`date`,`code`"):
+            execute_sql(f"DELETE FROM `{table_name}` WHERE `date` <> '{date_str}'")
+    except Exception as e:
+        logger.error(f"indicator_state.save_state处理异常：{e}")
+
+
+def run_state(panel, date, rebuild=False):
+    """
+    日常增量计算入口：读取上一交易日状态并推进一步，rebuild为True时从完整历史重建并与批量结果比对
+
+    Returns:
+        DataFrame，列为 code + RECURSIVE_COLUMNS
+    """
+    try:
+        date_str = date.strftime("%Y-%m-%d")
+        if rebuild:
+            s, out = rebuild_state(panel, date_str)
+            errors = check_state(panel, out, date_str)
+            bad = {k: v for k, v in errors.items() if not v <= 1e-6}
+            if bad:
+                logger.warning(f"indicator_state.run_state重建状态与批量计算不一致：{bad}")
+            else:
+                logger.info(f"indicator_state.run_state重建状态与批量计算一致，股票数{len(panel)}")
+        else:
+            s, out = update_state(panel, frame_to_state(panel, load_state()), date_str)
+        for k in RECURSIVE_COLUMNS:
+            s[f'o_{k}'] = out[k]
+        save_state(state_to_frame(panel, s, out, date_str), date_str)
+
+        data = pd.DataFrame({k: np.nan_to_num(out[k], nan=0.0, posinf=0.0, neginf=0.0) for k in RECURSIVE_COLUMNS})
+        data.insert(0, 'code', panel.codes)
+        return data
+    except Exception as e:
+        logger.error(f"indicator_state.run_state处理异常：{e}")
+    return None
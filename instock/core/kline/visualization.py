@@ -25,6 +25,12 @@ import instock.core.kline.indicator_web_dic as iwd
 from instock.lib.simple_logger import get_logger
 logger = get_logger(__name__)
 
+# K线图用到的指标列：均线、成交量均线以及 indicators_dic 中的全部指标
+PLOT_INDICATOR_COLUMNS = tuple(dict.fromkeys(
+    ("ma10", "ma20", "ma50", "ma200", "vol_5", "vol_10") +
+    tuple(name for conf in iwd.indicators_dic for name in conf['dic'] if name != 'close')))
+
+
 def get_plot_kline(code, stock, date, stock_name):
     plot_list = []
     try:
@@ -47,7 +53,7 @@ def get_plot_kline(code, stock, date, stock_name):
         # 确保原始数据按日期升序排列
         stock = stock.sort_values('date').reset_index(drop=True)
 
-        data = idr.get_indicators(stock, date, threshold=360)
+        data = idr.get_indicators(stock, date, threshold=360, columns=PLOT_INDICATOR_COLUMNS)
         if data is None:
             return None
 
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from instock.lib.simple_logger import get_logger
+
+# 获取logger
+logger = get_logger(__name__)
+
+import datetime
+import sys
+from collections.abc import Mapping
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import pandas as pd
+
+__author__ = 'myh '
+__date__ = '2026/10/16 '
+
+# 面板字段：每个字段是 代码×交易日 的二维float64数组，停牌/未上市位置为NaN
+PANEL_FIELDS = ('open', 'high', 'low', 'close', 'preclose', 'volume', 'amount', 'turnover', 'p_change')
+
+
+def select_fields(fields=None):
+    """按 PANEL_FIELDS 顺序返回需要的字段，收盘价始终包含"""
+    if fields is None:
+        return PANEL_FIELDS
+    return tuple(f for f in PANEL_FIELDS if f == 'close' or f in fields)
+
+
+def to_datetime64(date):
+    """把 str/date/datetime/np.datetime64 统一转换为 np.datetime64[D]"""
+    if date is None:
+        return None
+    if isinstance(date, np.datetime64):
+        return date.astype('datetime64[D]')
+    if isinstance(date, datetime.datetime):
+        date = date.date()
+    if isinstance(date, datetime.date):
+        return np.datetime64(date, 'D')
+    date = str(date)
+    if len(date) == 8 and date.isdigit():
+        date = f"{date[0:4]}-{date[4:6]}-{date[6:8]}"
+    return np.datetime64(date[0:10], 'D')
+
+
+def code_suffix(code):
+    # 兼容 sh.600000 / 600000 两种代码格式
+    code = str(code)
+    return code.split('.')[-1] if '.' in code else code
+
+
+# 全市场历史行情面板，替代 {(date, code, name): DataFrame} 的逐股存储方式
+class market_panel:
+    def __init__(self, codes, names, dates, fields, date=None):
+        self.codes = np.asarray(codes, dtype=object)  # 6位代码
+        self.names = np.asarray(names, dtype=object)
+        self.dates = np.asarray(dates, dtype='datetime64[D]')  # 升序交易日
+        self.fields = fields  # 字段名 -> (代码数, 交易日数) float64
+        self.date = date  # 快照日期字符串，用于构造 (date, code, name) 键
+        self.code_index = {c: i for i, c in enumerate(self.codes)}
+        self._valid_count = None
+        self._compact_index = None
+        self.shared_spec = None  # 字段位于共享内存时的描述信息，见 shared_panel
+        self._shm = None
+        self.root = None  # 按日期截取的快照所属的完整面板，见 singleton_stock.stock_hist_data.as_of
+
+    @classmethod
+    def from_frame(cls, data, stocks=None, date=None, fields=None):
+        """
+        由数据库返回的长表构建面板
+
+        Args:
+            data: 含 code、date 以及 PANEL_FIELDS 列的DataFrame
+            stocks: (date, code, name) 元组列表，只保留其中的股票并按其顺序排列
+            date: 快照日期，默认取stocks中的日期
+            fields: 需要的字段，默认 PANEL_FIELDS 全部
+
+        Returns:
+            market_panel 或 None
+        """
+        if data is None or len(data.index) == 0:
+            return None
+
+        code_keys = np.array([code_suffix(c) for c in data['code'].values], dtype=object)
+        code_idx, uniq_codes = pd.factorize(code_keys)
+        date_vals = pd.to_datetime(data['date']).values.astype('datetime64[D]')
+        values = {name: np.asarray(data[name].values, dtype=np.float64) for name in select_fields(fields)
+                  if name in data.columns}
+        return cls._from_codes(code_idx, uniq_codes, date_vals, values, stocks, date, fields)
+
+    @classmethod
+    def from_arrow(cls, table, stocks=None, date=None, fields=None):
+        """
+        由Arrow表构建面板，code为字典编码时直接使用其编码，数值列直接取列缓冲区
+
+        Args:
+            table: 含 code、date 以及行情数值列的pyarrow.Table，换手率列可以是 turn 或 turnover
+            stocks: 同 from_frame
+            date: 同 from_frame
+            fields: 同 from_frame
+
+        Returns:
+            market_panel 或 None
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        if table is None or table.num_rows == 0:
+            return None
+
+        code = table['code'].combine_chunks()
+        if not pa.types.is_dictionary(code.type):
+            code = pc.dictionary_encode(code)
+        # 字典内的代码去掉市场前缀后再归并
+        dict_idx, uniq_codes = pd.factorize(np.array([code_suffix(c) for c in code.dictionary.to_pylist()],
+                                                     dtype=object))
+        code_idx = dict_idx[code.indices.to_numpy(zero_copy_only=False)]
+        date_vals = np.asarray(table['date'].to_numpy(), dtype='datetime64[D]')
+        values = {}
+        for name in select_fields(fields):
+            col = 'turn' if name == 'turnover' and 'turnover' not in table.column_names else name
+            if col in table.column_names:
+                values[name] = np.asarray(table[col].to_numpy(), dtype=np.float64)
+        return cls._from_codes(code_idx, uniq_codes, date_vals, values, stocks, date, fields)
+
+    @classmethod
+    def _from_codes(cls, code_idx, uniq_codes, date_vals, values, stocks=None, date=None, fields=None):
+        date_idx, uniq_dates = pd.factorize(date_vals, sort=True)
+        uniq_dates = np.asarray(uniq_dates, dtype='datetime64[D]')
+
+        if stocks is not None:
+            name_map = {s[1]: s[2] for s in stocks}
+            if date is None and len(stocks) > 0:
+                date = stocks[0][0]
+            # 行顺序跟随stocks，丢弃没有历史数据的股票
+            present = {c: i for i, c in enumerate(uniq_codes)}
+            order = [s[1] for s in stocks if s[1] in present]
+            row_of = np.full(len(uniq_codes), -1, dtype=np.int64)
+            for r, c in enumerate(order):
+                row_of[present[c]] = r
+            rows = row_of[code_idx]
+            keep = rows >= 0
+            rows = rows[keep]
+            cols = date_idx[keep]
+            codes = np.asarray(order, dtype=object)
+            names = np.array([name_map[c] for c in order], dtype=object)
+        else:
+            keep = None
+            rows = code_idx
+            cols = date_idx
+            codes = np.asarray(uniq_codes, dtype=object)
+            names = codes.copy()
+
+        # fields为需要的字段(收盘价始终保留，用于判断有效K线)，默认全部字段
+        names_used = select_fields(fields)
+        shape = (len(codes), len(uniq_dates))
+        fields = {}
+        for name in names_used:
+            arr = np.full(shape, np.nan, dtype=np.float64)
+            if name in values:
+                arr[rows, cols] = values[name] if keep is None else values[name][keep]
+            fields[name] = arr
+        # 没有收盘价的行视为无效，其他字段同步置空
+        invalid = np.isnan(fields['close'])
+        for name in names_used:
+            fields[name][invalid] = np.nan
+
+        if date is None and len(uniq_dates) > 0:
+            date = str(uniq_dates[-1])
+        return cls(codes, names, uniq_dates, fields, date=date)
+
+    @classmethod
+    def merge(cls, old, new, stocks=None, date_start=None):
+        """
+        把增量面板合并到旧面板：交易日取并集，重叠日期以新数据为准
+
+        Args:
+            old: 旧面板
+            new: 增量面板，可为None（只更新股票列表或截断日期）
+            stocks: (date, code, name) 元组列表，决定合并后的股票及顺序，默认旧面板股票加新增股票
+            date_start: 只保留不早于该日期的交易日
+
+        Returns:
+            market_panel
+        """
+        panels = [p for p in (old, new) if p is not None]
+        dates = np.unique(np.concatenate([p.dates for p in panels]))
+        if date_start is not None:
+            dates = dates[dates >= to_datetime64(date_start)]
+        name_map = {}
+        for p in panels:
+            name_map.update(zip(p.codes, p.names))
+        if stocks is not None:
+            name_map.update({s[1]: s[2] for s in stocks})
+            # 与from_frame一致，丢弃没有历史数据的股票
+            present = set().union(*[p.codes for p in panels])
+            codes = [s[1] for s in stocks if s[1] in present]
+            date = stocks[0][0] if len(stocks) > 0 else None
+        else:
+            codes = list(old.codes) + [c for c in (() if new is None else new.codes) if c not in old.code_index]
+            date = panels[-1].date
+        code_index = {c: i for i, c in enumerate(codes)}
+
+        shape = (len(codes), len(dates))
+        fields = {name: np.full(shape, np.nan, dtype=np.float64) for name in old.fields}
+        for p in panels:
+            rows = np.array([code_index.get(c, -1) for c in p.codes], dtype=np.int64)
+            cols = np.searchsorted(dates, p.dates)
+            keep_cols = (cols < len(dates)) & (dates[np.minimum(cols, len(dates) - 1)] == p.dates)
+            src_rows = np.flatnonzero(rows >= 0)
+            src_cols = np.flatnonzero(keep_cols)
+            if len(src_rows) == 0 or len(src_cols) == 0:
+                continue
+            valid = ~np.isnan(p.fields['close'][np.ix_(src_rows, src_cols)])
+            for name, arr in fields.items():
+                block = arr[np.ix_(rows[src_rows], cols[src_cols])]
+                vals = p.fields[name][np.ix_(src_rows, src_cols)]
+                # 新数据只覆盖其有效K线，不用停牌的NaN冲掉旧值
+                block[valid] = vals[valid]
+                arr[np.ix_(rows[src_rows], cols[src_cols])] = block
+        names = np.array([name_map[c] for c in codes], dtype=object)
+        return cls(np.asarray(codes, dtype=object), names, dates, fields, date=date)
+
+    @property
+    def shape(self):
+        return len(self.codes), len(self.dates)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def field(self, name):
+        return self.fields[name]
+
+    def keys(self):
+        return [(self.date, c, n) for c, n in zip(self.codes, self.names)]
+
+    def date_loc(self, date):
+        """返回不晚于date的最后一个交易日下标，没有则返回-1"""
+        if date is None:
+            return len(self.dates) - 1
+        return int(np.searchsorted(self.dates, to_datetime64(date), side='right')) - 1
+
+    @property
+    def valid(self):
+        return ~np.isnan(self.fields['close'])
+
+    @property
+    def valid_count(self):
+        # valid_count[i, t]：股票i截至第t个交易日(含)的有效K线数量
+        if self._valid_count is None:
+            self._valid_count = np.cumsum(self.valid, axis=1, dtype=np.int32)
+        return self._valid_count
+
+    @property
+    def compact_index(self):
+        # compact_index[i, k]：股票i的第k根有效K线所在的交易日列
+        if self._compact_index is None:
+            self._compact_index = np.argsort(~self.valid, axis=1, kind='stable').astype(np.int32)
+        return self._compact_index
+
+    def window(self, length, end_date=None, fields=None):
+        """
+        取每只股票截至end_date的最后length根有效K线（跳过停牌日），右对齐，不足部分左侧补NaN
+
+        与逐股 data.loc[date <= end_date].tail(length) 的结果逐行一致。
+
+        Returns:
+            (dict 字段 -> (代码数, length)数组, counts 每只股票的有效根数, cols 对应的交易日列，无效处为-1)
+        """
+        if fields is None:
+            fields = tuple(self.fields)
+        n = len(self.codes)
+        t = self.date_loc(end_date)
+        if t < 0 or n == 0:
+            empty = {f: np.full((n, length), np.nan) for f in fields}
+            return empty, np.zeros(n, dtype=np.int32), np.full((n, length), -1, dtype=np.int32)
+        end = self.valid_count[:, t]
+        counts = np.minimum(end, length).astype(np.int32)
+        k = end[:, None] - length + np.arange(length)[None, :]
+        ok = k >= 0
+        rows = np.arange(n)[:, None]
+        cols = self.compact_index[rows, np.where(ok, k, 0)]
+        cols = np.where(ok, cols, -1)
+        out = {}
+        for f in fields:
+            vals = self.fields[f][rows, np.where(ok, cols, 0)]
+            vals[~ok] = np.nan
+            out[f] = vals
+        return out, counts, cols
+
+    def view(self, end_date=None, lookback=None, codes=None, fields=None):
+        """按交易日截取（不复制数据的切片视图），lookback为保留的交易日数，fields为保留的字段"""
+        stop = self.date_loc(end_date) + 1
+        start = 0 if lookback is None else max(0, stop - lookback)
+        names = tuple(self.fields) if fields is None else tuple(f for f in self.fields if f == 'close' or f in fields)
+        if codes is None:
+            fields = {k: self.fields[k][:, start:stop] for k in names}
+            panel = market_panel(self.codes, self.names, self.dates[start:stop], fields, date=self.date)
+        else:
+            idx = np.array([self.code_index[c] for c in codes if c in self.code_index], dtype=np.int64)
+            fields = {k: self.fields[k][idx, start:stop] for k in names}
+            panel = market_panel(self.codes[idx], self.names[idx], self.dates[start:stop], fields, date=self.date)
+        return panel
+
+    def row_slice(self, start, stop):
+        """按股票行截取连续的一段（切片视图，不复制数据）"""
+        fields = {k: v[start:stop] for k, v in self.fields.items()}
+        return market_panel(self.codes[start:stop], self.names[start:stop], self.dates, fields, date=self.date)
+
+    def frame_at(self, i, end_date=None, lookback=None):
+        """
+        生成第i只股票的逐股DataFrame，列与 CN_STOCK_HIST_DATA + code 保持一致
+
+        Args:
+            end_date: 只取不晚于该日期的K线，默认全部
+            lookback: 只取最后lookback根有效K线，默认全部
+        """
+        close = self.fields['close'][i]
+        if end_date is not None:
+            close = close[:self.date_loc(end_date) + 1]
+        cols = np.flatnonzero(~np.isnan(close))
+        if lookback is not None:
+            cols = cols[-lookback:] if lookback > 0 else cols[:0]
+        # 按需加载时面板可能不含某些字段，对应列填NaN
+        missing = np.full(len(cols), np.nan)
+        f = {k: (self.fields[k][i, cols] if k in self.fields else missing) for k in PANEL_FIELDS}
+        preclose = f['preclose']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            amplitude = np.where(preclose != 0, (f['high'] - f['low']) / preclose * 100, 0.0)
+        return pd.DataFrame({'date': self.dates[cols].astype(object),
+                             'open': f['open'],
+                             'close': f['close'],
+                             'high': f['high'],
+                             'low': f['low'],
+                             'volume': f['volume'],
+                             'amount': f['amount'],
+                             'amplitude': amplitude,
+                             'p_change': f['p_change'],
+                             'ups_downs': f['close'] - preclose,
+                             'turnover': f['turnover'],
+                             'code': self.codes[i]})
+
+    def frame(self, code, end_date=None, lookback=None):
+        i = self.code_index.get(code)
+        if i is None:
+            return None
+        return self.frame_at(i, end_date, lookback)
+
+    def frames(self):
+        return panel_frames(self)
+
+
+def _attach_shm(name, untrack=True):
+    # 映射方不登记资源跟踪，否则映射方进程退出时其资源跟踪进程会删除创建方的共享内存；
+    #   python3.13起可直接关闭跟踪，之前的版本映射后再注销登记。
+    #   与创建方共用资源跟踪进程的子进程(untrack=False)不能注销，否则会连同创建方的登记一起注销
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=not untrack)
+    shm = shared_memory.SharedMemory(name=name)
+    if untrack:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+# 面板导出到共享内存，spec只含代码、日期等元数据和共享内存名称，可在进程间传递
+class shared_panel:
+    def __init__(self, panel):
+        self.field_names = tuple(panel.fields.keys())
+        n, t = panel.shape
+        shape = (len(self.field_names), n, t)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 8))
+        buf = np.ndarray(shape, dtype=np.float64, buffer=self.shm.buf)
+        for k, name in enumerate(self.field_names):
+            buf[k] = panel.fields[name]
+        self.spec = {'shm': self.shm.name, 'fields': self.field_names, 'shape': shape,
+                     'codes': panel.codes, 'names': panel.names, 'dates': panel.dates, 'date': panel.date}
+
+    def close(self):
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except Exception as e:
+            logger.error(f"market_panel.shared_panel.close处理异常：{e}")
+
+
+def attach_panel(spec, untrack=True):
+    """
+    按spec映射共享内存，返回只读的market_panel（零拷贝），映射随面板对象存活
+
+    Args:
+        untrack: 不登记资源跟踪，共享内存的生命周期只由创建方管理；
+                 创建方自己的进程池子进程与其共用资源跟踪进程，传False
+    """
+    shm = _attach_shm(spec['shm'], untrack)
+    buf = np.ndarray(spec['shape'], dtype=np.float64, buffer=shm.buf)
+    buf.flags.writeable = False
+    fields = {name: buf[k] for k, name in enumerate(spec['fields'])}
+    panel = market_panel(spec['codes'], spec['names'], spec['dates'], fields, date=spec['date'])
+    panel.shared_spec = spec
+    panel._shm = shm
+    return panel
+
+
+# 兼容旧接口的只读映射：按 (date, code, name) 访问时才生成单只股票的DataFrame，不常驻内存
+class panel_frames(Mapping):
+    def __init__(self, panel):
+        self._panel = panel
+        self._index = {key: i for i, key in enumerate(panel.keys())}
+
+    def __getitem__(self, key):
+        return self._panel.frame_at(self._index[key])
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def get_panel(self):
+        return self._panel
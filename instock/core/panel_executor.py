@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from instock.lib.simple_logger import get_logger
+
+# 获取logger
+logger = get_logger(__name__)
+
+import atexit
+import math
+import os
+import threading
+import concurrent.futures
+import multiprocessing as mp
+from instock.core.market_panel import shared_panel, attach_panel
+
+__author__ = 'myh '
+__date__ = '2026/10/16 '
+
+# 日终作业的多进程执行层：
+#   面板字段一次性写入共享内存，子进程启动时按名称映射，任务只传 (date, code, name) 键，不逐任务pickle行情数据；
+#   任务按块提交，避免几千个小任务的进程间通信开销。
+# 环境变量：
+#   JOB_EXECUTOR   process(默认)/thread，thread 为原来的进程内多线程方式
+#   JOB_WORKERS    进程数，默认CPU核数
+#   JOB_CHUNK_SIZE 每块股票数，默认按 股票数/(进程数×CHUNKS_PER_WORKER) 自动计算
+
+THREAD_WORKERS = 40
+CHUNKS_PER_WORKER = 4
+MIN_CHUNK_SIZE = 16
+
+
+def get_workers():
+    workers = os.environ.get('JOB_WORKERS')
+    if workers:
+        return max(1, int(workers))
+    return os.cpu_count() or 1
+
+
+def get_mode():
+    return os.environ.get('JOB_EXECUTOR', 'process').lower()
+
+
+def get_chunk_size(n, workers, chunks_per_worker=CHUNKS_PER_WORKER, min_size=MIN_CHUNK_SIZE):
+    size = os.environ.get('JOB_CHUNK_SIZE')
+    if size:
+        return max(1, int(size))
+    return max(min_size, math.ceil(n / (workers * chunks_per_worker)))
+
+
+_worker_panel = None
+
+
+def _worker_init(spec, untrack):
+    global _worker_panel
+    _worker_panel = attach_panel(spec, untrack)
+
+
+def _run_stocks(panel, func, tasks, args, kwargs, window=(None, None)):
+    out = []
+    for key, kw in tasks:
+        try:
+            result = func(key, panel.frame(key[1], *window), *args, **kwargs, **kw)
+            if result is not None:
+                out.append((key, result))
+        except Exception as e:
+            logger.error(f"panel_executor._run_stocks处理异常：{key[1]}代码{e}")
+    return out
+
+
+def _worker_stocks(func, tasks, args, kwargs, window):
+    return _run_stocks(_worker_panel, func, tasks, args, kwargs, window)
+
+
+def _worker_rows(func, start, stop, args, kwargs):
+    return func(_worker_panel.row_slice(start, stop), *args, **kwargs)
+
+
+def _run_tasks(panel, func, tasks, args, kwargs):
+    out = []
+    for task in tasks:
+        try:
+            out.append(func(panel, task, *args, **kwargs))
+        except Exception as e:
+            logger.error(f"panel_executor._run_tasks处理异常：{task}{e}")
+            out.append(None)
+    return out
+
+
+def _worker_tasks(func, tasks, args, kwargs):
+    return _run_tasks(_worker_panel, func, tasks, args, kwargs)
+
+
+# 基于同一个面板的任务执行器，进程池在第一次使用时创建
+class panel_executor:
+    def __init__(self, panel, workers=None, mode=None):
+        self.panel = panel
+        self.workers = get_workers() if workers is None else max(1, workers)
+        self.mode = get_mode() if mode is None else mode
+        if self.workers <= 1:
+            self.mode = 'thread'
+        self._shared = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None and self.mode == 'process':
+                try:
+                    # 面板本身已在共享内存中(来自panel_server)时直接复用，不再复制
+                    spec = self.panel.shared_spec
+                    # 本进程创建的共享内存已由本进程登记资源跟踪，子进程与本进程共用资源跟踪进程，映射后不注销
+                    untrack = spec is not None
+                    if spec is None:
+                        self._shared = shared_panel(self.panel)
+                        spec = self._shared.spec
+                    method = 'forkserver' if 'forkserver' in mp.get_all_start_methods() else 'spawn'
+                    self._pool = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=mp.get_context(method),
+                        initializer=_worker_init, initargs=(spec, untrack))
+                except Exception as e:
+                    logger.error(f"panel_executor._get_pool处理异常：{e}，改用多线程")
+                    self._release()
+                    self.mode = 'thread'
+            return self._pool
+
+    def map_stocks(self, func, keys, args=(), kwargs=None, key_kwargs=None, end_date=None, lookback=None):
+        """
+        逐股执行 func((date, code, name), data, *args, **kwargs)，data为该股的历史DataFrame
+
+        Args:
+            func: 模块级函数（子进程按引用反序列化）
+            keys: (date, code, name) 元组列表，按code从面板取数据
+            key_kwargs: 可选，key -> 该股额外关键字参数，在主进程中求值
+            end_date/lookback: 只把不晚于end_date的最后lookback根K线交给func，由调用方按其所需窗口给出
+
+        Returns:
+            dict key -> 非None的返回值
+        """
+        kwargs = {} if kwargs is None else kwargs
+        window = (end_date, lookback)
+        tasks = [(key, {} if key_kwargs is None else key_kwargs(key)) for key in keys]
+        data = {}
+        if len(tasks) == 0:
+            return data
+        pool = self._get_pool()
+        if pool is None:
+            size = get_chunk_size(len(tasks), THREAD_WORKERS, chunks_per_worker=1, min_size=1)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=THREAD_WORKERS) as executor:
+                futures = [executor.submit(_run_stocks, self.panel, func, tasks[i:i + size], args, kwargs, window)
+                           for i in range(0, len(tasks), size)]
+        else:
+            size = get_chunk_size(len(tasks), self.workers)
+            futures = [pool.submit(_worker_stocks, func, tasks[i:i + size], args, kwargs, window)
+                       for i in range(0, len(tasks), size)]
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                data.update(future.result())
+            except Exception as e:
+                logger.error(f"panel_executor.map_stocks处理异常：{e}")
+        return data
+
+    def map_rows(self, func, args=(), kwargs=None):
+        """
+        把面板按股票行切成若干块，逐块执行 func(sub_panel, *args, **kwargs)，用于横截面计算
+
+        Returns:
+            按行顺序排列的各块返回值列表
+        """
+        kwargs = {} if kwargs is None else kwargs
+        n = len(self.panel)
+        pool = self._get_pool()
+        if pool is None or n == 0:
+            return [func(self.panel, *args, **kwargs)]
+        size = get_chunk_size(n, self.workers, chunks_per_worker=1)
+        futures = [pool.submit(_worker_rows, func, i, min(i + size, n), args, kwargs) for i in range(0, n, size)]
+        return [future.result() for future in futures]
+
+    def map_tasks(self, func, tasks, args=(), kwargs=None):
+        """
+        逐个执行 func(panel, task, *args, **kwargs)，每个任务使用完整面板，用于参数扫描等彼此独立的整面板计算
+
+        Args:
+            func: 模块级函数（子进程按引用反序列化）
+            tasks: 任务参数列表，应为可pickle的小对象
+
+        Returns:
+            与tasks顺序一致的返回值列表，出错的任务为None
+        """
+        kwargs = {} if kwargs is None else kwargs
+        tasks = list(tasks)
+        if len(tasks) == 0:
+            return []
+        pool = self._get_pool()
+        if pool is None:
+            return _run_tasks(self.panel, func, tasks, args, kwargs)
+        size = get_chunk_size(len(tasks), self.workers, min_size=1)
+        futures = [pool.submit(_worker_tasks, func, tasks[i:i + size], args, kwargs)
+                   for i in range(0, len(tasks), size)]
+        out = []
+        for future in futures:
+            try:
+                out.extend(future.result())
+            except Exception as e:
+                logger.error(f"panel_executor.map_tasks处理异常：{e}")
+                out.extend([None] * size)
+        return out[:len(tasks)]
+
+    def _release(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        if self._shared is not None:
+            self._shared.close()
+            self._shared = None
+
+    def shutdown(self):
+        with self._lock:
+            self._release()
+
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def get_executor(panel):
+    """
+    同一面板复用一个执行器（多个策略、多个日期共用进程池和共享内存）
+
+    按日期截取的快照(panel.root不为None)共用其完整面板的执行器，截至日期由调用方通过
+    map_stocks 的 end_date 或 map_rows 传给 func 的日期参数限定。
+    面板更换(如重新读取)后旧执行器保留到进程退出，不中断其他线程正在执行的任务。
+    """
+    if panel.root is not None:
+        panel = panel.root
+    with _executor_lock:
+        executor = _executors.get(id(panel))
+        if executor is None or executor.panel is not panel:
+            executor = panel_executor(panel)
+            _executors[id(panel)] = executor
+        return executor
+
+
+def release_executor(panel):
+    """面板不再使用时关闭其执行器，释放进程池和共享内存，用于分段读取的面板逐段替换"""
+    if panel.root is not None:
+        panel = panel.root
+    with _executor_lock:
+        executor = _executors.pop(id(panel), None)
+    if executor is not None and executor.panel is panel:
+        executor.shutdown()
+
+
+@atexit.register
+def _shutdown_executor():
+    with _executor_lock:
+        for executor in _executors.values():
+            executor.shutdown()
+        _executors.clear()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from instock.lib.simple_logger import get_logger
+
+# 获取logger
+logger = get_logger(__name__)
+
+import os.path
+import sys
+import secrets
+import threading
+from multiprocessing.connection import Listener, Client
+
+cpath_current = os.path.dirname(os.path.dirname(__file__))
+cpath = os.path.abspath(os.path.join(cpath_current, os.pardir))
+sys.path.append(cpath)
+import instock.core.stockfetch as stf
+import instock.lib.trade_time as trd
+from instock.core.market_panel import market_panel, shared_panel, attach_panel
+
+__author__ = 'myh '
+__date__ = '2026/10/16 '
+
+# 本地行情数据服务：常驻进程把最近3年的全市场面板放在共享内存中，
+#   作业进程、进程池子进程和web进程通过本地socket取得共享内存描述后直接映射（零拷贝）；
+#   启动时全量读取一次ClickHouse，之后每日行情入库后只读取增量交易日并合并。
+# 环境变量：
+#   PANEL_SERVER_HOST/PANEL_SERVER_PORT 监听地址，默认 127.0.0.1:9989
+#   PANEL_SERVER_AUTHKEY                 连接认证口令，未设置时服务首次启动随机生成并写入 cache/panel_server.key(权限0600)，
+#                                        客户端读取同一文件，两者都没有时客户端直接读数据库
+#   PANEL_SERVER                         设为 off 时客户端不连接服务，直接读数据库
+
+
+def get_address():
+    return os.environ.get('PANEL_SERVER_HOST', '127.0.0.1'), int(os.environ.get('PANEL_SERVER_PORT', '9989'))
+
+
+authkey_file = os.path.join(cpath_current, 'cache', 'panel_server.key')
+
+
+def get_authkey(create=False):
+    """
+    取得连接认证口令：优先使用环境变量 PANEL_SERVER_AUTHKEY，否则读取口令文件
+
+    Args:
+        create: 口令文件不存在时是否随机生成(服务端)，文件只对当前用户可读写
+
+    Returns:
+        bytes，没有可用口令时返回None
+    """
+    key = os.environ.get('PANEL_SERVER_AUTHKEY')
+    if key:
+        return key.encode('utf-8')
+    if create and not os.path.exists(authkey_file):
+        os.makedirs(os.path.dirname(authkey_file), exist_ok=True)
+        try:
+            fd = os.open(authkey_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, 'w') as f:
+                f.write(secrets.token_hex(32))
+    try:
+        with open(authkey_file, 'rb') as f:
+            key = f.read().strip()
+    except OSError:
+        return None
+    return key or None
+
+
+class panel_server:
+    def __init__(self):
+        self.panel = None
+        self.version = 0
+        self._shared = None
+        self._retired = None  # 上一代共享内存，保留到下一次发布，供尚未映射完的客户端使用
+        self._lock = threading.RLock()
+
+    def _publish(self, panel):
+        shared = shared_panel(panel)
+        with self._lock:
+            if self._retired is not None:
+                self._retired.close()
+            self._retired = self._shared
+            self._shared = shared
+            self.panel = panel
+            self.version += 1
+        logger.info(f"panel_server发布第{self.version}版面板：{panel.shape[0]}只股票，{panel.shape[1]}个交易日")
+
+    def load(self):
+        """全量读取最近3年历史数据"""
+        with self._lock:
+            stocks = stf.get_stock_code_name()
+            if stocks is None:
+                return False
+            date_start, is_cache = trd.get_trade_hist_interval(stocks[0][0])
+            panel = stf.get_stock_hist_panel(date_start, stocks=stocks)
+            if panel is None:
+                return False
+            self._publish(panel)
+            return True
+
+    def refresh(self):
+        """增量刷新：只读取面板最后一个交易日(含，盘中数据会被收盘数据覆盖)之后的数据并合并"""
+        with self._lock:
+            if self.panel is None or len(self.panel.dates) == 0:
+                return self.load()
+            stocks = stf.get_stock_code_name()
+            if stocks is None:
+                return False
+            date_start, is_cache = trd.get_trade_hist_interval(stocks[0][0])
+            new = stf.get_stock_hist_panel(str(self.panel.dates[-1]), stocks=stocks)
+            self._publish(market_panel.merge(self.panel, new, stocks=stocks, date_start=date_start))
+            return True
+
+    def get_spec(self, date=None, version=None):
+        with self._lock:
+            # 客户端的股票快照日期比面板新，说明当日行情已入库，先增量刷新
+            if date is not None and (self.panel is None or str(self.panel.date) != str(date)):
+                self.refresh()
+            if self._shared is None:
+                return None
+            if version == self.version:
+                return {'version': self.version}
+            return dict(self._shared.spec, version=self.version)
+
+    def handle(self, conn):
+        try:
+            with conn:
+                request = conn.recv()
+                cmd = request.get('cmd')
+                if cmd == 'get':
+                    conn.send(self.get_spec(request.get('date'), request.get('version')))
+                elif cmd == 'refresh':
+                    conn.send({'ok': self.refresh(), 'version': self.version})
+                else:
+                    conn.send(None)
+        except Exception as e:
+            logger.error(f"panel_server.handle处理异常：{e}")
+
+    def serve_forever(self):
+        authkey = get_authkey(create=True)
+        if authkey is None:
+            raise RuntimeError(f"无法读取或生成连接认证口令：{authkey_file}")
+        with Listener(get_address(), authkey=authkey) as listener:
+            logger.info(f"panel_server监听{get_address()}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    logger.error(f"panel_server.serve_forever处理异常：{e}")
+                    continue
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def close(self):
+        with self._lock:
+            for shared in (self._retired, self._shared):
+                if shared is not None:
+                    shared.close()
+            self._retired = None
+            self._shared = None
+
+
+def _request(request):
+    if os.environ.get('PANEL_SERVER', '').lower() == 'off':
+        return None
+    authkey = get_authkey()
+    if authkey is None:
+        # 没有口令说明服务从未在本机启动过
+        return None
+    try:
+        with Client(get_address(), authkey=authkey) as conn:
+            conn.send(request)
+            return conn.recv()
+    except (ConnectionError, OSError):
+        # 服务未启动，由调用方回退到直接读数据库
+        return None
+    except Exception as e:
+        logger.error(f"panel_server._request处理异常：{e}")
+    return None
+
+
+_client_panel = None
+_client_date = None  # get_day_panel 最近一次取得面板时的交易日
+_client_lock = threading.Lock()
+
+
+def get_panel(date=None):
+    """
+    从行情数据服务取得共享内存中的全市场面板（只读），同一版本在进程内复用
+
+    Args:
+        date: 股票快照日期，服务端面板比它旧时先增量刷新
+
+    Returns:
+        market_panel，服务不可用时返回None
+    """
+    global _client_panel
+    with _client_lock:
+        version = None if _client_panel is None else _client_panel.shared_spec['version']
+        spec = _request({'cmd': 'get', 'date': date, 'version': version})
+        if spec is None:
+            return None
+        if 'shm' not in spec:
+            return _client_panel
+        try:
+            _client_panel = attach_panel(spec)
+        except Exception as e:
+            logger.error(f"panel_server.get_panel处理异常：{e}")
+            return None
+        return _client_panel
+
+
+def get_day_panel(date):
+    """
+    按交易日缓存的 get_panel：同一交易日内直接复用进程中已映射的面板，不再逐次与服务通信，供web等逐请求取数的场景使用
+
+    Args:
+        date: 请求的交易日，与上一次不同时才向服务取得最新版本
+
+    Returns:
+        market_panel，服务不可用时返回None
+    """
+    global _client_date
+    date = str(date)
+    with _client_lock:
+        if _client_panel is not None and _client_date == date:
+            return _client_panel
+    panel = get_panel()
+    if panel is not None:
+        with _client_lock:
+            _client_date = date
+    return panel
+
+
+def refresh():
+    """每日行情入库后通知服务增量刷新，服务未启动时忽略"""
+    result = _request({'cmd': 'refresh'})
+    return result is not None and result.get('ok', False)
+
+
+def main():
+    server = panel_server()
+    try:
+        server.load()
+        server.serve_forever()
+    finally:
+        server.close()
+
+
+# main函数入口
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+from instock.lib.simple_logger import get_logger
+
+# 获取logger
+logger = get_logger(__name__)
+
+import datetime
+import instock.core.tablestructure as tbs
+import instock.core.stockfetch as stf
+import instock.lib.trade_time as trd
+import instock.core.pattern.pattern_recognitions as kpr
+from instock.lib.database_factory import execute_sql, read_sql_to_df
+
+__author__ = 'myh '
+__date__ = '2026/10/16 '
+
+# K线形态出现记录：在ClickHouse的全部日K线历史上识别每只股票每天的形态，只存非0信号的长表，
+#   表按 (pattern, date, code) 排序，"某形态最近N天出现的股票"、"形态每年出现次数"这类查询只读取索引命中的一小段。
+#   识别口径与日常形态作业一致(每根K线只用截至当日的最后 CALC_THRESHOLD 根K线)。
+# 回填按年分段读取历史，每段向前多读 OVERLAP_DAYS 天，保证段首的K线也有完整的计算窗口。
+
+TABLE_NAME = tbs.TABLE_CN_STOCK_PATTERN_OCCURRENCE['name']
+CALC_THRESHOLD = 12
+OVERLAP_DAYS = 60
+
+CREATE_TABLE_SQL = f'''
+    CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+        pattern LowCardinality(String),
+        date Date,
+        code String,
+        signal Int16
+    ) ENGINE = ReplacingMergeTree()
+    PARTITION BY toYear(date)
+    ORDER BY (pattern, date, code)
+    SETTINGS index_granularity = 8192
+'''
+
+
+def create_table():
+    return execute_sql(CREATE_TABLE_SQL.strip())
+
+
+def _to_date(date):
+    if isinstance(date, datetime.datetime):
+        return date.date()
+    if isinstance(date, datetime.date):
+        return date
+    date = str(date).replace('-', '')
+    return datetime.date(int(date[0:4]), int(date[4:6]), int(date[6:8]))
+
+
+def scan(date_start, date_end=None):
+    """识别 [date_start, date_end] 内的形态出现记录"""
+    date_start = _to_date(date_start)
+    load_start = (date_start - datetime.timedelta(days=OVERLAP_DAYS)).strftime("%Y%m%d")
+    load_end = None if date_end is None else _to_date(date_end).strftime("%Y%m%d")
+    panel = stf.get_stock_hist_panel(load_start, load_end, fields=kpr.OHLC_FIELDS)
+    if panel is None:
+        return None
+    data = kpr.scan_patterns_history(panel, tbs.STOCK_KLINE_PATTERN_DATA['columns'],
+                                     calc_threshold=CALC_THRESHOLD, date_start=date_start)
+    if data is None:
+        return None
+    data['date'] = data['date'].values.astype('datetime64[D]').astype(object)
+    return data
+
+
+def save(data, date_start, date_end=None):
+    """整段替换 [date_start, date_end] 的记录，重复回填同一区间结果不变"""
+    from instock.lib.clickhouse_client import create_clickhouse_client
+    where = f"`date` >= '{_to_date(date_start)}'"
+    if date_end is not None:
+        where = f"{where} AND `date` <= '{_to_date(date_end)}'"
+    execute_sql(f"DELETE FROM `{TABLE_NAME}` WHERE {where}")
+    if data is None or len(data.index) == 0:
+        return True
+    with create_clickhouse_client() as client:
+        return client.batch_insert_dataframe(TABLE_NAME, data[['pattern', 'date', 'code', 'signal']], 100000)
+
+
+def get_history_start():
+    # 空表上ClickHouse的min(date)返回1970-01-01而不是NULL，先按count()判断
+    data = read_sql_to_df("SELECT count() AS cnt, min(`date`) AS `date` FROM cn_stock_history")
+    if data is None or len(data.index) == 0 or int(data.iloc[0]['cnt']) == 0:
+        return None
+    return _to_date(data.iloc[0]['date'])
+
+
+def get_last_date():
+    data = read_sql_to_df(f"SELECT count() AS cnt, max(`date`) AS `date` FROM {TABLE_NAME}")
+    if data is None or len(data.index) == 0 or int(data.iloc[0]['cnt']) == 0:
+        return None
+    return _to_date(data.iloc[0]['date'])
+
+
+def backfill(date_start=None, date_end=None):
+    """
+    回填形态出现记录，按年分段读取、识别、写入
+
+    Args:
+        date_start: 开始日期，默认ClickHouse中最早的日K线日期
+        date_end: 结束日期，默认到最新
+    """
+    try:
+        create_table()
+        date_start = get_history_start() if date_start is None else _to_date(date_start)
+        if date_start is None:
+            return
+        date_end = datetime.date.today() if date_end is None else _to_date(date_end)
+        seg_start = date_start
+        while seg_start <= date_end:
+            seg_end = min(datetime.date(seg_start.year, 12, 31), date_end)
+            data = scan(seg_start, seg_end)
+            if data is not None:
+                save(data, seg_start, seg_end)
+                logger.info(f"pattern_occurrence回填{seg_start}至{seg_end}：{len(data.index)}条")
+            seg_start = seg_end + datetime.timedelta(days=1)
+    except Exception as e:
+        logger.error(f"pattern_occurrence.backfill处理异常：{e}")
+
+
+def update():
+    """
+    增量更新：从表中最后一天之后开始识别。
+    表为空时只识别最近一个交易日，全部历史的回填耗时长，只由作业的 all 参数显式执行，不在日常任务中进行
+    """
+    last = get_last_date()
+    if last is None:
+        last_date = trd.get_trade_date_last()[0]
+        logger.warning(f"pattern_occurrence.update形态出现记录表为空，只识别{last_date}，"
+                       f"回填全部历史请执行 klinepattern_occurrence_job.py all")
+        backfill(last_date, last_date)
+    else:
+        backfill(last + datetime.timedelta(days=1))
+
+
+def get_pattern_stocks(pattern, days=20, date=None):
+    """
+    最近days个交易日内出现pattern形态的股票
+
+    Args:
+        pattern: 形态列名，见 tbs.STOCK_KLINE_PATTERN_DATA
+        days: 交易日数
+        date: 截止日期，默认表中最后一天
+
+    Returns:
+        DataFrame，列为 pattern、date、code、signal，按日期倒序
+    """
+    try:
+        date_end = get_last_date() if date is None else _to_date(date)
+        if date_end is None:
+            return None
+        date_start = trd.get_trade_date_before(date_end, days)
+        sql = (f"SELECT `pattern`, `date`, `code`, `signal` FROM {TABLE_NAME} "
+               f"WHERE `pattern` = %(pattern)s AND `date` >= %(date_start)s AND `date` <= %(date_end)s "
+               f"ORDER BY `date` DESC, `code`")
+        return read_sql_to_df(sql, {'pattern': pattern, 'date_start': str(date_start), 'date_end': str(date_end)})
+    except Exception as e:
+        logger.error(f"pattern_occurrence.get_pattern_stocks处理异常：{e}")
+    return None
+
+
+def get_pattern_frequency(pattern=None, date_start=None, date_end=None):
+    """
+    形态每年出现次数
+
+    Returns:
+        DataFrame，列为 pattern、year、total、bullish(信号>0)、bearish(信号<0)
+    """
+    try:
+        where = []
+        params = {}
+        if pattern is not None:
+            where.append("`pattern` = %(pattern)s")
+            params['pattern'] = pattern
+        if date_start is not None:
+            where.append("`date` >= %(date_start)s")
+            params['date_start'] = str(_to_date(date_start))
+        if date_end is not None:
+            where.append("`date` <= %(date_end)s")
+            params['date_end'] = str(_to_date(date_end))
+        where = f" WHERE {' AND '.join(where)}" if where else ""
+        sql = (f"SELECT `pattern`, toYear(`date`) AS `year`, count() AS `total`, "
+               f"countIf(`signal` > 0) AS `bullish`, countIf(`signal` < 0) AS `bearish` FROM {TABLE_NAME}{where} "
+               f"GROUP BY `pattern`, `year` ORDER BY `pattern`, `year`")
+        return read_sql_to_df(sql, params if params else None)
+    except Exception as e:
+        logger.error(f"pattern_occurrence.get_pattern_frequency处理异常：{e}")
+    return None
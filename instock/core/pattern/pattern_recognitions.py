@@ -1,7 +1,15 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+from instock.lib.simple_logger import get_logger
 
+# 获取logger
+logger = get_logger(__name__)
+
+import numpy as np
+import pandas as pd
+import talib.abstract as tla
+from instock.core.market_panel import to_datetime64
 
 __author__ = 'myh '
 __date__ = '2023/3/24 '
@@ -69,3 +77,147 @@ def get_pattern_recognition(code_name, data, stock_column, date=None, calc_thres
         logger.error(f"pattern_recognitions.get_pattern_recognition处理异常：{code}代码{e}")
 
     return None
+
+
+OHLC_FIELDS = ('open', 'high', 'low', 'close')
+SCAN_CHUNK_SIZE = 1024
+
+
+def _lookback(func):
+    # 形态函数需要的前置K线数，输出下标小于它的位置恒为0
+    return tla.Function(func.__name__).lookback
+
+
+def _scan_rows(window, counts, rows, stock_column, lookbacks, out, errors):
+    """
+    把若干只股票的有效K线首尾相接成一条序列，每个形态函数只调用一次，取每只股票最后一根K线的输出
+
+    形态函数在某根K线的输出只取决于它之前lookback根K线，前一只股票的K线不会进入本股的计算窗口，
+    本股K线数不超过lookback时逐股计算的结果为0，这里同样置0。
+    """
+    length = window['close'].shape[1]
+    sizes = counts[rows]
+    keep = np.arange(length)[None, :] >= (length - sizes)[:, None]
+    series = [np.ascontiguousarray(window[f][rows][keep]) for f in OHLC_FIELDS]
+    last = np.cumsum(sizes) - 1
+    for j, (k, v) in enumerate(stock_column.items()):
+        if k in errors:
+            continue
+        try:
+            signal = v['func'](*series)[last]
+            signal[sizes <= lookbacks[j]] = 0
+            out[rows, j] = signal
+        except Exception as e:
+            errors[k] = e
+
+
+def scan_patterns_panel(panel, stock_column, date=None, calc_threshold=12, chunk_size=SCAN_CHUNK_SIZE):
+    """
+    全市场批量识别K线形态，结果与逐股调用 get_pattern_recognition 一致
+
+    Args:
+        panel: market_panel
+        stock_column: 形态列定义，同 tbs.STOCK_KLINE_PATTERN_DATA['columns']
+        date: 识别日期，默认取面板最后一个交易日
+        calc_threshold: 每只股票参与计算的K线数量
+        chunk_size: 每次拼接计算的股票数
+
+    Returns:
+        稀疏的DataFrame，列为 code、pattern、signal，只含信号非0的形态
+    """
+    try:
+        if date is None:
+            end_date = str(panel.dates[-1]) if len(panel.dates) > 0 else panel.date
+        else:
+            end_date = date.strftime("%Y-%m-%d")
+        window, counts, _ = panel.window(calc_threshold, end_date, fields=OHLC_FIELDS)
+        names = list(stock_column)
+        lookbacks = [_lookback(v['func']) for v in stock_column.values()]
+        out = np.zeros((len(panel), len(names)), dtype=np.int32)
+        errors = {}
+
+        calc = counts > 1
+        # 窗口内有缺失值的股票逐只计算，避免缺失值在拼接序列中影响相邻股票
+        ohlc_nan = np.zeros(len(panel), dtype=bool)
+        for f in OHLC_FIELDS:
+            ohlc_nan |= np.isnan(window[f]).sum(axis=1) > (calc_threshold - counts)
+        batch = np.flatnonzero(calc & ~ohlc_nan)
+        for i in range(0, len(batch), chunk_size):
+            _scan_rows(window, counts, batch[i:i + chunk_size], stock_column, lookbacks, out, errors)
+        for i in np.flatnonzero(calc & ohlc_nan):
+            _scan_rows(window, counts, np.array([i]), stock_column, lookbacks, out, errors)
+
+        for k, e in errors.items():
+            logger.error(f"pattern_recognitions.scan_patterns_panel处理异常：{k}形态{e}")
+
+        rows, cols = np.nonzero(out)
+        return pd.DataFrame({'code': panel.codes[rows],
+                             'pattern': np.asarray(names, dtype=object)[cols],
+                             'signal': out[rows, cols]})
+    except Exception as e:
+        logger.error(f"pattern_recognitions.scan_patterns_panel处理异常：{e}")
+    return None
+
+
+def scan_patterns_history(panel, stock_column, calc_threshold=12, date_start=None, chunk_size=SCAN_CHUNK_SIZE):
+    """
+    识别面板内每只股票每根K线的形态，某根K线的结果与以它为识别日期逐股调用 get_pattern_recognition 一致
+    (开高低收有缺失的K线不参与计算，计算窗口内含这类K线时结果可能不同)
+
+    Args:
+        panel: market_panel
+        stock_column: 形态列定义，同 tbs.STOCK_KLINE_PATTERN_DATA['columns']
+        calc_threshold: 每根K线参与计算的K线数量，前置K线数不少于它的形态在日常作业中恒为0，这里同样跳过
+        date_start: 只输出不早于该日期的K线
+        chunk_size: 每次拼接计算的股票数
+
+    Returns:
+        稀疏的DataFrame，列为 pattern、date、code、signal，只含信号非0的记录
+    """
+    try:
+        # 开高低收有缺失的K线跳过(同停牌处理)，否则缺失值会经形态函数的滚动均值污染之后所有K线
+        valid = panel.valid
+        for f in OHLC_FIELDS:
+            valid = valid & ~np.isnan(panel.fields[f])
+        counts = valid.sum(axis=1)
+        first_col = 0 if date_start is None else int(np.searchsorted(panel.dates, to_datetime64(date_start)))
+        items = [(k, v['func'], _lookback(v['func'])) for k, v in stock_column.items()]
+        items = [item for item in items if item[2] < calc_threshold]
+        errors = {}
+        out = []
+        rows_all = np.flatnonzero(counts > 1)
+        for i in range(0, len(rows_all), chunk_size):
+            rows = rows_all[i:i + chunk_size]
+            sizes = counts[rows]
+            compact = np.argsort(~valid[rows], axis=1, kind='stable')
+            keep = np.arange(compact.shape[1])[None, :] < sizes[:, None]
+            cols = compact[keep]
+            row_of = np.repeat(rows, sizes)
+            # 每根K线在该股有效K线中的序号
+            k_of = np.arange(len(cols)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            series = [np.ascontiguousarray(panel.fields[f][row_of, cols]) for f in OHLC_FIELDS]
+            out_range = cols >= first_col
+            for name, func, lookback in items:
+                if name in errors:
+                    continue
+                try:
+                    signal = func(*series)
+                except Exception as e:
+                    errors[name] = e
+                    continue
+                hit = np.flatnonzero((signal != 0) & (k_of >= max(lookback, 1)) & out_range)
+                if len(hit) > 0:
+                    out.append(pd.DataFrame({'pattern': name,
+                                             'date': panel.dates[cols[hit]],
+                                             'code': panel.codes[row_of[hit]],
+                                             'signal': signal[hit].astype(np.int16)}))
+
+        for k, e in errors.items():
+            logger.error(f"pattern_recognitions.scan_patterns_history处理异常：{k}形态{e}")
+
+        if not out:
+            return pd.DataFrame(columns=['pattern', 'date', 'code', 'signal'])
+        return pd.concat(out, ignore_index=True)
+    except Exception as e:
+        logger.error(f"pattern_recognitions.scan_patterns_history处理异常：{e}")
+    return None
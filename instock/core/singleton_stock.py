@@ -5,12 +5,14 @@ from instock.lib.simple_logger import get_logger
 # 获取logger
 logger = get_logger(__name__)
 
-import time
-
-import concurrent.futures
+import math
+import threading
 import instock.core.stockfetch as stf
+import instock.core.panel_server as psv
 import instock.core.tablestructure as tbs
 import instock.lib.trade_time as trd
+import instock.lib.run_template as runt
+from instock.core.market_panel import select_fields
 from instock.lib.singleton_type import singleton_type
 
 __author__ = 'myh '
@@ -29,60 +31,156 @@ class stock_data(metaclass=singleton_type):
         return self.data
 
 
-# 读取股票历史数据
+# 历史数据的使用方登记：名称 -> (所需K线根数, 所需字段)，根数为None表示需要完整的3年数据
+#   各作业模块导入时登记，stock_hist_data 按所有使用方的并集只读取一次，各使用方再按自己的窗口截取
+HIST_CONSUMERS = {}
+# 停牌会使同样多的交易日里有效K线变少，读取时按比例多留一些交易日
+LOOKBACK_MARGIN = 1.25
+LOOKBACK_MARGIN_DAYS = 10
+
+
+def declare_hist(name, lookback, fields=None):
+    """
+    登记历史数据使用方
+
+    Args:
+        name: 使用方名称，重复登记时覆盖
+        lookback: 计算一个交易日所需的K线根数，None表示完整的3年数据
+        fields: 所需字段，None表示全部字段
+    """
+    HIST_CONSUMERS[name] = (lookback, None if fields is None else tuple(fields))
+
+
+def lookback_days(lookback):
+    """K线根数换算为需要读取的交易日数(含停牌余量)"""
+    if lookback is None:
+        return None
+    return int(math.ceil(lookback * LOOKBACK_MARGIN)) + LOOKBACK_MARGIN_DAYS
+
+
+def hist_requirement():
+    """所有使用方的并集：(最大K线根数, 字段)，没有登记时为完整的3年全部字段"""
+    if not HIST_CONSUMERS:
+        return None, None
+    lookbacks = [v[0] for v in HIST_CONSUMERS.values()]
+    lookback = None if None in lookbacks else max(lookbacks)
+    fields = [v[1] for v in HIST_CONSUMERS.values()]
+    fields = None if None in fields else select_fields(set().union(*fields))
+    return lookback, fields
+
+
+# 读取股票历史数据：进程内只读取一次，覆盖所有作业日期所需的窗口，各交易日通过 as_of 取截至当日的快照视图
 class stock_hist_data(metaclass=singleton_type):
     def __init__(self, date=None, stocks=None, workers=16):
+        self.is_all = stocks is None
         if stocks is None:
             stocks = stf.get_stock_code_name()  # 不再传递date参数，使用最大date
             # _subset = stock_data(date).get_data()[list(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns'])]
             # stocks = [tuple(x) for x in _subset.values()]
+        self.stocks = stocks
+        self.panel = None
+        self.data = None
+        self.date_start = None
+        self._views = {}
+        self._snapshots = {}
+        self._lock = threading.RLock()
         if stocks is None:
-            self.data = None
             return
-        date_start, is_cache = trd.get_trade_hist_interval(stocks[0][0])  # 提高运行效率，只运行一次
-        stock_codes = [stock[1] for stock in stocks]
+        # 窗口从最早的作业日期(区间作业取命令行的开始日期)往前取所有使用方所需K线根数的并集
+        anchor = stocks[0][0]
+        for d in (date, runt.get_args_start_date()):
+            if d is not None and str(d)[0:10] < anchor:
+                anchor = str(d)[0:10]
+        date_start = self._date_start(anchor)  # 提高运行效率，只运行一次
         try:
-            # DEBUG BELOW
-            now = time.time()
-            print(f"Read db:{now}")
-            db_data = stf.get_stock_hist_from_db(date_start)
-            print(f"End seconds:{time.time()-now}")
-            self.data = self.batch_fetch_stock_hist_optimized(stock_codes, date_start, db_data, stocks)
-           
-            # max_workers是None还是没有给出，将默认为机器cup个数*5
-            #print(f"stock_hist_data: 开始多线程获取股票历史数据，线程数{workers}，股票数{len(stocks)}")
-            #_data = {}
-            #with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
-            #    future_to_stock = {executor.submit(stf.fetch_stock_hist, stock, date_start, is_cache, db_data): stock for stock
-            #                       in stocks}
-            #    for future in concurrent.futures.as_completed(future_to_stock):
-            #        stock = future_to_stock[future]
-            #        try:
-            #            __data = future.result()
-            #            if __data is not None:
-            #                _data[stock] = __data
-            #        except Exception as e:
-            #            logger.error(f"singleton.stock_hist_data处理异常：{stock[1]}代码{e}")
+            # 优先映射行情数据服务共享内存中的面板，服务未启动时全市场数据只读取一次，存为 代码×交易日 的二维数组面板
+            panel = psv.get_panel(stocks[0][0])
+            if panel is not None and len(panel.dates) > 0 and str(panel.dates[0]).replace('-', '') <= date_start:
+                if not self.is_all:
+                    panel = panel.view(codes=[s[1] for s in stocks])
+                self._set_panel(panel, str(panel.dates[0]).replace('-', ''))
+            else:
+                self._load(date_start)
         except Exception as e:
             logger.exception(f"singleton.stock_hist_data处理异常：{e}")
-    def batch_fetch_stock_hist_optimized(self, stock_codes, date_start, cached_data, stocks):
-        """更高效的批量处理版本"""
-        if cached_data is None or cached_data.empty:
-            return {}
-        stock_mapping = {stock[1]: stock for stock in stocks}
-        result = {}
-        print(f"Batch processing {len(stock_codes)} stocks")
-        # 按code分组，每组就是一个股票的完整数据
-        grouped = cached_data.groupby('code')
-    
-        for full_code, group_data in grouped:
-            # 提取股票代码后缀进行匹配
-            code_suffix = full_code.split('.')[-1] if '.' in full_code else full_code
-            if code_suffix in stock_mapping:
-                result[stock_mapping[code_suffix]] = group_data
-        print(f"Batch processing completed, found {len(result)} matching stocks")
-
-        return result
 
-    def get_data(self):
-        return self.data
+    @staticmethod
+    def _date_start(date):
+        lookback, fields = hist_requirement()
+        date_start, is_cache = trd.get_trade_hist_interval(str(date)[0:10], lookback_days(lookback))
+        return date_start
+
+    def _load(self, date_start):
+        lookback, fields = hist_requirement()
+        panel = stf.get_stock_hist_panel(date_start, stocks=self.stocks, fields=fields)
+        self._set_panel(panel, date_start)
+
+    def _set_panel(self, panel, date_start):
+        self.panel = panel
+        self.date_start = date_start
+        self._views = {}
+        self._snapshots = {}
+        # 兼容按 (date, code, name) 取单只股票DataFrame的调用方，访问时才生成
+        self.data = None if panel is None else panel.frames()
+
+    def ensure(self, date):
+        """已读取的窗口不够计算date时(如程序内调用更早的日期)，从更早的日期重新读取"""
+        if date is None or self.stocks is None:
+            return
+        with self._lock:
+            date_start = self._date_start(date)
+            if self.date_start is None or date_start < self.date_start:
+                logger.info(f"singleton.stock_hist_data历史数据从{date_start}重新读取")
+                try:
+                    self._load(date_start)
+                except Exception as e:
+                    logger.exception(f"singleton.stock_hist_data.ensure处理异常：{e}")
+
+    def as_of(self, date):
+        """
+        截至date的快照视图(不复制数据)，按交易日二分查找定位，同一日期复用
+
+        Returns:
+            market_panel，股票键中的日期为date；没有数据时返回None
+        """
+        if self.panel is None:
+            return None
+        key = str(date)[0:10]
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is None:
+                snapshot = self.panel.view(end_date=date)
+                snapshot.date = key
+                snapshot.root = self.panel
+                self._snapshots[key] = snapshot
+        return snapshot
+
+    def get_data(self, date=None):
+        if date is None:
+            return self.data
+        snapshot = self.as_of(date)
+        return None if snapshot is None else snapshot.frames()
+
+    def get_panel(self, lookback=None, fields=None):
+        """
+        取历史面板，给出lookback/fields时返回截取后的视图(不复制数据)
+
+        Args:
+            lookback: K线根数，按 lookback_days 换算为最近的交易日数
+            fields: 需要的字段
+        """
+        if self.panel is None or (lookback is None and fields is None):
+            return self.panel
+        key = (lookback, None if fields is None else tuple(fields))
+        view = self._views.get(key)
+        if view is None:
+            view = self.panel.view(lookback=lookback_days(lookback), fields=fields)
+            self._views[key] = view
+        return view
+
+
+def get_stock_hist_data(date=None):
+    """取覆盖date所需窗口的历史数据，区间作业的各个日期共用一次读取"""
+    hist = stock_hist_data(date=date)
+    hist.ensure(date)
+    return hist
@@ -197,24 +197,26 @@ class stock_web_module_data(metaclass=singleton_type):
             ico="fa fa-indent",
             name=tbs.TABLE_CN_STOCK_INDICATORS_BUY['cn'],
             table_name=tbs.TABLE_CN_STOCK_INDICATORS_BUY['name'],
-            columns=tuple(tbs.TABLE_CN_STOCK_INDICATORS_BUY['columns']),
-            column_names=tbs.get_field_cns(tbs.TABLE_CN_STOCK_INDICATORS_BUY['columns']),
+            columns=tuple(tbs.TABLE_CN_STOCK_SIGNAL_VIEW_COLUMNS),
+            column_names=tbs.get_field_cns(tbs.TABLE_CN_STOCK_SIGNAL_VIEW_COLUMNS),
             primary_key=[],
             is_realtime=False,
             order_columns=f"(SELECT `datetime` FROM `{tbs.TABLE_CN_STOCK_ATTENTION['name']}` WHERE `code`=`{tbs.TABLE_CN_STOCK_INDICATORS_BUY['name']}`.`code`) AS `cdatetime`",
-            order_by=" code"
+            order_by=" code",
+            rates=True
         ), wmd.web_module_data(
             mode="query",
             type="股票指标数据",
             ico="fa fa-indent",
             name=tbs.TABLE_CN_STOCK_INDICATORS_SELL['cn'],
             table_name=tbs.TABLE_CN_STOCK_INDICATORS_SELL['name'],
-            columns=tuple(tbs.TABLE_CN_STOCK_INDICATORS_SELL['columns']),
-            column_names=tbs.get_field_cns(tbs.TABLE_CN_STOCK_INDICATORS_SELL['columns']),
+            columns=tuple(tbs.TABLE_CN_STOCK_SIGNAL_VIEW_COLUMNS),
+            column_names=tbs.get_field_cns(tbs.TABLE_CN_STOCK_SIGNAL_VIEW_COLUMNS),
             primary_key=[],
             is_realtime=False,
             order_columns=f"(SELECT `datetime` FROM `{tbs.TABLE_CN_STOCK_ATTENTION['name']}` WHERE `code`=`{tbs.TABLE_CN_STOCK_INDICATORS_SELL['name']}`.`code`) AS `cdatetime`",
-            order_by=" code"
+            order_by=" code",
+            rates=True
         ), wmd.web_module_data(
             mode="query",
             type="股票K线形态",
@@ -299,14 +301,30 @@ class stock_web_module_data(metaclass=singleton_type):
                     ico="fa fa-check-square-o",
                     name=table['cn'],
                     table_name=table['name'],
-                    columns=tuple(table['columns']),
-                    column_names=tbs.get_field_cns(table['columns']),
+                    columns=tuple(tbs.TABLE_CN_STOCK_SIGNAL_VIEW_COLUMNS),
+                    column_names=tbs.get_field_cns(tbs.TABLE_CN_STOCK_SIGNAL_VIEW_COLUMNS),
                     primary_key=[],
                     is_realtime=False,
                     order_columns=f"(SELECT `datetime` FROM `{tbs.TABLE_CN_STOCK_ATTENTION['name']}` WHERE `code`=`{table['name']}`.`code`) AS `cdatetime`",
-                    order_by=" code"
+                    order_by=" code",
+                    rates=True
                 )
             )
+        self.data_list.append(
+            wmd.web_module_data(
+                mode="query",
+                type="股票策略数据",
+                ico="fa fa-bar-chart",
+                name=tbs.TABLE_CN_STOCK_STRATEGY_SUMMARY['cn'],
+                table_name=tbs.TABLE_CN_STOCK_STRATEGY_SUMMARY['name'],
+                columns=tuple(tbs.TABLE_CN_STOCK_STRATEGY_SUMMARY['columns']),
+                column_names=tbs.get_field_cns(tbs.TABLE_CN_STOCK_STRATEGY_SUMMARY['columns']),
+                primary_key=[],
+                is_realtime=False,
+                order_by=" `date` DESC, `strategy`",
+                date_filter=False
+            )
+        )
 
         for tmp in self.data_list:
             _data[tmp.table_name] = tmp
@@ -24,6 +24,7 @@ import instock.core.crawling.stock_chip_race as scr
 import instock.core.crawling.stock_limitup_reason as slr
 from instock.core.proxy_pool import get_proxy
 from instock.core.tablestructure import TABLE_CN_STOCK_SPOT
+import instock.core.hist_cache as hic
 from instock.lib.simple_logger import get_logger
 
 __author__ = 'myh '
@@ -34,9 +35,7 @@ logger = get_logger(__name__)
 
 # 设置基础目录，每次加载使用。
 cpath_current = os.path.dirname(os.path.dirname(__file__))
-stock_hist_cache_path = os.path.join(cpath_current, 'cache', 'hist')
-if not os.path.exists(stock_hist_cache_path):
-    os.makedirs(stock_hist_cache_path)  # 创建多个文件夹结构。
+stock_hist_cache_path = hic.cache_path  # 日K线本地列式缓存目录，见 hist_cache
 
 
 # 600 601 603 605开头的股票是上证A股
@@ -388,6 +387,12 @@ def fetch_stock_hist(data_base, date_start=None, cached_data=None):
         if cached_data is not None:
             data = cached_data.loc[cached_data['code'].str.endswith(code)]
         else:
+            # 行情数据服务可用时直接从共享内存面板取，不再逐次查询数据库；面板按交易日缓存，同一交易日内不再访问服务
+            from instock.core.panel_server import get_day_panel
+            panel = get_day_panel(date)
+            data = None if panel is None else panel.frame(code)
+            if data is not None and len(data.index) > 0:
+                return data[data['date'] >= datetime.datetime.strptime(date_start, "%Y%m%d").date()]
             data = get_stock_hist_from_db(date_start, code=code)
             print(f"fetch_stock_hist: 从数据库获取股票{code}历史数据，结果数量：{len(data) if data is not None else 0}")
         print(f"fetch_stock_hist: 完成股票{code}历史数据获取")
@@ -437,58 +442,75 @@ def stock_hist_cache(code, date_start, date_end=None, is_cache=True, adjust='',
 
 def get_stock_hist_from_db(date_start, date_end=None, code=None):
     from instock.lib.clickhouse_client import create_clickhouse_client
-    # date_start = convert_date_format(date_start)
-    # date_end = convert_date_format(date_end)
     columns = ["code","date","open","high","low","close","preclose","volume","amount","turn","p_change"]
-    
+
     with create_clickhouse_client() as client:
-        stock = client.get_stock_data(code, date_start, date_end, order_by="date ASC", columns=columns)
-        if stock is not None and not stock.empty:
-            stock = stock[columns]
-            
-            # 确保所有数值列为float类型，避免Decimal和序列化问题
-            numeric_columns = ["open","high","low","close","preclose","volume","amount","turn","p_change"]
-            for col in numeric_columns:
-                if col in stock.columns:
-                    try:
-                        stock[col] = stock[col].astype(float)
-                    except:
-                        pass
-        
-    #from instock.lib.database import query_history_data_by_date_range
-    # stock = query_history_data_by_date_range(
-    #     date_start, date_end, 
-    #     columns=columns,
-    #     where_extra=f" code = %s" if code else "",
-    #     params=(code,) if code else None
-    # )
-    
-    # 将结果列的turn修改为turnover，和CN_STOCK_HIST_DATA保持一致
-    stock.rename(columns={"turn": "turnover"}, inplace=True)
-    
-    if stock is None or len(stock.index) == 0:
-        return None
-        
-    # 计算生成新列
-    stock["ups_downs"] = stock["close"] - stock["preclose"]  # 涨跌额：收盘价-昨收价
-    # stock["new_price"] = stock["close"]
+        # Arrow列式读取，数值列在SQL中已转为Float64，无需逐列处理Decimal
+        table = client.get_stock_data_arrow(code, date_start, date_end, columns=columns)
+        if table is not None:
+            if table.num_rows == 0:
+                return None
+            values = {c: table[c].to_numpy() for c in columns if c not in ('code', 'date')}
+            dates = table['date'].to_pylist()
+            codes = table['code'].to_pylist()
+        else:
+            stock = client.get_stock_data(code, date_start, date_end, order_by="date ASC", columns=columns)
+            if stock is None or len(stock.index) == 0:
+                return None
+            values = {c: np.asarray(stock[c].values, dtype=np.float64) for c in columns if c not in ('code', 'date')}
+            dates = stock['date'].values
+            codes = stock['code'].values
+
+    preclose = values['preclose']
     # 规避preclose为0的情况，避免除零错误
-    # 确保相关列为float64类型，避免数据类型不兼容问题
-    stock["high"] = stock["high"].astype(float)
-    stock["low"] = stock["low"].astype(float)
-    stock["preclose"] = stock["preclose"].astype(float)
-    
-    stock["amplitude"] = 0.0  # 初始化为0
-    mask = stock["preclose"] != 0  # 创建非零掩码
-    stock.loc[mask, "amplitude"] = (stock.loc[mask, "high"] - stock.loc[mask, "low"]) / stock.loc[mask, "preclose"] * 100  # 振幅百分比
-
-    # 只选择 CN_STOCK_HIST_DATA 需要的列
-    expected_columns = list(tbs.CN_STOCK_HIST_DATA['columns'].keys())
-    expected_columns.append('code')
-    result_stock = stock[expected_columns]
-    result_stock = result_stock.sort_index()  # 将数据按照日期排序下。
-    print("Finished rearranging and renaming to match CN_STOCK_HIST_DATA structure.")
+    with np.errstate(divide='ignore', invalid='ignore'):
+        amplitude = np.where(preclose != 0, (values['high'] - values['low']) / preclose * 100, 0.0)  # 振幅百分比
+    # 列与 CN_STOCK_HIST_DATA 保持一致，将turn修改为turnover
+    result_stock = pd.DataFrame({'date': dates,
+                                 'open': values['open'],
+                                 'close': values['close'],
+                                 'high': values['high'],
+                                 'low': values['low'],
+                                 'volume': values['volume'],
+                                 'amount': values['amount'],
+                                 'amplitude': amplitude,
+                                 'p_change': values['p_change'],
+                                 'ups_downs': values['close'] - preclose,  # 涨跌额：收盘价-昨收价
+                                 'turnover': values['turn'],
+                                 'code': codes})
     return result_stock
+
+
+# 一次读取全市场历史数据并直接构建 代码×交易日 面板，不再按股票拆分DataFrame
+def get_stock_hist_panel(date_start, date_end=None, stocks=None, fields=None):
+    from instock.lib.clickhouse_client import create_clickhouse_client
+    from instock.core.market_panel import market_panel, select_fields
+    columns = ["code", "date", "open", "high", "low", "close", "preclose", "volume", "amount", "turn", "p_change"]
+    if fields is not None:
+        # 只读取需要的字段，数据库中换手率列名为turn
+        fields = select_fields(fields)
+        columns = ["code", "date"] + [c for c in columns[2:] if ('turnover' if c == 'turn' else c) in fields]
+    try:
+        # 优先读本地列式缓存(只从ClickHouse补读新增交易日)，缓存不可用时整段按Arrow列读数据库
+        table = hic.load_hist(date_start, date_end, columns=None if fields is None else columns)
+        stock = None
+        if table is None:
+            with create_clickhouse_client() as client:
+                table = client.get_stock_data_arrow(None, date_start, date_end, columns=columns)
+                if table is None:
+                    # 没有安装pyarrow或Arrow查询失败时逐行读取
+                    stock = client.get_stock_data(None, date_start, date_end, order_by="date ASC", columns=columns)
+        if table is not None:
+            return market_panel.from_arrow(table, stocks, fields=fields)
+        if stock is None or len(stock.index) == 0:
+            return None
+        stock.rename(columns={"turn": "turnover"}, inplace=True)
+        return market_panel.from_frame(stock, stocks, fields=fields)
+    except Exception as e:
+        logger.error(f"stockfetch.get_stock_hist_panel处理异常：{e}")
+    return None
+
+
 def get_stock_code_name(date=None):
     try:
         from instock.lib.database_factory import read_sql_to_df
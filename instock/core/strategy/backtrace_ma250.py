@@ -3,6 +3,7 @@
 
 import numpy as np
 import talib as tl
+from instock.core.strategy import strategy_panel
 from datetime import datetime, timedelta
 
 __author__ = 'myh '
@@ -103,3 +104,35 @@ def check(code_name, data, date=None, threshold=60):
         return False
 
     return True
+
+
+def check_panel(ctx, threshold=60, vol_ratio=2, back_ratio=0.8):
+    """check 的全市场面板实现，ctx 为 strategy_panel.strategy_context，返回按面板行的布尔掩码
+    vol_ratio 为最高价当日与回踩最低点成交量之比的下限，back_ratio 为回踩最低点与最高收盘价之比的上限"""
+    window = ctx.window(threshold, ('close', 'volume'))
+    ma250 = ctx.ma('close', 250, threshold)
+    close, volume, dates = window['close'], window['volume'], ctx.dates(threshold)
+    rows = np.arange(len(close))
+    # 区间最高点：第一次出现的最高收盘价；区间最低点：不创新高的K线中第一次出现的最低收盘价
+    new_high = close > strategy_panel.prev_high(close)
+    highest = np.argmax(np.where(np.isnan(close), -np.inf, close), axis=1)
+    candidate = np.where(new_high | np.isnan(close), np.inf, close)
+    lowest = np.argmin(candidate, axis=1)
+    has_lowest = candidate[rows, lowest] < 1000000
+    lowest_volume = np.where(has_lowest, volume[rows, lowest], 0)
+    highest_volume = volume[rows, highest]
+    # 前半段由年线以下向上突破
+    front = highest - 1
+    ok = ~((lowest_volume == 0) | (highest_volume == 0)) & (highest > 0)
+    ok &= (close[:, 0] < ma250[:, 0]) & (close[rows, front] > ma250[rows, front])
+    # 后半段必须在年线以上运行，近期低点为其中第一次出现的最低收盘价
+    end = np.arange(threshold)[None, :] >= highest[:, None]
+    ok &= ~(end & (close < ma250)).any(axis=1)
+    recent = np.argmin(np.where(end & ~np.isnan(close), close, np.inf), axis=1)
+    date_diff = (dates[rows, recent] - dates[rows, highest]).astype('timedelta64[D]').astype(np.int64)
+    ok &= (10 <= date_diff) & (date_diff <= 50)
+    # 回踩伴随缩量
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = highest_volume / volume[rows, recent]
+        back = close[rows, recent] / close[rows, highest]
+    return (ctx.total >= 250) & ok & (ratio > vol_ratio) & (back < back_ratio)
@@ -5,6 +5,7 @@ from datetime import datetime
 import numpy as np
 import talib as tl
 from instock.core.strategy import enter
+from instock.core.strategy import strategy_panel
 
 __author__ = 'myh '
 __date__ = '2023/3/10 '
@@ -54,3 +55,23 @@ def check(code_name, data, date=None, threshold=60):
             return False
 
     return True
+
+
+def check_panel(ctx, threshold=60, amount=200000000, vol_ratio=2):
+    """check 的全市场面板实现，ctx 为 strategy_panel.strategy_context，返回按面板行的布尔掩码
+    amount、vol_ratio 为突破当日成交额、量比的下限"""
+    window = ctx.window(threshold, ('open', 'close', 'volume', 'p_change'))
+    ma60 = ctx.ma('close', 60, threshold)
+    # 区间每根K线前一日的5日平均成交量
+    vol_ma5 = ctx.ma('volume', 5, threshold + 1)[:, :-1]
+    close, _open, volume, p_change = window['close'], window['open'], window['volume'], window['p_change']
+    have = ctx.have(threshold)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # 当日满足 enter.check_volume(threshold=threshold)
+        enter_volume = ((have >= threshold + 1) & ~((p_change < 2) | (close < _open)) &
+                        ~(close * volume < amount) & (volume / vol_ma5 >= vol_ratio))
+        breakthrough = strategy_panel.first_index((_open < ma60) & (ma60 <= close) & enter_volume)
+        front = (np.arange(threshold)[None, :] < breakthrough[:, None]) & (ma60 > 0)
+        ratio = (ma60 - close) / ma60
+        platform = ~(front & ~((-0.05 < ratio) & (ratio < 0.2))).any(axis=1)
+    return (ctx.total >= threshold) & (breakthrough >= 0) & platform
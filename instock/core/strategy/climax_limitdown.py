@@ -55,3 +55,17 @@ def check(code_name, data, date=None, threshold=60):
         return True
     else:
         return False
+
+
+def check_panel(ctx, threshold=60, amount=200000000, vol_ratio=4, limit_down=-9.5):
+    """check 的全市场面板实现，ctx 为 strategy_panel.strategy_context，返回按面板行的布尔掩码
+    amount、vol_ratio 为成交额、量比的下限，limit_down 为跌停的涨跌幅"""
+    window = ctx.window(1, ('close', 'volume', 'p_change'))
+    last_close = window['close'][:, -1]
+    last_vol = window['volume'][:, -1]
+    # 前一日的5日平均成交量
+    mean_vol = ctx.ma('volume', 5, 2)[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = last_vol / mean_vol
+        return ((ctx.total >= threshold + 1) & ~(window['p_change'][:, -1] > limit_down) &
+                ~(last_close * last_vol < amount) & (ratio >= vol_ratio))
@@ -55,3 +55,18 @@ def check_volume(code_name, data, date=None, threshold=60):
         return True
     else:
         return False
+
+
+def check_volume_panel(ctx, threshold=60, amount=200000000, vol_ratio=2, p_change=2):
+    """check_volume 的全市场面板实现，ctx 为 strategy_panel.strategy_context，返回按面板行的布尔掩码
+    amount、vol_ratio、p_change 依次为成交额、量比、涨幅的下限"""
+    window = ctx.window(1, ('open', 'close', 'volume', 'p_change'))
+    last_close = window['close'][:, -1]
+    last_vol = window['volume'][:, -1]
+    last_change = window['p_change'][:, -1]
+    # 前一日的5日平均成交量
+    mean_vol = ctx.ma('volume', 5, 2)[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = last_vol / mean_vol
+        return ((ctx.total >= threshold + 1) & ~((last_change < p_change) | (last_close < window['open'][:, -1])) &
+                ~(last_close * last_vol < amount) & (ratio >= vol_ratio))
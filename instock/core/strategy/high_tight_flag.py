@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 
 
+import numpy as np
+
 __author__ = 'myh '
 __date__ = '2023/3/10 '
 
@@ -47,3 +49,24 @@ def check_high_tight(code_name, data, date=None, threshold=60, istop=False):
             previous_p_change = 0.0
 
     return False
+
+
+def check_high_tight_panel(ctx, threshold=60, istop=None, ratio=1.9, limit_up=9.5):
+    """
+    check_high_tight 的全市场面板实现，返回按面板行的布尔掩码
+
+    Args:
+        ctx: strategy_panel.strategy_context
+        istop: 按面板行的龙虎榜掩码，默认全部不在榜
+        ratio: 14日内最高价与最低价之比的下限
+        limit_up: 视为涨停的涨幅
+    """
+    if istop is None:
+        return np.zeros(len(ctx.codes), dtype=bool)
+    window = ctx.window(min(threshold, 24), ('high', 'low', 'p_change'))
+    high, low, p_change = window['high'][:, :14], window['low'][:, :14], window['p_change'][:, :14]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio_increase = high[:, -1] / low.min(axis=1)
+    # 连续两天涨幅大于等于9.5%
+    twice = ((p_change[:, 1:] >= limit_up) & (p_change[:, :-1] >= limit_up)).any(axis=1)
+    return istop & (ctx.total >= threshold) & ~(ratio_increase < ratio) & twice
@@ -37,3 +37,13 @@ def check(code_name, data, date=None, threshold=30):
         return True
     else:
         return False
+
+
+def check_panel(ctx, threshold=30, increase=1.2):
+    """check 的全市场面板实现，ctx 为 strategy_panel.strategy_context，返回按面板行的布尔掩码
+    increase 为当日与区间首日30日均线之比的下限"""
+    ma30 = ctx.ma('close', 30, threshold)
+    step1 = round(threshold / 3)
+    step2 = round(threshold * 2 / 3)
+    first, mid1, mid2, last = ma30[:, 0], ma30[:, step1], ma30[:, step2], ma30[:, -1]
+    return (ctx.total >= threshold) & (first < mid1) & (mid1 < mid2) & (mid2 < last) & (last > increase * first)
@@ -2,6 +2,9 @@
 # -*- coding: utf-8 -*-
 
 
+import numpy as np
+from instock.core.strategy import strategy_panel
+
 __author__ = 'myh '
 __date__ = '2023/3/10 '
 
@@ -62,3 +65,19 @@ def check_low_increase(code_name, data, date=None, ma_short=30, ma_long=250, thr
         return True
 
     return False
+
+
+def check_low_increase_panel(ctx, ma_short=30, ma_long=250, threshold=10, max_atr=10, min_ratio=1.1):
+    """check_low_increase 的全市场面板实现，ctx 为 strategy_panel.strategy_context，返回按面板行的布尔掩码
+    max_atr 为平均涨跌幅绝对值的上限，min_ratio 为区间最高收盘价相对最低收盘价涨幅的下限"""
+    window = ctx.window(threshold, ('close', 'p_change'))
+    close, p_change = window['close'], window['p_change']
+    total_change = np.where((p_change > 0) | (p_change < 0), np.abs(p_change), 0.0).sum(axis=1)
+    atr = total_change / threshold
+    # 创新高的K线不参与最低点比较
+    new_high = close > strategy_panel.prev_high(close)
+    highest_row = np.maximum(np.max(close, axis=1), 0)
+    lowest_row = np.minimum(np.min(np.where(new_high | np.isnan(close), np.inf, close), axis=1), 1000000)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = (highest_row - lowest_row) / lowest_row
+    return (ctx.total >= ma_long) & (ctx.total >= threshold) & ~(atr > max_atr) & (ratio > min_ratio)
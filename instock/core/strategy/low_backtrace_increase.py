@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 
 
+import numpy as np
+
 __author__ = 'myh '
 __date__ = '2023/3/10 '
 
@@ -39,3 +41,18 @@ def check(code_name, data, date=None, threshold=60):
         previous_p_change = _p_change
         previous_open = _open
     return True
+
+
+def check_panel(ctx, threshold=60, increase=0.6):
+    """check 的全市场面板实现，ctx 为 strategy_panel.strategy_context，返回按面板行的布尔掩码
+    increase 为区间涨幅的下限"""
+    window = ctx.window(threshold, ('open', 'close', 'p_change'))
+    close, _open, p_change = window['close'], window['open'], window['p_change']
+    n = len(close)
+    previous_p_change = np.concatenate([np.full((n, 1), 100.0), p_change[:, :-1]], axis=1)
+    previous_open = np.concatenate([np.full((n, 1), -1000000.0), _open[:, :-1]], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio_increase = (close[:, -1] - close[:, 0]) / close[:, 0]
+        fall = ((p_change < -7) | ((close - _open) / _open * 100 < -7) |
+                (previous_p_change + p_change < -10) | ((close - previous_open) / previous_open * 100 < -10))
+    return (ctx.total >= threshold) & ~(ratio_increase < increase) & ~fall.any(axis=1)
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 from datetime import datetime
+import numpy as np
 from instock.core.strategy import turtle_trade
 
 __author__ = 'myh '
@@ -64,3 +65,28 @@ def check_internal(data, limitup_row):
             return False
 
     return True
+
+
+def check_panel(ctx, threshold=15, limit_up=9.5):
+    """check 的全市场面板实现，ctx 为 strategy_panel.strategy_context，返回按面板行的布尔掩码
+    limit_up 为视为涨停的涨幅"""
+    window = ctx.window(threshold, ('open', 'close', 'p_change'))
+    close, _open, p_change = window['close'], window['open'], window['p_change']
+    # turtle[:, j]：区间第j根K线当日满足 turtle_trade.check_enter(threshold=threshold)
+    max_price = np.maximum(ctx.rolling_max('close', threshold, threshold), 0)
+    turtle = (ctx.have(threshold) >= threshold) & (close >= max_price)
+    selected = np.zeros(len(close), dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        body = close / _open
+        # 涨停日之后还需要3根K线
+        for j in range(threshold - 3):
+            limitup_price = close[:, j]
+            day1 = j + 1
+            ok = (p_change[:, j] > limit_up) & turtle[:, j]
+            ok &= (close[:, day1] > limitup_price) & (_open[:, day1] > limitup_price) & \
+                (0.97 < body[:, day1]) & (body[:, day1] < 1.03)
+            for day in (j + 2, j + 3):
+                ok &= (0.97 < body[:, day]) & (body[:, day] < 1.03) & (-5 < p_change[:, day]) & \
+                      (p_change[:, day] < 5) & (close[:, day] > limitup_price) & (_open[:, day] > limitup_price)
+            selected |= ok
+    return (ctx.total >= threshold) & selected
@@ -0,0 +1,390 @@
+#!/usr/local/bin/python
+# -*- coding: utf-8 -*-
+
+
+from instock.lib.simple_logger import get_logger
+
+# 获取logger
+logger = get_logger(__name__)
+
+import datetime
+import os
+import time
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from instock.core.market_panel import to_datetime64
+import instock.core.panel_executor as pex
+
+__author__ = 'myh '
+__date__ = '2026/10/16 '
+
+# 策略的全市场面板实现：各策略模块的 *_panel 函数在 market_panel 上一次算出全部股票的选股结果(按面板行的布尔掩码)，
+#   口径与逐股函数一致，逐股函数保留作为参照；check_equivalence 核对两者的选股结果，
+#   tests/test_strategy_panel.py 在含停牌、新股的合成面板上断言全部策略两者一致(python -m unittest discover tests)。
+# 约定：面板实现的第一个参数为 strategy_context，窗口取自 panel.window，右对齐，最后一列为截至date的最后一根有效K线；
+#   ctx.total 为每只股票截至date的有效K线总数，对应逐股函数中的 len(data.index)。
+# 环境变量 STRATEGY_ENGINE：panel(默认)使用策略的全市场面板实现；stock 使用逐股实现；
+#   verify 使用面板实现，并与逐股实现核对选股结果，不一致时记录日志
+
+
+def get_engine():
+    return os.environ.get('STRATEGY_ENGINE', 'panel').lower()
+
+
+def have_count(total, count):
+    """窗口最后count个位置各自截至当根的有效K线数，第j列对应窗口倒数第count-j根K线"""
+    return total[:, None] - (count - 1 - np.arange(count))[None, :]
+
+
+def rolling_ma(values, total, period, count):
+    """
+    窗口最后count个位置的period日均线，K线不足或含NaN时为0(与逐股 tl.MA 后NaN置0一致)
+
+    Returns:
+        (代码数, count)数组，第j列对应窗口倒数第count-j根K线
+    """
+    values = values[:, values.shape[1] - (count + period - 1):]
+    with np.errstate(invalid='ignore'):
+        out = sliding_window_view(values, period, axis=1).mean(axis=-1)
+    out[(have_count(total, count) < period) | np.isnan(out)] = 0.0
+    return out
+
+
+def rolling_max(values, period, count):
+    """窗口最后count个位置的period日最高值，区间内含NaN时为NaN"""
+    values = values[:, values.shape[1] - (count + period - 1):]
+    return np.max(sliding_window_view(values, period, axis=1), axis=-1)
+
+
+# 截至某交易日的策略上下文：同一交易日的全部策略共用，只截取一次窗口，
+#   均线、滚动最高价等常用序列按 (字段, 周期) 计算一次后缓存，各策略按需要的长度取最后若干列
+class strategy_context:
+    def __init__(self, panel, date=None, length=0):
+        """
+        Args:
+            panel: market_panel
+            date: 截止日期，默认面板的快照日期
+            length: 预先截取的K线根数，通常取各策略所需根数的最大值，不足时按需扩大
+        """
+        self.panel = panel
+        self.date = panel.date if date is None else date
+        t = panel.date_loc(self.date)
+        if t < 0:
+            self.total = np.zeros(len(panel.codes), dtype=np.int32)
+        else:
+            self.total = panel.valid_count[:, t]  # 每只股票截至date的有效K线总数
+        self._length = length
+        self._window = {}
+        self._cols = None
+        self._dates = None
+        self._series = {}
+
+    @property
+    def codes(self):
+        return self.panel.codes
+
+    def _fetch(self, length, fields):
+        if length > self._length:
+            # 扩大窗口时已截取的字段一并重取，保持各字段长度一致
+            fields = tuple(set(fields) | set(self._window))
+            self._length = length
+            self._window = {}
+            self._dates = None
+        window, _, cols = self.panel.window(self._length, self.date, fields)
+        self._window.update(window)
+        self._cols = cols
+
+    def window(self, length, fields):
+        """每只股票截至date的最后length根有效K线，右对齐，dict 字段 -> (代码数, length)数组"""
+        if length > self._length or any(f not in self._window for f in fields):
+            self._fetch(length, fields)
+        return {f: self._window[f][:, self._length - length:] for f in fields}
+
+    def cols(self, length):
+        """窗口最后length根K线对应的交易日列，无效处为-1"""
+        if length > self._length or self._cols is None:
+            self._fetch(length, ('close',))
+        return self._cols[:, self._length - length:]
+
+    def dates(self, length):
+        """窗口最后length根K线的交易日(datetime64[D])，无效处为NaT"""
+        if length > self._length or self._dates is None:
+            self.cols(length)
+            cols = self._cols
+            self._dates = np.where(cols >= 0, self.panel.dates[np.where(cols >= 0, cols, 0)], np.datetime64('NaT'))
+        return self._dates[:, self._length - length:]
+
+    def have(self, count):
+        return have_count(self.total, count)
+
+    def _memo(self, key, count, compute):
+        cached = self._series.get(key)
+        if cached is None or cached.shape[1] < count:
+            cached = compute(count)
+            self._series[key] = cached
+        return cached[:, cached.shape[1] - count:]
+
+    def ma(self, field, period, count):
+        """窗口最后count个位置的period日均线(如MA5/10/20/30/60/250、成交量均线)，口径见 rolling_ma"""
+        return self._memo(('ma', field, period), count, lambda c: rolling_ma(
+            self.window(c + period - 1, (field,))[field], self.total, period, c))
+
+    def rolling_max(self, field, period, count):
+        """窗口最后count个位置的period日最高值(如60日最高收盘价)，口径见 rolling_max"""
+        return self._memo(('max', field, period), count, lambda c: rolling_max(
+            self.window(c + period - 1, (field,))[field], period, c))
+
+    def store(self, key):
+        """按key取一个缓存字典，供声明式选股条件等缓存自己的中间结果，同一上下文内共用"""
+        return self._series.setdefault(('store', key), {})
+
+
+def shift_cols(values, offset, length, fill=np.nan):
+    """右对齐的窗口中，每行去掉最后offset[行]列后再取最后length列，左侧不足的部分为fill"""
+    idx = values.shape[1] - offset[:, None] - length + np.arange(length)[None, :]
+    out = values[np.arange(values.shape[0])[:, None], np.maximum(idx, 0)]
+    out[idx < 0] = fill
+    return out
+
+
+# 多个交易日共用一个截至最后交易日的上下文(base)时某一交易日的视图：窗口、均线、滚动最高价都只在base上截取、计算一次，
+#   各交易日按行取截至当日的列；当日最后一根有效K线在base窗口中距窗口末尾 offset 根(其间的有效K线数)
+class date_context(strategy_context):
+    def __init__(self, base, date):
+        super().__init__(base.panel, date)
+        self._base = base
+        self._offset = base.total - self.total
+        self._extra = int(self._offset.max()) if len(self._offset) > 0 else 0
+
+    def window(self, length, fields):
+        window = self._base.window(length + self._extra, fields)
+        return {f: shift_cols(window[f], self._offset, length) for f in fields}
+
+    def cols(self, length):
+        return shift_cols(self._base.cols(length + self._extra), self._offset, length, -1)
+
+    def dates(self, length):
+        return shift_cols(self._base.dates(length + self._extra), self._offset, length, np.datetime64('NaT'))
+
+    def ma(self, field, period, count):
+        return shift_cols(self._base.ma(field, period, count + self._extra), self._offset, count)
+
+    def rolling_max(self, field, period, count):
+        return shift_cols(self._base.rolling_max(field, period, count + self._extra), self._offset, count)
+
+
+def prev_high(values):
+    """逐根K线之前的最高值(逐股循环中 highest 的初值为0)，用于还原 if _close > highest ... elif 的判断顺序"""
+    running = np.maximum.accumulate(np.where(np.isnan(values), -np.inf, values), axis=1)
+    prev = np.concatenate([np.zeros((values.shape[0], 1)), running[:, :-1]], axis=1)
+    return np.maximum(prev, 0.0)
+
+
+def first_index(mask):
+    """每行第一个True的位置，没有时为-1"""
+    idx = np.argmax(mask, axis=1)
+    return np.where(mask.any(axis=1), idx, -1)
+
+
+def _is_high_tight(strategy):
+    return strategy['func'] is not None and strategy['func'].__name__ == 'check_high_tight'
+
+
+def run_panel(strategy, ctx, tops=None, params=None):
+    """
+    用面板实现执行策略
+
+    Args:
+        strategy: tbs.TABLE_CN_STOCK_STRATEGIES 中的策略字典
+        ctx: strategy_context
+        tops: 龙虎榜股票代码集合，只用于高而窄的旗形
+        params: 可选，传给面板实现的关键字参数(阈值等)，默认使用其默认值
+
+    Returns:
+        按面板行的布尔掩码
+    """
+    func = strategy['panel_func']
+    params = {} if params is None else params
+    if _is_high_tight(strategy):
+        istop = None if tops is None else np.isin(ctx.codes, list(tops))
+        return func(ctx, istop=istop, **params)
+    return func(ctx, **params)
+
+
+def run_stock(strategy, ctx, tops=None, lookback=None):
+    """用逐股实现执行策略，返回按面板行的布尔掩码"""
+    selected, _ = _run_stocks([strategy], ctx, tops, lookback)
+    return selected[strategy['name']]
+
+
+def _run_stocks(strategies, ctx, tops=None, lookback=None):
+    # 每只股票只生成一次DataFrame，依次执行全部策略的逐股实现；返回 (策略表名 -> 掩码, 策略表名 -> 耗时秒数)
+    panel = ctx.panel
+    date = to_datetime64(ctx.date).astype(datetime.date)
+    date_str = date.strftime("%Y-%m-%d")
+    selected = {s['name']: np.zeros(len(panel.codes), dtype=bool) for s in strategies}
+    timings = {s['name']: 0.0 for s in strategies}
+    for i, (code, name) in enumerate(zip(panel.codes, panel.names)):
+        key = (date_str, code, name)
+        data = panel.frame_at(i, end_date=date, lookback=lookback)
+        for strategy in strategies:
+            start = time.perf_counter()
+            kwargs = {'date': date}
+            if _is_high_tight(strategy):
+                kwargs['istop'] = tops is not None and code in tops
+            try:
+                selected[strategy['name']][i] = bool(strategy['func'](key, data, **kwargs))
+            except Exception as e:
+                logger.error(f"strategy_panel._run_stocks处理异常：{strategy['name']}策略{code}代码{e}")
+            timings[strategy['name']] += time.perf_counter() - start
+    return selected, timings
+
+
+def evaluate_rows(panel, date, names, tops=None, engine='panel'):
+    """
+    对一块股票一次执行多个策略，供 run_fused 按行分块调用(可在子进程中执行)
+
+    Args:
+        panel: market_panel(或其按行截取的一块)
+        date: 选股日期
+        names: 策略表名列表，在 tbs.TABLE_CN_STOCK_STRATEGIES 中查找
+        tops: 龙虎榜股票代码集合
+        engine: 见 get_engine
+
+    Returns:
+        (dict 策略表名 -> 按行的布尔掩码, dict 策略表名 -> 耗时秒数)
+    """
+    strategies = _find_strategies(names)
+    ctx = strategy_context(panel, date, length=max([s['lookback'] for s in strategies], default=0))
+    return _evaluate_context(ctx, strategies, tops, engine)
+
+
+def _find_strategies(names):
+    import instock.core.tablestructure as tbs
+    by_name = {s['name']: s for s in tbs.TABLE_CN_STOCK_STRATEGIES}
+    return [by_name[name] for name in names if name in by_name]
+
+
+def _evaluate_context(ctx, strategies, tops=None, engine='panel'):
+    # 在一个上下文上执行多个策略，返回值同 evaluate_rows
+    codes = ctx.codes
+    selected = {}
+    timings = {}
+    stock_strategies = []
+    for strategy in strategies:
+        if strategy.get('panel_func') is None or (engine == 'stock' and strategy['func'] is not None):
+            stock_strategies.append(strategy)
+            continue
+        start = time.perf_counter()
+        try:
+            selected[strategy['name']] = run_panel(strategy, ctx, tops)
+        except Exception as e:
+            logger.error(f"strategy_panel.evaluate_rows处理异常：{strategy['name']}策略{e}")
+            selected[strategy['name']] = np.zeros(len(codes), dtype=bool)
+        timings[strategy['name']] = time.perf_counter() - start
+    if engine == 'verify':
+        stock_strategies.extend(s for s in strategies if s['name'] in selected and s['func'] is not None)
+    if stock_strategies:
+        cn = {s['name']: s['cn'] for s in strategies}
+        lookback = max(s['lookback'] for s in stock_strategies)
+        stock_selected, stock_timings = _run_stocks(stock_strategies, ctx, tops, lookback)
+        for name, mask in stock_selected.items():
+            if name in selected:
+                # verify：面板实现的结果为准，只记录不一致的股票
+                if (selected[name] != mask).any():
+                    diff = (list(codes[selected[name] & ~mask]), list(codes[mask & ~selected[name]]))
+                    logger.warning(f"策略{cn[name]}面板实现与逐股实现结果不一致：{diff}")
+                continue
+            selected[name] = mask
+            timings[name] = stock_timings[name]
+    return selected, timings
+
+
+def evaluate_rows_dates(panel, dates, names, tops=None, engine='panel'):
+    """
+    对一块股票依次执行多个日期的全部策略：只截取一次截至最后日期、覆盖全部日期的窗口，均线、滚动最高价等在其上
+    一次算出，各日期经 date_context 按行取截至当日的列，不再逐日重新截取窗口和计算
+
+    Args:
+        tops: dict 日期 -> 龙虎榜股票代码集合
+        其余同 evaluate_rows
+
+    Returns:
+        (dict 日期 -> dict 策略表名 -> 按行的布尔掩码, dict 策略表名 -> 耗时秒数)
+    """
+    strategies = _find_strategies(names)
+    lookback = max([s['lookback'] for s in strategies], default=0)
+    locs = {date: panel.date_loc(date) for date in dates}
+    used = [t for t in locs.values() if t >= 0]
+    base = None
+    if used:
+        # 区间内每只股票的有效K线数不超过交易日数，窗口宽度足够各日期取lookback根
+        base = strategy_context(panel, panel.dates[max(used)], length=lookback + max(used) - min(used))
+    selected = {}
+    timings = {}
+    for date in dates:
+        ctx = strategy_context(panel, date, length=lookback) if locs[date] < 0 else date_context(base, date)
+        selected[date], date_timings = _evaluate_context(ctx, strategies,
+                                                         None if tops is None else tops.get(date), engine)
+        for name, seconds in date_timings.items():
+            timings[name] = timings.get(name, 0.0) + seconds
+    return selected, timings
+
+
+def run_fused(panel, dates, strategies, tops=None, engine=None):
+    """
+    融合执行多个日期的多个策略：面板按股票行分块并发执行，每块依次计算全部日期、全部策略
+
+    Args:
+        panel: market_panel，按日期截取的快照时使用其完整面板的执行器
+        dates: 选股日期列表
+        strategies: 策略字典列表
+        tops: dict 日期 -> 龙虎榜股票代码集合，只用于高而窄的旗形
+        engine: 见 get_engine，默认取环境变量
+
+    Returns:
+        (dict 日期 -> dict 策略表名 -> 按面板行的布尔掩码, dict 策略表名 -> 各块耗时合计秒数)
+    """
+    if engine is None:
+        engine = get_engine()
+    names = [s['name'] for s in strategies]
+    parts = pex.get_executor(panel).map_rows(evaluate_rows_dates, args=(dates, names, tops, engine))
+    selected = {}
+    for date in dates:
+        selected[date] = {name: np.concatenate([p[0][date][name] for p in parts])
+                          for name in names if name in parts[0][0][date]}
+    timings = {}
+    for p in parts:
+        for name, seconds in p[1].items():
+            timings[name] = timings.get(name, 0.0) + seconds
+    return selected, timings
+
+
+def check_equivalence(ctx, strategies=None, tops=None):
+    """
+    核对策略面板实现与逐股实现的选股结果
+
+    Args:
+        ctx: strategy_context
+        strategies: 要核对的策略字典，默认全部有面板实现的策略
+
+    Returns:
+        dict 策略表名 -> (只被面板实现选中的代码, 只被逐股实现选中的代码)，结果一致时两者均为空
+    """
+    if strategies is None:
+        import instock.core.tablestructure as tbs
+        strategies = tbs.TABLE_CN_STOCK_STRATEGIES
+    codes = ctx.codes
+    result = {}
+    for strategy in strategies:
+        if strategy.get('panel_func') is None or strategy['func'] is None:
+            continue
+        try:
+            fast = run_panel(strategy, ctx, tops)
+            slow = run_stock(strategy, ctx, tops)
+            result[strategy['name']] = (list(codes[fast & ~slow]), list(codes[slow & ~fast]))
+            if (fast != slow).any():
+                logger.warning(f"策略{strategy['cn']}面板实现与逐股实现结果不一致：{result[strategy['name']]}")
+        except Exception as e:
+            logger.error(f"strategy_panel.check_equivalence处理异常：{strategy['name']}策略{e}")
+    return result
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+from instock.lib.simple_logger import get_logger
+
+# 获取logger
+logger = get_logger(__name__)
+
+import ast
+import functools
+import json
+import os.path
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from instock.core.market_panel import PANEL_FIELDS, select_fields, to_datetime64
+
+__author__ = 'myh '
+__date__ = '2026/10/16 '
+
+# 声明式选股条件：用表达式描述策略，如 close >= rolling_max(close, 60) and amount >= 2e8，
+#   编译为 股票数×K线数 二维数组上的向量化运算，一次算出全部股票在一个或多个交易日的选股结果。
+# 表达式为Python表达式的子集：
+#   变量：行情字段 open/high/low/close/preclose/volume/amount/turnover/p_change；
+#         bars 截至当根的有效K线数；indicator_engine 登记的指标列，如 macd、rsi_6、kdjk
+#   运算：+ - * /、比较(可连写)、and/or/not
+#   函数：ma/rolling_sum/rolling_max/rolling_min/rolling_std(x, n)、ref(x, n) n根K线之前的值、
+#         count(条件, n) 最近n根K线中条件成立的根数、abs(x)、max(a, b)、min(a, b)
+#   与逐股策略一致，按截至当日的有效K线计算(跳过停牌日)；K线不足时滚动函数的结果为NaN，与NaN比较的条件均不成立。
+# 定义文件 config/strategy_screens.json：[{"name": ..., "cn": ..., "expr": ..., "enabled": true}]，
+#   启用的条件登记到 tablestructure.TABLE_CN_STOCK_STRATEGIES，结果写入标准的策略表。
+
+SCREEN_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'config',
+                           'strategy_screens.json')
+# 指标为递推计算，与指标作业一致，每根K线的指标值都只用截至该根的最近90根K线计算，与求值窗口的宽度无关
+INDICATOR_LOOKBACK = 90
+
+_BINOPS = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide}
+_CMPOPS = {ast.Gt: np.greater, ast.GtE: np.greater_equal, ast.Lt: np.less, ast.LtE: np.less_equal,
+           ast.Eq: np.equal, ast.NotEq: np.not_equal}
+# 滚动函数：名称 -> 窗口内的聚合
+_ROLLING = {'ma': np.mean, 'rolling_sum': np.sum, 'rolling_max': np.max, 'rolling_min': np.min,
+            'rolling_std': np.std}
+_ELEMENTWISE = {'abs': (1, np.abs), 'max': (2, np.maximum), 'min': (2, np.minimum)}
+
+
+def _rolling(x, period, reduce):
+    out = np.full(x.shape, np.nan)
+    if x.shape[1] >= period:
+        out[:, period - 1:] = reduce(sliding_window_view(x, period, axis=1), axis=-1)
+    return out
+
+
+def _ref(x, period):
+    out = np.full(x.shape, np.nan)
+    if period < x.shape[1]:
+        out[:, period:] = x[:, :x.shape[1] - period]
+    return out
+
+
+def _period(node, func):
+    if not (isinstance(node, ast.Constant) and isinstance(node.value, int) and node.value > 0):
+        raise ValueError(f"{func}的周期必须是正整数：{ast.unparse(node)}")
+    return node.value
+
+
+def _shift(indicators, period):
+    return {k: v + period for k, v in indicators.items()}
+
+
+# 编译结果：(计算函数 env -> 数组, 所需K线根数, 行情字段, 指标列 -> 向前引用指标值的最大根数)
+def _compile(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) \
+            and not isinstance(node.value, bool):
+        value = float(node.value)
+        return (lambda env: value), 1, set(), {}
+
+    if isinstance(node, ast.Name):
+        name = node.id
+        if name == 'bars':
+            return (lambda env: env.bars), 1, set(), {}
+        if name in PANEL_FIELDS:
+            return (lambda env: env.window[name]), 1, {name}, {}
+        from instock.core.indicator import indicator_engine
+        if name in indicator_engine.INDICATOR_COLUMNS:
+            return (lambda env: env.indicator(name)), INDICATOR_LOOKBACK, set(indicator_engine.INPUT_FIELDS), \
+                {name: 0}
+        raise ValueError(f"未知的变量：{name}")
+
+    if isinstance(node, ast.UnaryOp):
+        fn, lookback, fields, indicators = _compile(node.operand)
+        if isinstance(node.op, ast.Not):
+            return (lambda env: np.logical_not(fn(env))), lookback, fields, indicators
+        if isinstance(node.op, ast.USub):
+            return (lambda env: np.negative(fn(env))), lookback, fields, indicators
+        raise ValueError(f"不支持的运算：{ast.unparse(node)}")
+
+    if isinstance(node, ast.BinOp):
+        op = _BINOPS.get(type(node.op))
+        if op is None:
+            raise ValueError(f"不支持的运算：{ast.unparse(node)}")
+        return _combine(op, [node.left, node.right])
+
+    if isinstance(node, ast.BoolOp):
+        op = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        return _combine(lambda *values: functools.reduce(op, values), node.values)
+
+    if isinstance(node, ast.Compare):
+        ops = [_CMPOPS.get(type(op)) for op in node.ops]
+        if None in ops:
+            raise ValueError(f"不支持的比较：{ast.unparse(node)}")
+
+        # 连写的比较 a < b < c 等价于 a < b and b < c
+        def compare(*values):
+            result = True
+            for op, left, right in zip(ops, values[:-1], values[1:]):
+                result = np.logical_and(result, op(left, right))
+            return result
+        return _combine(compare, [node.left] + node.comparators)
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        func = node.func.id
+        args = node.args
+        if func in _ROLLING or func in ('ref', 'count'):
+            if len(args) != 2:
+                raise ValueError(f"{func}需要2个参数：{ast.unparse(node)}")
+            period = _period(args[1], func)
+            fn, lookback, fields, indicators = _compile(args[0])
+            # 滚动类结果按子表达式文本缓存，同一窗口上的多个条件共用
+            key = ast.unparse(node)
+            if func == 'ref':
+                return (lambda env: env.cached(key, lambda: _ref(fn(env), period))), lookback + period, fields, \
+                    _shift(indicators, period)
+            if func == 'count':
+                # 未上市的位置不计数，窗口内含这些位置时结果为NaN
+                return (lambda env: env.cached(key, lambda: _rolling(np.where(env.valid, fn(env), np.nan), period,
+                                                                     np.sum))), \
+                    lookback + period - 1, fields, _shift(indicators, period - 1)
+            reduce = _ROLLING[func]
+            return (lambda env: env.cached(key, lambda: _rolling(fn(env), period, reduce))), \
+                lookback + period - 1, fields, _shift(indicators, period - 1)
+        if func in _ELEMENTWISE:
+            nargs, op = _ELEMENTWISE[func]
+            if len(args) != nargs:
+                raise ValueError(f"{func}需要{nargs}个参数：{ast.unparse(node)}")
+            return _combine(op, args)
+
+    raise ValueError(f"不支持的表达式：{ast.unparse(node)}")
+
+
+def _combine(op, nodes):
+    parts = [_compile(n) for n in nodes]
+    fns = [p[0] for p in parts]
+    lookback = max(p[1] for p in parts)
+    fields = set().union(*[p[2] for p in parts])
+    indicators = {}
+    for p in parts:
+        for k, v in p[3].items():
+            indicators[k] = max(v, indicators.get(k, 0))
+    return (lambda env: op(*[fn(env) for fn in fns])), lookback, fields, indicators
+
+
+# 一次求值的输入：右对齐的有效K线窗口，指标按需计算后缓存；只有最后span列的结果会被使用
+class _env:
+    def __init__(self, window, total, width, indicators, cache=None, span=1):
+        self.window = window
+        self._cache = cache
+        self._span = span
+        # 第j列为第 total-width+j+1 根有效K线，小于1为窗口左侧的填充
+        count = total[:, None] - width + 1 + np.arange(width)[None, :]
+        self.valid = count > 0
+        self.bars = np.where(self.valid, count, np.nan)
+        self._indicators = indicators
+        self._values = None
+
+    def cached(self, key, compute):
+        if self._cache is None:
+            return compute()
+        value = self._cache.get(key)
+        if value is None:
+            value = compute()
+            self._cache[key] = value
+        return value
+
+    def indicator(self, name):
+        if self._values is None:
+            from instock.core.indicator import indicator_engine
+            columns = sorted(self._indicators)
+            width = self.valid.shape[1]
+            self._values = {c: np.full(self.valid.shape, np.nan) for c in columns}
+            # 只算最后span列及其向前引用到的列；每列单独用截至该列的最后 INDICATOR_LOOKBACK 根K线计算，
+            #   同一交易日的指标值与指标作业、单日求值一致，不随窗口宽度变化。按K线数分组，保证每个数据块内没有填充值
+            reach = max(self._indicators.values())
+            for j in range(max(0, width - self._span - reach), width):
+                sizes = np.minimum(np.where(self.valid[:, j], self.bars[:, j], 0), min(INDICATOR_LOOKBACK, j + 1))
+                sizes = sizes.astype(np.int64)
+                for size in np.unique(sizes[sizes > 1]):
+                    rows = np.flatnonzero(sizes == size)
+                    block = {f: np.ascontiguousarray(self.window[f][rows, j - size + 1:j + 1])
+                             for f in indicator_engine.INPUT_FIELDS}
+                    d = indicator_engine.calc_block(block, columns)
+                    for c in columns:
+                        self._values[c][rows, j] = d[c][:, -1]
+        return self._values[name]
+
+
+class screen:
+    def __init__(self, expr):
+        """
+        编译选股条件表达式
+
+        Args:
+            expr: 条件表达式，语法见模块说明
+
+        Raises:
+            ValueError: 表达式有语法错误或使用了不支持的变量、函数
+        """
+        self.expr = expr
+        try:
+            tree = ast.parse(expr.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ValueError(f"选股条件语法错误：{expr}，{e}")
+        self._fn, self.lookback, fields, self.indicators = _compile(tree.body)
+        self.fields = select_fields(fields)
+
+    def evaluate_window(self, window, total, cache=None, span=1):
+        """
+        在右对齐的有效K线窗口上逐根求值
+
+        Args:
+            window: 字段 -> (股票数, 宽度)数组，最后一列为每只股票的最后一根有效K线
+            total: 每只股票截至窗口最后一根的有效K线总数
+            cache: 可选，子表达式文本 -> 结果的缓存字典，同一窗口上求值的多个条件共用滚动函数的结果
+            span: 调用方使用结果的最后列数，指标只在这些列所需的位置上计算
+
+        Returns:
+            (股票数, 宽度)布尔数组，只有最后span列有效
+        """
+        width = window['close'].shape[1]
+        env = _env(window, total, width, self.indicators, cache, span)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            value = self._fn(env)
+            if np.asarray(value).dtype != bool:
+                value = np.nan_to_num(value) != 0
+        return np.broadcast_to(value, env.valid.shape) & env.valid
+
+    def check_panel(self, ctx, length=None):
+        """
+        策略面板实现的接口，ctx 为 strategy_panel.strategy_context，返回按面板行的布尔掩码
+
+        Args:
+            length: 可选，求值的窗口宽度，不小于条件所需根数；多个条件取相同宽度时共用 ctx 中缓存的滚动函数结果
+        """
+        width = self.lookback if length is None else max(length, self.lookback)
+        window = ctx.window(width, self.fields)
+        cache = None if length is None else ctx.store(('screen', width))
+        return self.evaluate_window(window, ctx.total, cache)[:, -1]
+
+    def evaluate_dates(self, panel, dates):
+        """
+        一次算出多个交易日的选股结果：取覆盖全部日期的一个窗口整体求值，各日期取截至当日的最后一根K线；
+        指标仍逐日按最近 INDICATOR_LOOKBACK 根K线计算，结果与逐日 check_panel 一致
+
+        Args:
+            panel: market_panel
+            dates: 交易日列表
+
+        Returns:
+            dict 日期(YYYY-MM-DD) -> 按面板行的布尔掩码
+        """
+        n = len(panel.codes)
+        locs = {str(to_datetime64(d)): panel.date_loc(d) for d in dates}
+        result = {d: np.zeros(n, dtype=bool) for d in locs}
+        used = [t for t in locs.values() if t >= 0]
+        if not used or n == 0:
+            return result
+        t_end = max(used)
+        # 区间内每只股票的K线数不超过交易日数
+        span = t_end - min(used) + 1
+        width = self.lookback + span - 1
+        window, _, _ = panel.window(width, panel.dates[t_end], self.fields)
+        end = panel.valid_count[:, t_end]
+        selected = self.evaluate_window(window, end, span=span)
+        rows = np.arange(n)
+        for d, t in locs.items():
+            if t < 0:
+                continue
+            pos = panel.valid_count[:, t] - 1 - (end - width)
+            ok = (pos >= 0) & (pos < width)
+            result[d] = ok & selected[rows, np.clip(pos, 0, width - 1)]
+        return result
+
+
+def load_screens(columns, path=SCREEN_FILE):
+    """
+    读取并编译声明式选股条件，定义有误的条件记录日志后跳过
+
+    Args:
+        columns: 策略表的列定义
+        path: 定义文件
+
+    Returns:
+        策略字典列表，格式同 tablestructure.TABLE_CN_STOCK_STRATEGIES；func 为None，screen 为编译后的条件
+    """
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            specs = json.load(f)
+    except Exception as e:
+        logger.error(f"strategy_screen.load_screens处理异常：{path}{e}")
+        return []
+    strategies = []
+    for spec in specs:
+        if not spec.get('enabled', True):
+            continue
+        try:
+            s = screen(spec['expr'])
+            name = spec['name']
+            if not name.startswith('cn_stock_strategy_'):
+                name = f"cn_stock_strategy_{name}"
+            strategies.append({'name': name, 'cn': spec.get('cn', name), 'size': 70, 'func': None,
+                               'panel_func': s.check_panel, 'screen': s, 'lookback': s.lookback,
+                               'fields': s.fields, 'columns': columns})
+        except Exception as e:
+            logger.error(f"strategy_screen.load_screens处理异常：{spec}{e}")
+    return strategies
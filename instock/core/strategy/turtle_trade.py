@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 
 
+import numpy as np
+
 __author__ = 'myh '
 __date__ = '2023/3/10 '
 
@@ -36,3 +38,10 @@ def check_enter(code_name, data, date=None, threshold=60):
         return True
 
     return False
+
+
+def check_enter_panel(ctx, threshold=60):
+    """check_enter 的全市场面板实现，ctx 为 strategy_panel.strategy_context，返回按面板行的布尔掩码"""
+    close = ctx.window(1, ('close',))['close']
+    max_price = np.maximum(ctx.rolling_max('close', threshold, 1)[:, 0], 0)
+    return (ctx.total >= threshold) & (close[:, -1] >= max_price)
@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 from sqlalchemy import DATE, VARCHAR, FLOAT, BIGINT, SmallInteger, DATETIME, INT
-from sqlalchemy.dialects.mysql import BIT
+from sqlalchemy.dialects.mysql import BIT, DOUBLE
 from instock.lib.simple_logger import get_logger
 
 # 获取logger
@@ -19,11 +19,13 @@ from instock.core.strategy import parking_apron
 from instock.core.strategy import low_backtrace_increase
 from instock.core.strategy import keep_increasing
 from instock.core.strategy import high_tight_flag
+from instock.core.strategy import strategy_screen
 
 __author__ = 'myh '
 __date__ = '2023/3/10 '
 
 RATE_FIELDS_COUNT = 100  # N日收益率字段数目，即N值
+SUMMARY_HORIZONS = (1, 5, 10, 20, 60)  # 策略表现汇总统计的持有期(交易日)
 _COLLATE = "utf8mb4_general_ci"
 
 TABLE_CN_STOCK_ATTENTION = {'name': 'cn_stock_attention', 'cn': '我的关注',
@@ -396,8 +398,12 @@ TABLE_CN_STOCK_INDICATORS = {'name': 'cn_stock_indicators', 'cn': '股票指标
                              'columns': TABLE_CN_STOCK_FOREIGN_KEY['columns'].copy()}
 TABLE_CN_STOCK_INDICATORS['columns'].update(STOCK_STATS_DATA['columns'])
 
+# 信号表(策略、指标买卖点)只保存 (date, code, name)，N日收益率在读取时计算，见 rate_stats.attach_rates
 _tmp_columns = TABLE_CN_STOCK_FOREIGN_KEY['columns'].copy()
-_tmp_columns.update(TABLE_CN_STOCK_BACKTEST_DATA['columns'])
+
+# 信号表展示的列：存储的列加上读取时计算的N日收益率
+TABLE_CN_STOCK_SIGNAL_VIEW_COLUMNS = _tmp_columns.copy()
+TABLE_CN_STOCK_SIGNAL_VIEW_COLUMNS.update(TABLE_CN_STOCK_BACKTEST_DATA['columns'])
 
 TABLE_CN_STOCK_INDICATORS_BUY = {'name': 'cn_stock_indicators_buy', 'cn': '股票指标买入',
                                  'columns': _tmp_columns}
@@ -405,31 +411,92 @@ TABLE_CN_STOCK_INDICATORS_BUY = {'name': 'cn_stock_indicators_buy', 'cn': '股
 TABLE_CN_STOCK_INDICATORS_SELL = {'name': 'cn_stock_indicators_sell', 'cn': '股票指标卖出',
                                   'columns': _tmp_columns}
 
+# 递推类指标的增量计算状态，字段含义见 indicator_state
+INDICATORS_STATE_FIELDS = ('bars', 'close', 'high', 'low',
+                           's_ema26', 's_ema26_sum', 's_ema12', 's_ema12_sum', 's_macds', 's_macds_sum',
+                           's_trix1', 's_trix1_sum', 's_trix2', 's_trix2_sum', 's_trix3', 's_trix3_sum',
+                           's_trix_prev',
+                           's_rsi6_gain', 's_rsi6_loss', 's_rsi12_gain', 's_rsi12_loss',
+                           's_rsi14_gain', 's_rsi14_loss', 's_rsi24_gain', 's_rsi24_loss',
+                           's_kdjk', 's_kdjk_sum', 's_kdjd', 's_kdjd_sum', 's_atr', 's_atr_sum',
+                           's_st_ub', 's_st_lb', 's_st', 's_obv', 's_sar', 's_sar_ep', 's_sar_af', 's_sar_long')
+
+TABLE_CN_STOCK_INDICATORS_STATE = {'name': 'cn_stock_indicators_state', 'cn': '股票指标递推状态',
+                                   'columns': {'date': {'type': DATE, 'cn': '日期', 'size': 0},
+                                               'code': {'type': VARCHAR(6, _COLLATE), 'cn': '代码', 'size': 60},
+                                               'last_date': {'type': DATE, 'cn': '最后K线日期', 'size': 0}}}
+TABLE_CN_STOCK_INDICATORS_STATE['columns'].update(
+    {k: {'type': DOUBLE, 'cn': k, 'size': 0} for k in INDICATORS_STATE_FIELDS})
+TABLE_CN_STOCK_INDICATORS_STATE['columns'].update(
+    {'o_%s' % k: {'type': DOUBLE, 'cn': STOCK_STATS_DATA['columns'][k]['cn'], 'size': 0} for k in
+     ('macd', 'macds', 'macdh', 'trix', 'kdjk', 'kdjd', 'kdjj', 'rsi_6', 'rsi_12', 'rsi', 'rsi_24', 'atr',
+      'supertrend_ub', 'supertrend', 'supertrend_lb', 'obv', 'sar')})
+
+# lookback：策略计算一个交易日所需的K线根数(含均线等的预热)，用于按需读取历史数据
+# panel_func：策略的全市场面板实现，与func(逐股实现)的选股结果一致，见 strategy_panel
 TABLE_CN_STOCK_STRATEGIES = [
     {'name': 'cn_stock_strategy_enter', 'cn': '放量上涨', 'size': 70, 'func': enter.check_volume,
-     'columns': _tmp_columns},
+     'panel_func': enter.check_volume_panel, 'lookback': 70, 'columns': _tmp_columns},
     {'name': 'cn_stock_strategy_keep_increasing', 'cn': '均线多头', 'size': 70, 'func': keep_increasing.check,
-     'columns': _tmp_columns},
+     'panel_func': keep_increasing.check_panel, 'lookback': 60, 'columns': _tmp_columns},
     {'name': 'cn_stock_strategy_parking_apron', 'cn': '停机坪', 'size': 70, 'func': parking_apron.check,
-     'columns': _tmp_columns},
+     'panel_func': parking_apron.check_panel, 'lookback': 30, 'columns': _tmp_columns},
     {'name': 'cn_stock_strategy_backtrace_ma250', 'cn': '回踩年线', 'size': 70, 'func': backtrace_ma250.check,
-     'columns': _tmp_columns},
+     'panel_func': backtrace_ma250.check_panel, 'lookback': 310, 'columns': _tmp_columns},
     {'name': 'cn_stock_strategy_breakthrough_platform', 'cn': '突破平台', 'size': 70,
      'func': breakthrough_platform.check,
-     'columns': _tmp_columns},
+     'panel_func': breakthrough_platform.check_panel, 'lookback': 130, 'columns': _tmp_columns},
     {'name': 'cn_stock_strategy_low_backtrace_increase', 'cn': '无大幅回撤', 'size': 70,
      'func': low_backtrace_increase.check,
-     'columns': _tmp_columns},
+     'panel_func': low_backtrace_increase.check_panel, 'lookback': 60, 'columns': _tmp_columns},
     {'name': 'cn_stock_strategy_turtle_trade', 'cn': '海龟交易法则', 'size': 70, 'func': turtle_trade.check_enter,
-     'columns': _tmp_columns},
+     'panel_func': turtle_trade.check_enter_panel, 'lookback': 60, 'columns': _tmp_columns},
     {'name': 'cn_stock_strategy_high_tight_flag', 'cn': '高而窄的旗形', 'size': 70,
      'func': high_tight_flag.check_high_tight,
-     'columns': _tmp_columns},
+     'panel_func': high_tight_flag.check_high_tight_panel, 'lookback': 60, 'columns': _tmp_columns},
     {'name': 'cn_stock_strategy_climax_limitdown', 'cn': '放量跌停', 'size': 70, 'func': climax_limitdown.check,
-     'columns': _tmp_columns},
+     'panel_func': climax_limitdown.check_panel, 'lookback': 70, 'columns': _tmp_columns},
     {'name': 'cn_stock_strategy_low_atr', 'cn': '低ATR成长', 'size': 70, 'func': low_atr.check_low_increase,
-     'columns': _tmp_columns}
+     'panel_func': low_atr.check_low_increase_panel, 'lookback': 250, 'columns': _tmp_columns}
 ]
+# 声明式选股条件(config/strategy_screens.json)编译后登记为策略，func为None，只有面板实现，见 strategy_screen
+TABLE_CN_STOCK_STRATEGIES.extend(strategy_screen.load_screens(_tmp_columns))
+
+# 策略参数寻优结果：每次寻优按 (date, strategy) 整批替换，date为回测区间的结束日期，params为参数的JSON，见 backtest.sweep
+TABLE_CN_STOCK_STRATEGY_SWEEP = {'name': 'cn_stock_strategy_sweep', 'cn': '策略参数寻优',
+                                 'columns': {'date': {'type': DATE, 'cn': '日期', 'size': 0},
+                                             'strategy': {'type': VARCHAR(64, _COLLATE), 'cn': '策略', 'size': 120},
+                                             'cn': {'type': VARCHAR(64, _COLLATE), 'cn': '策略名称', 'size': 90},
+                                             'params': {'type': VARCHAR(255, _COLLATE), 'cn': '参数', 'size': 200},
+                                             'rank': {'type': INT, 'cn': '排名', 'size': 60},
+                                             'date_start': {'type': DATE, 'cn': '开始日期', 'size': 90},
+                                             'method': {'type': VARCHAR(10, _COLLATE), 'cn': '寻优方式', 'size': 70},
+                                             'signals': {'type': INT, 'cn': '信号数', 'size': 70},
+                                             'total_return': {'type': FLOAT, 'cn': '总收益率', 'size': 70},
+                                             'annual_return': {'type': FLOAT, 'cn': '年化收益率', 'size': 70},
+                                             'max_drawdown': {'type': FLOAT, 'cn': '最大回撤', 'size': 70},
+                                             'sharpe': {'type': FLOAT, 'cn': '夏普比率', 'size': 70},
+                                             'turnover': {'type': FLOAT, 'cn': '年化换手率', 'size': 70},
+                                             'trades': {'type': INT, 'cn': '交易笔数', 'size': 70},
+                                             'win_rate': {'type': FLOAT, 'cn': '胜率', 'size': 70},
+                                             'avg_return': {'type': FLOAT, 'cn': '平均收益率', 'size': 70}}}
+
+# 策略表现月度汇总：每个策略每月一行，date为月份的第一天；收益率口径同信号表的N日收益率(%)，
+#   最大不利偏移为信号后SUMMARY_HORIZONS最长持有期内最低收盘价相对信号日收盘价的跌幅(%)，未下跌为0；
+#   complete为1表示当月全部信号都已走完最长持有期，之后不再重算，见 backtest.strategy_summary
+TABLE_CN_STOCK_STRATEGY_SUMMARY = {'name': 'cn_stock_strategy_summary', 'cn': '策略表现汇总',
+                                   'columns': {'date': {'type': DATE, 'cn': '月份', 'size': 90},
+                                               'strategy': {'type': VARCHAR(64, _COLLATE), 'cn': '策略', 'size': 0},
+                                               'cn': {'type': VARCHAR(64, _COLLATE), 'cn': '策略名称', 'size': 90},
+                                               'signals': {'type': INT, 'cn': '信号数', 'size': 70}}}
+for _h in SUMMARY_HORIZONS:
+    TABLE_CN_STOCK_STRATEGY_SUMMARY['columns'].update(
+        {f'win_rate_{_h}': {'type': FLOAT, 'cn': f'{_h}日胜率', 'size': 70},
+         f'avg_return_{_h}': {'type': FLOAT, 'cn': f'{_h}日平均收益率', 'size': 90},
+         f'median_return_{_h}': {'type': FLOAT, 'cn': f'{_h}日收益率中位数', 'size': 100}})
+TABLE_CN_STOCK_STRATEGY_SUMMARY['columns'].update(
+    {'mae': {'type': FLOAT, 'cn': '平均最大不利偏移', 'size': 100},
+     'complete': {'type': BIT, 'cn': '已完整', 'size': 70}})
 
 STOCK_KLINE_PATTERN_DATA = {'name': 'cn_stock_pattern_recognitions', 'cn': 'K线形态',
                             'columns': {
@@ -553,6 +620,13 @@ TABLE_CN_STOCK_KLINE_PATTERN = {'name': 'cn_stock_pattern', 'cn': '股票K线形
                                 'columns': TABLE_CN_STOCK_FOREIGN_KEY['columns'].copy()}
 TABLE_CN_STOCK_KLINE_PATTERN['columns'].update(STOCK_KLINE_PATTERN_DATA['columns'])
 
+# K线形态出现记录(长表)：只存非0信号，ClickHouse中按 (pattern, date, code) 排序，按形态、日期区间查询
+TABLE_CN_STOCK_PATTERN_OCCURRENCE = {'name': 'cn_stock_pattern_occurrence', 'cn': 'K线形态出现记录',
+                                     'columns': {'pattern': {'type': VARCHAR(40, _COLLATE), 'cn': '形态', 'size': 90},
+                                                 'date': {'type': DATE, 'cn': '日期', 'size': 90},
+                                                 'code': {'type': VARCHAR(6, _COLLATE), 'cn': '代码', 'size': 60},
+                                                 'signal': {'type': SmallInteger, 'cn': '信号', 'size': 70}}}
+
 TABLE_CN_STOCK_SELECTION = {'name': 'cn_stock_selection', 'cn': '综合选股',
                             'columns': {'date': {'type': DATE, 'cn': '日期', 'size': 0, 'map': 'MAX_TRADE_DATE'},
                                         'secucode': {'type': VARCHAR(10, _COLLATE), 'cn': '全代码', 'size': 0,
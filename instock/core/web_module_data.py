@@ -7,7 +7,7 @@ __date__ = '2023/5/11 '
 
 
 class web_module_data:
-    def __init__(self, mode, type, ico, name, table_name, columns, column_names, primary_key, is_realtime, order_columns=None, order_by=None, url=None):
+    def __init__(self, mode, type, ico, name, table_name, columns, column_names, primary_key, is_realtime, order_columns=None, order_by=None, url=None, rates=False, date_filter=True):
         self.mode = mode  # 模式，query，editor 查询和编辑模式
         self.type = type
         self.ico = ico
@@ -19,6 +19,8 @@ class web_module_data:
         self.is_realtime = is_realtime
         self.order_by = order_by
         self.order_columns = order_columns
+        self.rates = rates  # 信号表，N日收益率列在读取时计算
+        self.date_filter = date_filter  # 按页面选择的日期查询；汇总类的小表为False，查询全部行
         # 如果提供了自定义URL，使用自定义URL，否则使用默认的表格查询URL
         if url:
             self.url = url
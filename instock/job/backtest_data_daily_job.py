@@ -1,133 +1,54 @@
 #!/usr/local/bin/python3
 # -*- coding: utf-8 -*-
-import concurrent.futures
-import pandas as pd
 import os.path
 import sys
-import datetime
 
 cpath_current = os.path.dirname(os.path.dirname(__file__))
 cpath = os.path.abspath(os.path.join(cpath_current, os.pardir))
 sys.path.append(cpath)
 import instock.core.tablestructure as tbs
 import instock.lib.database as mdb
-from instock.lib.database_factory import get_database, execute_sql, insert_db_from_df, read_sql_to_df
-import instock.core.backtest.rate_stats as rate
-from instock.core.singleton_stock import stock_hist_data
+from instock.core.backtest import strategy_summary
+from instock.lib.database_factory import execute_sql, execute_sql_fetch, db_config, DatabaseType
 from instock.lib.simple_logger import get_logger
 logger = get_logger(__name__)
 
+
 # 股票策略回归测试。
+#   信号表只保存 (date, code, name)，N日收益率在读取时按交易日偏移从收盘价面板计算(rate_stats.attach_rates)，
+#   不再每日逐行回写；本作业把旧版本信号表中遗留的 rate_N 列删除一次，
+#   并增量更新策略表现月度汇总(cn_stock_strategy_summary)，见 backtest.strategy_summary。
 def main():
     tables = [tbs.TABLE_CN_STOCK_INDICATORS_BUY, tbs.TABLE_CN_STOCK_INDICATORS_SELL]
     tables.extend(tbs.TABLE_CN_STOCK_STRATEGIES)
-    backtest_columns = list(tbs.TABLE_CN_STOCK_BACKTEST_DATA['columns'])
-    backtest_columns.insert(0, 'code')
-    backtest_columns.insert(0, 'date')
-    backtest_column = backtest_columns
+    for table in tables:
+        drop_rate_columns(table)
+    try:
+        strategy_summary.update()
+    except Exception as e:
+        logger.error(f"backtest_data_daily_job.main处理异常：{e}")
 
-    stocks_data = stock_hist_data().get_data()
-    if stocks_data is None:
-        return
-    for k in stocks_data:
-        date = k[0]
-        break
-    # 回归测试表
-    # with concurrent.futures.ThreadPoolExecutor() as executor:
-    #     for table in tables:
-    #         executor.submit(process, table, stocks_data, date, backtest_column)
 
-    # TODO 当前的表是单例，后续改成多线程
-    for table in tables:
-        process(table, stocks_data, date, backtest_column)
-def process(table, data_all, date, backtest_column):
+def drop_rate_columns(table):
+    """删除信号表中遗留的收益率列，没有时不做任何操作"""
     table_name = table['name']
     if not mdb.checkTableIsExist(table_name):
         return
-
-    column_tail = tuple(table['columns'])[-1]
-    now_date = datetime.datetime.now().date()
-    sql = f"SELECT * FROM `{table_name}` WHERE `date` < '{now_date}' AND `{column_tail}` is NULL"
     try:
-        data = read_sql_to_df(sql)
-        if data is None or len(data.index) == 0:
+        rate_columns = set(tbs.TABLE_CN_STOCK_BACKTEST_DATA['columns'])
+        # 只查当前库，其他库中的同名表不影响
+        schema = "currentDatabase()" if db_config.db_type == DatabaseType.CLICKHOUSE else "DATABASE()"
+        sql = f"SELECT column_name AS name FROM information_schema.columns " \
+              f"WHERE table_schema = {schema} AND table_name = '{table_name}'"
+        columns = [r['name'] for r in execute_sql_fetch(sql) or [] if r['name'] in rate_columns]
+        if not columns:
             return
-
-        subset = data[list(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns'])]
-        # subset['date'] = subset['date'].values.astype('str')
-        subset = subset.astype({'date': 'string'})
-        stocks = [tuple(x) for x in subset.values]
-
-        results = run_check(stocks, data_all, date, backtest_column)
-        if results is None:
-            return
-
-        data_new = pd.DataFrame(results.values())
-        update_db_from_df(data_new, table_name, ('date', 'code'))
-
-    except Exception as e:
-        logger.error(f"backtest_data_daily_job.process处理异常：{table}表{e}")
-
-def update_db_from_df(data, table_name, where):
-    data = data.where(data.notnull(), None)
-    update_string = f'UPDATE `{table_name}` set '
-    where_string = ' where '
-    cols = tuple(data.columns)
-    db = get_database()
-    try:
-        for row in data.values:
-            sql = update_string
-            sql_where = where_string
-            for index, col in enumerate(cols):
-                if col in where:
-                    if len(sql_where) == len(where_string):
-                        if type(row[index]) == str:
-                            sql_where = f'''{sql_where}`{col}` = '{row[index]}' '''
-                        else:
-                            sql_where = f'''{sql_where}`{col}` = {row[index]} '''
-                    else:
-                        if type(row[index]) == str:
-                            sql_where = f'''{sql_where} and `{col}` = '{row[index]}' '''
-                        else:
-                            sql_where = f'''{sql_where} and `{col}` = {row[index]} '''
-                else:
-                    if type(row[index]) == str:
-                        if row[index] is None or row[index] != row[index]:
-                            sql = f'''{sql}`{col}` = NULL, '''
-                        else:
-                            sql = f'''{sql}`{col}` = '{row[index]}', '''
-                    else:
-                        if row[index] is None or row[index] != row[index]:
-                            sql = f'''{sql}`{col}` = NULL, '''
-                        else:
-                            sql = f'''{sql}`{col}` = {row[index]}, '''
-            sql = f'{sql[:-2]}{sql_where}'
-            execute_sql(sql, db)
+        execute_sql(f"ALTER TABLE `{table_name}` {', '.join(f'DROP COLUMN `{c}`' for c in columns)}")
+        logger.info(f"backtest_data_daily_job.drop_rate_columns删除{table_name}表{len(columns)}个收益率列")
     except Exception as e:
-        logger.error(f"database.update_db_from_df处理异常：{sql}{e}")
+        logger.error(f"backtest_data_daily_job.drop_rate_columns处理异常：{table_name}表{e}")
 
-def run_check(stocks, data_all, date, backtest_column, workers=40):
-    data = {}
-    try:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
-            future_to_data = {executor.submit(rate.get_rates, stock,
-                                              data_all.get((date, stock[1], stock[2])), backtest_column,
-                                              len(backtest_column) - 1): stock for stock in stocks}
-            for future in concurrent.futures.as_completed(future_to_data):
-                stock = future_to_data[future]
-                try:
-                    _data_ = future.result()
-                    if _data_ is not None:
-                        data[stock] = _data_
-                except Exception as e:
-                    logger.error(f"backtest_data_daily_job.run_check处理异常：{stock[1]}代码{e}")
-    except Exception as e:
-        logger.error(f"backtest_data_daily_job.run_check处理异常：{e}")
-    if not data:
-        return None
-    else:
-        return data
 
 # main函数入口
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
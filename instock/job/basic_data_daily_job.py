@@ -15,6 +15,7 @@ import instock.lib.database as mdb
 from instock.lib.database_factory import get_database, execute_sql, insert_db_from_df
 from instock.lib.common_check import check_and_delete_old_data_for_realtime_data
 import instock.core.stockfetch as stf
+import instock.core.panel_server as psv
 from instock.core.singleton_stock import stock_data
 from instock.lib.simple_logger import get_logger
 
@@ -35,6 +36,8 @@ def save_nph_stock_spot_data(date, before=True):
         if data is None or len(data.index) == 0:
             return
         check_and_delete_old_data_for_realtime_data(tbs.TABLE_CN_STOCK_SPOT, data, date)
+        # 通知行情数据服务增量刷新面板
+        psv.refresh()
     except Exception as e:
         logger.error(f"basic_data_daily_job.save_stock_spot_data处理异常：{e}")
 
@@ -22,6 +22,7 @@ import indicators_data_daily_job as gdj
 import strategy_data_daily_job as sdj
 import backtest_data_daily_job as bdj
 import klinepattern_data_daily_job as kdj
+import klinepattern_occurrence_job as kocj
 import selection_data_daily_job as sddj
 from instock.lib.simple_logger import get_logger
 logger = get_logger(__name__)
@@ -44,6 +45,8 @@ def main():
         executor.submit(gdj.main)
         # # # # 第4步创建股票k线形态表
         executor.submit(kdj.main)
+        # # # # 第4.1步更新K线形态出现记录
+        executor.submit(kocj.main)
         # # # # 第5步创建股票策略数据表
         executor.submit(sdj.main)
 
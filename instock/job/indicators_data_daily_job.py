@@ -5,7 +5,6 @@
 
 
 
-import concurrent.futures
 import pandas as pd
 import os.path
 import sys
@@ -17,19 +16,41 @@ import instock.lib.run_template as runt
 import instock.core.tablestructure as tbs
 import instock.lib.database as mdb
 from instock.lib.database_factory import execute_sql, insert_db_from_df, read_sql_to_df
-import instock.core.indicator.calculate_indicator as idr
-from instock.core.singleton_stock import stock_hist_data
+import instock.core.indicator.indicator_engine as ide
+import instock.core.indicator.indicator_state as ids
+import instock.core.panel_executor as pex
+from instock.core.singleton_stock import get_stock_hist_data, declare_hist
 from instock.lib.simple_logger import get_logger
 logger = get_logger(__name__)
 
+CALC_THRESHOLD = 90
+# 递推类指标从完整历史重建时需要全部3年数据
+declare_hist('indicators', None if os.environ.get('INDICATOR_STATE', '').lower() == 'rebuild' else CALC_THRESHOLD,
+             ide.INPUT_FIELDS)
+
 def prepare(date):
     try:
-        stocks_data = stock_hist_data(date=date).get_data()
-        if stocks_data is None:
-            return
-        results = run_check(stocks_data, date=date)
-        if results is None:
+        # 区间作业的各个日期共用一次读取的历史数据，取截至当日的快照
+        stocks_panel = get_stock_hist_data(date).as_of(date)
+        if stocks_panel is None:
             return
+        # 递推类指标改用增量状态：INDICATOR_STATE=incremental 每日推进一步，=rebuild 从完整历史重建并校验；
+        #   批量计算只算其余指标，增量状态不可用时回退到全部批量计算
+        state_mode = os.environ.get('INDICATOR_STATE', '').lower()
+        state_data = None
+        if state_mode in ('incremental', 'rebuild'):
+            state_data = ids.run_state(stocks_panel, date, rebuild=(state_mode == 'rebuild'))
+        if state_data is not None:
+            all_columns = list(tbs.STOCK_STATS_DATA['columns'])
+            columns = [c for c in all_columns if c not in ids.RECURSIVE_COLUMNS]
+            data = run_check(stocks_panel, date=date, columns=columns)
+            if data is None:
+                return
+            data = data.merge(state_data, on='code', how='left')[['date', 'code', 'name'] + all_columns]
+        else:
+            data = run_check(stocks_panel, date=date)
+            if data is None:
+                return
 
         table_name = tbs.TABLE_CN_STOCK_INDICATORS['name']
         # 删除老数据。
@@ -39,48 +60,28 @@ def prepare(date):
         #     cols_type = None
         # else:
         cols_type = tbs.get_field_types(tbs.TABLE_CN_STOCK_INDICATORS['columns'])
-        dataKey = pd.DataFrame(results.keys())
-        _columns = tuple(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns'])
-        dataKey.columns = _columns
-
-        dataVal = pd.DataFrame(results.values())
-        dataVal.drop('date', axis=1, inplace=True)  # 删除日期字段，然后和原始数据合并。
-
-        data = pd.merge(dataKey, dataVal, on=['code'], how='left')
-        # data.set_index('code', inplace=True)
         # 单例，时间段循环必须改时间
-        date_str = date.strftime("%Y-%m-%d")
-        if date.strftime("%Y-%m-%d") != data.iloc[0]['date']:
-            data['date'] = date_str
+        data['date'] = date.strftime("%Y-%m-%d")
         insert_db_from_df(data, table_name, cols_type, False, "`date`,`code`")
 
     except Exception as e:
         logger.error(f"indicators_data_daily_job.prepare处理异常：{e}")
 
 
-def run_check(stocks, date=None, workers=40):
-    data = {}
-    columns = list(tbs.STOCK_STATS_DATA['columns'])
-    columns.insert(0, 'code')
-    columns.insert(0, 'date')
-    data_column = columns
+# 在全市场面板上横截面计算所有股票的指标，替代逐股多线程计算；面板按股票分块交给多进程执行
+def run_check(stocks_panel, date=None, calc_threshold=CALC_THRESHOLD, columns=None):
     try:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
-            future_to_data = {executor.submit(idr.get_indicator, k, stocks[k], data_column, date=date): k for k in stocks}
-            for future in concurrent.futures.as_completed(future_to_data):
-                stock = future_to_data[future]
-                try:
-                    _data_ = future.result()
-                    if _data_ is not None:
-                        data[stock] = _data_
-                except Exception as e:
-                    logger.error(f"indicators_data_daily_job.run_check处理异常：{stock[1]}代码{e}")
+        results = pex.get_executor(stocks_panel).map_rows(ide.get_indicators_panel,
+                                                          kwargs={'date': date, 'calc_threshold': calc_threshold,
+                                                                  'columns': columns})
+        results = [r for r in results if r is not None]
+        if results:
+            data = pd.concat(results, ignore_index=True)
+            if len(data.index) > 0:
+                return data
     except Exception as e:
         logger.error(f"indicators_data_daily_job.run_check处理异常：{e}")
-    if not data:
-        return None
-    else:
-        return data
+    return None
 
 
 # 对每日指标数据，进行筛选。将符合条件的。二次筛选出来。
@@ -112,8 +113,6 @@ def guess_buy(date):
         else:
             cols_type = tbs.get_field_types(tbs.TABLE_CN_STOCK_INDICATORS_BUY['columns'])
 
-        _columns_backtest = tuple(tbs.TABLE_CN_STOCK_BACKTEST_DATA['columns'])
-        data = pd.concat([data, pd.DataFrame(columns=_columns_backtest)])
         insert_db_from_df(data, table_name, cols_type, False, "`date`,`code`")
     except Exception as e:
         logger.error(f"indicators_data_daily_job.guess_buy处理异常：{e}")
@@ -146,8 +145,6 @@ def guess_sell(date):
         else:
             cols_type = tbs.get_field_types(tbs.TABLE_CN_STOCK_INDICATORS_SELL['columns'])
 
-        _columns_backtest = tuple(tbs.TABLE_CN_STOCK_BACKTEST_DATA['columns'])
-        data = pd.concat([data, pd.DataFrame(columns=_columns_backtest)])
         insert_db_from_df(data, table_name, cols_type, False, "`date`,`code`")
     except Exception as e:
         logger.error(f"indicators_data_daily_job.guess_sell处理异常：{e}")
@@ -8,6 +8,7 @@ cpath_current = os.path.dirname(os.path.dirname(__file__))
 cpath = os.path.abspath(os.path.join(cpath_current, os.pardir))
 sys.path.append(cpath)
 import instock.lib.database as mdb
+import instock.core.pattern.pattern_occurrence as kpo
 from instock.lib.database_factory import get_database, db_config, DatabaseType
 from instock.lib.simple_logger import get_logger
 logger = get_logger(__name__)
@@ -70,6 +71,7 @@ def create_clickhouse_tables(db):
             ORDER BY code
             SETTINGS index_granularity = 8192
         ''',
+        kpo.TABLE_NAME: kpo.CREATE_TABLE_SQL,
     }
     
     for table_name, sql in table_sqls.items():
@@ -5,7 +5,6 @@
 
 
 
-import concurrent.futures
 import pandas as pd
 import os.path
 import sys
@@ -17,8 +16,9 @@ import instock.lib.run_template as runt
 import instock.core.tablestructure as tbs
 import instock.lib.database as mdb
 from instock.lib.database_factory import get_database, execute_sql, insert_db_from_df
-from instock.core.singleton_stock import stock_hist_data
+from instock.core.singleton_stock import get_stock_hist_data, declare_hist
 import instock.core.pattern.pattern_recognitions as kpr
+import instock.core.panel_executor as pex
 from instock.lib.common_check import check_and_delete_old_data_for_realtime_data
 from instock.lib.simple_logger import get_logger
 # 获取logger
@@ -26,23 +26,19 @@ logger = get_logger(__name__)
 __author__ = 'myh '
 __date__ = '2023/3/10 '
 
+CALC_THRESHOLD = 12
+declare_hist('klinepattern', CALC_THRESHOLD, ('open', 'high', 'low', 'close'))
+
 
 def prepare(date):
     try:
-        stocks_data = stock_hist_data(date=date).get_data()
-        if stocks_data is None:
+        stocks_panel = get_stock_hist_data(date).as_of(date)
+        if stocks_panel is None:
             return
-        results = run_check(stocks_data, date=date)
-        if results is None:
+        data = run_check(stocks_panel, date=date)
+        if data is None:
             return
-        
-        dataKey = pd.DataFrame(results.keys())
-        _columns = tuple(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns'])
-        dataKey.columns = _columns
-
-        dataVal = pd.DataFrame(results.values())
 
-        data = pd.merge(dataKey, dataVal, on=['code'], how='left')
         # 单例，时间段循环必须改时间
         date_str = date.strftime("%Y-%m-%d")
         if date.strftime("%Y-%m-%d") != data.iloc[0]['date']:
@@ -54,27 +50,26 @@ def prepare(date):
         logger.error(f"klinepattern_data_daily_job.prepare处理异常：{e}")
 
 
-def run_check(stocks, date=None, workers=40):
-    data = {}
+# 在全市场面板上批量识别K线形态，替代逐股计算；面板按股票分块交给多进程执行
+def run_check(stocks_panel, date=None):
     columns = tbs.STOCK_KLINE_PATTERN_DATA['columns']
-    data_column = columns
     try:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
-            future_to_data = {executor.submit(kpr.get_pattern_recognition, k, stocks[k], data_column, date=date): k for k in stocks}
-            for future in concurrent.futures.as_completed(future_to_data):
-                stock = future_to_data[future]
-                try:
-                    _data_ = future.result()
-                    if _data_ is not None:
-                        data[stock] = _data_
-                except Exception as e:
-                    logger.error(f"klinepattern_data_daily_job.run_check处理异常：{stock[1]}代码{e}")
+        results = pex.get_executor(stocks_panel).map_rows(kpr.scan_patterns_panel, args=(columns,),
+                                                          kwargs={'date': date, 'calc_threshold': CALC_THRESHOLD})
+        results = [r for r in results if r is not None and len(r.index) > 0]
+        if not results:
+            return None
+        signals = pd.concat(results, ignore_index=True)
+        # 稀疏结果转为每只股票一行，只保留出现形态的股票
+        data = signals.pivot(index='code', columns='pattern', values='signal')
+        data = data.reindex(columns=list(columns)).fillna(0).astype(int)
+        keys = pd.DataFrame(stocks_panel.keys(), columns=list(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns']))
+        data = pd.merge(keys, data, left_on='code', right_index=True, how='inner')
+        if len(data.index) > 0:
+            return data.reset_index(drop=True)
     except Exception as e:
         logger.error(f"klinepattern_data_daily_job.run_check处理异常：{e}")
-    if not data:
-        return None
-    else:
-        return data
+    return None
 
 
 def main():
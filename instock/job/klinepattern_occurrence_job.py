@@ -0,0 +1,41 @@
+#!/usr/local/bin/python3
+# -*- coding: utf-8 -*-
+
+
+import os.path
+import sys
+
+cpath_current = os.path.dirname(os.path.dirname(__file__))
+cpath = os.path.abspath(os.path.join(cpath_current, os.pardir))
+sys.path.append(cpath)
+import instock.core.pattern.pattern_occurrence as kpo
+from instock.lib.simple_logger import get_logger
+# 获取logger
+logger = get_logger(__name__)
+__author__ = 'myh '
+__date__ = '2026/10/16 '
+
+
+# K线形态出现记录作业
+#   python klinepattern_occurrence_job.py                        增量更新，表为空时只识别最近交易日
+#   python klinepattern_occurrence_job.py all                    重新回填全部历史
+#   python klinepattern_occurrence_job.py 2023-03-01 2023-03-21  回填区间
+#   python klinepattern_occurrence_job.py 2023-03-01,2023-03-02  回填指定日期
+def main():
+    try:
+        if len(sys.argv) == 3:
+            kpo.backfill(sys.argv[1], sys.argv[2])
+        elif len(sys.argv) == 2 and sys.argv[1] == 'all':
+            kpo.backfill()
+        elif len(sys.argv) == 2:
+            for date in sys.argv[1].split(','):
+                kpo.backfill(date, date)
+        else:
+            kpo.update()
+    except Exception as e:
+        logger.error(f"klinepattern_occurrence_job.main处理异常：{e}")
+
+
+# main函数入口
+if __name__ == '__main__':
+    main()
@@ -3,10 +3,10 @@
 
 
 
-import concurrent.futures
 import pandas as pd
 import os.path
 import sys
+import time
 
 cpath_current = os.path.dirname(os.path.dirname(__file__))
 cpath = os.path.abspath(os.path.join(cpath_current, os.pardir))
@@ -15,69 +15,153 @@ import instock.lib.run_template as runt
 import instock.core.tablestructure as tbs
 import instock.lib.database as mdb
 from instock.lib.database_factory import get_database, execute_sql, insert_db_from_df
-from instock.core.singleton_stock import stock_hist_data
+from instock.core.singleton_stock import get_stock_hist_data, declare_hist
 from instock.core.stockfetch import fetch_stock_top_entity_data
-from instock.lib.common_check import check_and_delete_old_data_for_realtime_data
+import instock.core.panel_executor as pex
+import instock.core.strategy.strategy_panel as stp
+from instock.core.market_panel import to_datetime64
+from instock.lib.common_check import check_and_delete_old_data_for_realtime_data, check_and_delete_old_data_for_dates
 from instock.lib.simple_logger import get_logger
 # 获取logger
 logger = get_logger(__name__)
 
+# 环境变量 STRATEGY_ENGINE 选择策略的面板实现或逐股实现，见 strategy_panel.get_engine
+declare_hist('strategy', max(s['lookback'] for s in tbs.TABLE_CN_STOCK_STRATEGIES),
+             set(('open', 'high', 'low', 'close', 'volume', 'p_change')).union(
+                 *[s.get('fields', ()) for s in tbs.TABLE_CN_STOCK_STRATEGIES]))
 
-def prepare(date, strategy, stocks_data=None):
+
+def prepare_dates(dates, strategies):
+    """
+    一次计算全部作业日期的全部策略，每个策略表一次删除这些日期的旧数据、一次批量写入
+    内置策略：股票按行分块并发，每块只截取一次数据，依次计算各日期、各策略；
+    声明式选股条件：覆盖全部日期的一个窗口整体求值
+    :param dates: 交易日期列表
+    :param strategies: 策略字典列表
+    """
+    if not dates:
+        return
+    try:
+        panel = get_stock_hist_data(min(dates)).get_panel()
+        print(f"策略处理时间{min(dates)}至{max(dates)}共{len(dates)}天股票数{0 if panel is None else len(panel)}")
+        if panel is None:
+            return
+        builtins = [s for s in strategies if s.get('screen') is None]
+        screens = [s for s in strategies if s.get('screen') is not None]
+        stock_tops = None
+        if any(s['func'] is not None and s['func'].__name__ == 'check_high_tight' for s in builtins):
+            stock_tops = {date: fetch_stock_top_entity_data(date) for date in dates}
+        start = time.perf_counter()
+        selected, timings = stp.run_fused(panel, dates, builtins, stock_tops) if builtins else ({}, {})
+        for strategy in screens:
+            screen_start = time.perf_counter()
+            try:
+                masks = strategy['screen'].evaluate_dates(panel, dates)
+                for date in dates:
+                    selected.setdefault(date, {})[strategy['name']] = masks[str(to_datetime64(date))]
+            except Exception as e:
+                logger.exception(f"strategy_data_daily_job.prepare_dates处理异常：{strategy['name']}策略{e}")
+            timings[strategy['name']] = time.perf_counter() - screen_start
+        elapsed = time.perf_counter() - start
+
+        for strategy in strategies:
+            try:
+                frames = []
+                for date in dates:
+                    mask = selected.get(date, {}).get(strategy['name'])
+                    if mask is None or not mask.any():
+                        continue
+                    frames.append(pd.DataFrame({'date': date.strftime("%Y-%m-%d"), 'code': panel.codes[mask],
+                                                'name': panel.names[mask]}))
+                print(f"{strategy['cn']}策略选股结果{sum(len(f.index) for f in frames)}条")
+                save_results(strategy, frames, dates)
+            except Exception as e:
+                logger.exception(f"strategy_data_daily_job.prepare_dates处理异常：{strategy['name']}策略{e}")
+        # 各策略耗时为各块、各日期计算时间之和，按耗时从大到小输出
+        report = '，'.join(f"{s['cn']}{timings[s['name']]:.3f}秒" for s in
+                          sorted(strategies, key=lambda s: -timings.get(s['name'], 0.0)) if s['name'] in timings)
+        logger.info(f"策略{min(dates)}至{max(dates)}计算耗时{elapsed:.3f}秒：{report}")
+    except Exception as e:
+        logger.exception(f"strategy_data_daily_job.prepare_dates处理异常：{e}")
+
+
+def prepare(date, strategy, stocks_data=None, ctx=None):
     """
     准备策略所需的股票数据
     :param date: 交易日期，由run_template自动传递
     :param strategy: 策略字典，也就是主函数传递的参数
-    :param stocks_data: 从数据库获取的股票数据(批量策略计算时建议传递，减少重复查询)
+    :param stocks_data: 股票数据，默认取截至date的历史数据快照(进程内只读取一次)
+    :param ctx: 截至date的策略上下文，默认按stocks_data新建
     """
     try:
         if stocks_data is None:
-            stocks_data = stock_hist_data(date=date).get_data()
+            stocks_data = get_stock_hist_data(date).get_data(date)
         print(f"策略{strategy['cn']}处理时间{date}股票数{0 if stocks_data is None else len(stocks_data)}")
         if stocks_data is None:
             return
         table_name = strategy['name']
         strategy_func = strategy['func']
-        results = run_check(strategy_func, table_name, stocks_data, date)
+        results = run_check(strategy_func, table_name, stocks_data, date, strategy.get('lookback'), strategy, ctx)
         print(f"{strategy['cn']}策略选股结果{results}")
         if results is None:
             return
-
-        data = pd.DataFrame(results)
-        columns = tuple(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns'])
-        data.columns = columns
-        _columns_backtest = tuple(tbs.TABLE_CN_STOCK_BACKTEST_DATA['columns'])
-        data = pd.concat([data, pd.DataFrame(columns=_columns_backtest)])
-        date_str = pd.to_datetime(date)
-        if date_str != data.iloc[0]['date']:
-            data['date'] = date_str
-        # 更新数据
-        check_and_delete_old_data_for_realtime_data(strategy, data, date)
+        save_results(strategy, results, date)
 
     except Exception as e:
         logger.exception(f"strategy_data_daily_job.prepare处理异常：{strategy}策略{e}")
 
 
-def run_check(strategy_fun, table_name, stocks, date, workers=40):
+def save_results(strategy, results, date):
+    """
+    把选股结果写入策略表
+    :param results: 单个日期的 (date, code, name) 列表；或 date、code、name 列的DataFrame列表，此时date为日期列表，整批替换
+    """
+    if isinstance(date, (list, tuple)):
+        data = pd.concat(results, ignore_index=True) if results else pd.DataFrame(
+            columns=tuple(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns']))
+        data['date'] = pd.to_datetime(data['date'])
+        check_and_delete_old_data_for_dates(strategy, data, date)
+        return
+    data = pd.DataFrame(results)
+    columns = tuple(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns'])
+    data.columns = columns
+    date_str = pd.to_datetime(date)
+    if date_str != data.iloc[0]['date']:
+        data['date'] = date_str
+    # 更新数据
+    check_and_delete_old_data_for_realtime_data(strategy, data, date)
+
+
+def run_check(strategy_fun, table_name, stocks, date, lookback=None, strategy=None, ctx=None):
     is_check_high_tight = False
-    if strategy_fun.__name__ == 'check_high_tight':
+    stock_tops = None
+    if strategy_fun is not None and strategy_fun.__name__ == 'check_high_tight':
         stock_tops = fetch_stock_top_entity_data(date)
         if stock_tops is not None:
             is_check_high_tight = True
     data = []
     try:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        engine = stp.get_engine()
+        # 声明式选股条件只有面板实现
+        if strategy is not None and strategy.get('panel_func') is not None and (engine != 'stock' or strategy_fun is None):
+            # 全市场面板实现，一次算出全部股票
+            if ctx is None:
+                ctx = stp.strategy_context(stocks.get_panel(), date)
+            selected = stp.run_panel(strategy, ctx, stock_tops)
+            data = [k for k, s in zip(ctx.panel.keys(), selected) if s]
+            if engine == 'verify' and strategy_fun is not None:
+                stp.check_equivalence(ctx, [strategy], stock_tops)
+        else:
+            # 多进程执行，行情数据经共享内存传递
+            executor = pex.get_executor(stocks.get_panel())
             if is_check_high_tight:
-                future_to_data = {executor.submit(strategy_fun, k, stocks[k], date=date, istop=(k[1] in stock_tops)): k for k in stocks}
+                results = executor.map_stocks(strategy_fun, list(stocks), kwargs={'date': date},
+                                              key_kwargs=lambda k: {'istop': (k[1] in stock_tops)},
+                                              end_date=date, lookback=lookback)
             else:
-                future_to_data = {executor.submit(strategy_fun, k, stocks[k], date=date): k for k in stocks}
-            for future in concurrent.futures.as_completed(future_to_data):
-                stock = future_to_data[future]
-                try:
-                    if future.result():
-                        data.append(stock)
-                except Exception as e:
-                    logger.error(f"strategy_data_daily_job.run_check处理异常：{stock[1]}代码{e}策略{table_name}")
+                results = executor.map_stocks(strategy_fun, list(stocks), kwargs={'date': date},
+                                              end_date=date, lookback=lookback)
+            data = [stock for stock, result in results.items() if result]
     except Exception as e:
         logger.exception(f"strategy_data_daily_job.run_check处理异常：{e}策略{table_name}")
     if not data:
@@ -87,16 +171,11 @@ def run_check(strategy_fun, table_name, stocks, date, workers=40):
 
 
 def main():
-    # 使用方法传递。
-    # with concurrent.futures.ThreadPoolExecutor() as executor:
-    #     for strategy in tbs.TABLE_CN_STOCK_STRATEGIES:
-    #         executor.submit(runt.run_with_args, prepare, strategy)
-    stocks_data = stock_hist_data().get_data()
-    for strategy in tbs.TABLE_CN_STOCK_STRATEGIES:
-        try:
-            runt.run_with_args(prepare, strategy, stocks_data)
-        except Exception as e:
-            logger.exception(f"strategy_data_daily_job.main处理异常：{strategy}策略{e}")
+    # 作业日期(当前、枚举或区间)一次计算，不再逐日提交；单策略单日期可调用 prepare
+    try:
+        prepare_dates(runt.get_run_dates(), tbs.TABLE_CN_STOCK_STRATEGIES)
+    except Exception as e:
+        logger.exception(f"strategy_data_daily_job.main处理异常：{e}")
     # runt.run_with_args(prepare, tbs.TABLE_CN_STOCK_STRATEGIES[2], stocks_data)
     # runt.run_with_args(prepare, tbs.TABLE_CN_STOCK_STRATEGIES[3], stocks_data)
     # runt.run_with_args(prepare, tbs.TABLE_CN_STOCK_STRATEGIES[1])
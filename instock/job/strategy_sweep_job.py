@@ -0,0 +1,80 @@
+#!/usr/local/bin/python3
+# -*- coding: utf-8 -*-
+
+
+import datetime
+import os.path
+import sys
+
+cpath_current = os.path.dirname(os.path.dirname(__file__))
+cpath = os.path.abspath(os.path.join(cpath_current, os.pardir))
+sys.path.append(cpath)
+import instock.core.tablestructure as tbs
+import instock.lib.database as mdb
+import instock.lib.trade_time as trd
+from instock.lib.database_factory import execute_sql, insert_db_from_df
+from instock.core.singleton_stock import get_stock_hist_data, declare_hist
+from instock.core.backtest import portfolio
+from instock.core.backtest import sweep
+from instock.lib.simple_logger import get_logger
+# 获取logger
+logger = get_logger(__name__)
+__author__ = 'myh '
+__date__ = '2026/10/16 '
+
+SWEEP_YEARS = 3  # 不指定区间时回测最近几年
+
+# 策略参数寻优作业，结果写入 cn_stock_strategy_sweep，搜索空间见 instock/core/backtest/sweep.py
+#   python strategy_sweep_job.py                        最近SWEEP_YEARS年
+#   python strategy_sweep_job.py 2018-01-01 2023-12-31  指定回测区间
+# 环境变量：
+#   SWEEP_METHOD  grid(默认)/random/evolve
+#   SWEEP_METRIC  排名指标，默认sharpe
+_specs = sweep.builtin_specs() + sweep.load_templates()
+declare_hist('sweep', max([s['lookback'] for s in _specs], default=0),
+             set(('open', 'high', 'low', 'close', 'volume', 'p_change') + portfolio.BACKTEST_FIELDS).union(
+                 *[s.get('fields', ()) for s in _specs]))
+
+
+def main():
+    try:
+        if len(sys.argv) == 3:
+            date_start = datetime.datetime.strptime(sys.argv[1], "%Y-%m-%d").date()
+            date_end = datetime.datetime.strptime(sys.argv[2], "%Y-%m-%d").date()
+        else:
+            _, date_end = trd.get_trade_date_last()
+            date_start = date_end - datetime.timedelta(days=365 * SWEEP_YEARS)
+        method = os.environ.get('SWEEP_METHOD', 'grid').lower()
+        metric = os.environ.get('SWEEP_METRIC', sweep.SWEEP_METRIC)
+        panel = get_stock_hist_data(date_start).get_panel()
+        print(f"策略参数寻优{date_start}至{date_end}股票数{0 if panel is None else len(panel)}")
+        if panel is None:
+            return
+        data = sweep.run(panel, _specs, method, date_start=date_start, date_end=date_end, metric=metric)
+        if data is None:
+            return
+        save_results(data, date_start, date_end, method)
+    except Exception as e:
+        logger.error(f"strategy_sweep_job.main处理异常：{e}")
+
+
+def save_results(data, date_start, date_end, method):
+    """按 (date, strategy) 整批替换寻优结果"""
+    table_name = tbs.TABLE_CN_STOCK_STRATEGY_SWEEP['name']
+    data = data.copy()
+    data.insert(0, 'date', date_end.strftime("%Y-%m-%d"))
+    data['date_start'] = date_start.strftime("%Y-%m-%d")
+    data['method'] = method
+    data = data[list(tbs.TABLE_CN_STOCK_STRATEGY_SWEEP['columns'])]
+    if mdb.checkTableIsExist(table_name):
+        strategies = ','.join(f"'{s}'" for s in data['strategy'].unique())
+        execute_sql(f"DELETE FROM `{table_name}` WHERE `date` = '{date_end}' AND `strategy` IN ({strategies})")
+        cols_type = None
+    else:
+        cols_type = tbs.get_field_types(tbs.TABLE_CN_STOCK_STRATEGY_SWEEP['columns'])
+    insert_db_from_df(data, table_name, cols_type, False, "`date`,`strategy`,`params`")
+
+
+# main函数入口
+if __name__ == '__main__':
+    main()
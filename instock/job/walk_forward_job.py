@@ -0,0 +1,40 @@
+#!/usr/local/bin/python3
+# -*- coding: utf-8 -*-
+
+
+import os.path
+import sys
+
+cpath_current = os.path.dirname(os.path.dirname(__file__))
+cpath = os.path.abspath(os.path.join(cpath_current, os.pardir))
+sys.path.append(cpath)
+import pandas as pd
+from instock.core.backtest import walk_forward
+from instock.lib.simple_logger import get_logger
+# 获取logger
+logger = get_logger(__name__)
+__author__ = 'myh '
+__date__ = '2026/10/16 '
+
+
+# 全历史分段滚动回测，按自然年分段读取行情，进度见 progress_tracker 的 walk_forward 任务
+#   python walk_forward_job.py 2010-01-01                回测2010年至今
+#   python walk_forward_job.py 2010-01-01 2023-12-31     回测指定区间
+# 环境变量 WALK_FORWARD_YEARS 每段的自然年数，默认1
+def main():
+    try:
+        if len(sys.argv) < 2:
+            print("用法：python walk_forward_job.py 开始日期 [结束日期]")
+            return
+        chunk_years = int(os.environ.get('WALK_FORWARD_YEARS', walk_forward.CHUNK_YEARS))
+        stats, _ = walk_forward.run(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None,
+                                    chunk_years=chunk_years)
+        with pd.option_context('display.max_columns', None, 'display.width', 200):
+            print(stats)
+    except Exception as e:
+        logger.error(f"walk_forward_job.main处理异常：{e}")
+
+
+# main函数入口
+if __name__ == '__main__':
+    main()
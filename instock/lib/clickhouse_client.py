@@ -303,7 +303,88 @@ class ClickHouseClient:
         print(sql)
         logger.info(f"查询股票数据: code={code}, 日期范围={start_date}~{end_date}")
         return self.query_to_dataframe(sql, parameters)
-    
+
+    def query_arrow(self, sql: str, parameters: Optional[Dict] = None):
+        """
+        执行查询并以Arrow列式缓冲区分批读取结果，不经过逐行Python对象
+
+        Args:
+            sql: SQL查询语句
+            parameters: 查询参数
+
+        Returns:
+            pyarrow.Table或None
+        """
+        if not self.client:
+            logger.error("ClickHouse客户端未连接")
+            return None
+        try:
+            import pyarrow as pa
+            with self.client.query_arrow_stream(sql, parameters=parameters, use_strings=True) as stream:
+                batches = list(stream)
+            if not batches:
+                return None
+            table = pa.Table.from_batches(batches)
+            logger.info(f"Arrow查询成功，返回 {table.num_rows} 行数据")
+            return table
+        except ImportError:
+            logger.error("Arrow查询需要安装pyarrow: pip install pyarrow")
+        except Exception as e:
+            logger.error(f"Arrow查询失败: {str(e)}")
+            logger.error(f"SQL: {sql}")
+        return None
+
+    def get_stock_data_arrow(self,
+                             code: Optional[str] = None,
+                             start_date: Optional[Union[str, date, datetime]] = None,
+                             end_date: Optional[Union[str, date, datetime]] = None,
+                             columns: Optional[List[str]] = None,
+                             float_type: str = 'Float64',
+                             order_by: str = "date ASC"):
+        """
+        批量获取股票历史数据（Arrow列式），用于全市场多年数据读取
+
+        类型在SQL中转换：数值列转为float_type(Float64/Float32)，不再有Decimal；
+        date为date32(按天计的int32)；code为字典编码(LowCardinality)，相当于分类类型。
+
+        Args:
+            code: 股票代码，如果为None则查询所有股票
+            start_date: 开始日期
+            end_date: 结束日期
+            columns: 需要的列(列裁剪)，默认 code、date 和行情数值列
+            float_type: 数值列类型，Float64 或 Float32
+            order_by: 排序方式
+
+        Returns:
+            pyarrow.Table或None
+        """
+        if columns is None:
+            columns = ["code", "date", "open", "high", "low", "close", "preclose", "volume", "amount", "turn",
+                       "p_change"]
+        select = []
+        for col in columns:
+            if col == 'code':
+                select.append("toLowCardinality(toString(code)) AS code")
+            elif col == 'date':
+                select.append("toDate(date) AS date")
+            else:
+                select.append(f"to{float_type}({col}) AS {col}")
+        sql = f"SELECT {','.join(select)} FROM cn_stock_history WHERE 1=1"
+        parameters = {}
+        if code:
+            sql += " AND code = %(code)s"
+            parameters['code'] = code
+        if start_date:
+            sql += " AND date >= %(start_date)s"
+            parameters['start_date'] = self._format_date(start_date)
+        if end_date:
+            sql += " AND date <= %(end_date)s"
+            parameters['end_date'] = self._format_date(end_date)
+        if order_by:
+            sql += f" ORDER BY {order_by}"
+        logger.info(f"Arrow查询股票数据: code={code}, 日期范围={start_date}~{end_date}")
+        return self.query_arrow(sql, parameters)
+
     def get_stock_list(self, market: Optional[str] = None) -> Optional[pd.DataFrame]:
         """
         获取股票列表
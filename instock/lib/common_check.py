@@ -101,3 +101,25 @@ def check_and_delete_old_data_for_realtime_data(table_object, data, date, cols_t
     
     return None
 
+
+
+def check_and_delete_old_data_for_dates(table_object, data, dates):
+    """
+    按日期整批替换：删除dates中各日期的旧数据，再一次性插入data，用于区间回填
+
+    Args:
+        table_object: 表对象
+        data: 数据DataFrame，可为空
+        dates: 日期列表
+    """
+    table_name = table_object['name']
+    if mdb.checkTableIsExist(table_name):
+        date_list = ','.join(f"'{d}'" for d in dates)
+        execute_sql(f"DELETE FROM `{table_name}` where `date` IN ({date_list})")
+        cols_type = None
+    else:
+        cols_type = tbs.get_field_types(table_object['columns'])
+
+    if data is None or len(data.index) == 0:
+        return
+    insert_db_from_df(data, table_name, cols_type, False, "`date`,`code`")
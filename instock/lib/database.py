@@ -559,37 +559,11 @@ def _upsert_history_data(data, table_name):
             first_row = sample_data.iloc[0]
             executeSql(delete_sql, (first_row['date'], first_row['code']))
         
-        # 执行批量UPSERT操作
-        upsert_count = 0
-        for _, row in data.iterrows():
-            date_val = row['date']
-            code_val = row['code']
-            
-            # 使用 INSERT ... ON DUPLICATE KEY UPDATE 实现UPSERT
-            columns = list(data.columns)
-            column_names = ', '.join([f"`{col}`" for col in columns])
-            placeholders = ', '.join(['%s'] * len(columns))
-            
-            # 构建UPDATE部分（排除主键字段）
-            update_parts = []
-            for col in columns:
-                if col not in ['date', 'code']:
-                    update_parts.append(f"`{col}` = VALUES(`{col}`)")
-            
-            if update_parts:  # 如果有可更新的字段
-                upsert_sql = f"""
-                INSERT INTO `{table_name}` ({column_names}) 
-                VALUES ({placeholders})
-                ON DUPLICATE KEY UPDATE {', '.join(update_parts)}
-                """
-            else:  # 如果只有主键字段，使用IGNORE
-                upsert_sql = f"""
-                INSERT IGNORE INTO `{table_name}` ({column_names}) 
-                VALUES ({placeholders})
-                """
-            
-            executeSql(upsert_sql, tuple(row[col] for col in columns))
-            upsert_count += 1
+        # 执行批量UPSERT操作(多行 INSERT ... ON DUPLICATE KEY UPDATE)
+        from instock.lib.database_factory import upsert_db_from_df
+        if not upsert_db_from_df(data, table_name, ('date', 'code')):
+            return False
+        upsert_count = len(data.index)
         
         logger.info(f"成功处理 {upsert_count} 条记录到历史表 {table_name}")
         return True
@@ -123,6 +123,15 @@ class DatabaseInterface:
         """从DataFrame插入数据"""
         raise NotImplementedError
 
+    def upsert_from_dataframe(self, df: pd.DataFrame, table_name: str, keys=('date', 'code')):
+        """按keys批量写入：已有的行更新df的其余列，没有的行插入"""
+        raise NotImplementedError
+
+    def _dataframe_to_rows(self, df: pd.DataFrame) -> List[Tuple]:
+        """将DataFrame转换为参数元组列表，日期转为字符串，NaN转为None"""
+        return [tuple(None if isinstance(v, float) and v != v else v for v in record.values())
+                for record in self._convert_dataframe_to_records(df)]
+
 # MySQL实现
 class MySQLDatabase(DatabaseInterface):
     """MySQL数据库实现"""
@@ -195,19 +204,24 @@ class MySQLDatabase(DatabaseInterface):
             logger.error(f"MySQL DataFrame查询错误: {e}, SQL: {sql}")
             return pd.DataFrame()
     
+    def _ensure_connection(self):
+        """执行连接断开时重连"""
+        if not self._connection.open:
+            self._connection = pymysql.connect(**{
+                'host': self.config['host'],
+                'port': self.config['port'],
+                'user': self.config['user'],
+                'password': self.config['password'],
+                'database': self.config['database'],
+                'charset': self.config['charset'],
+                'autocommit': True
+            })
+        return self._connection
+
     def execute(self, sql: str, *params) -> bool:
         """执行SQL语句"""
         try:
-            if not self._connection.open:
-                self._connection = pymysql.connect(**{
-                    'host': self.config['host'],
-                    'port': self.config['port'],
-                    'user': self.config['user'],
-                    'password': self.config['password'],
-                    'database': self.config['database'],
-                    'charset': self.config['charset'],
-                    'autocommit': True
-                })
+            self._ensure_connection()
             
             with self._connection.cursor() as cursor:
                 if params:
@@ -254,6 +268,34 @@ class MySQLDatabase(DatabaseInterface):
             logger.error(f"MySQL DataFrame插入错误: {e}, 表: {table_name}")
             return False
 
+    def upsert_from_dataframe(self, df: pd.DataFrame, table_name: str, keys=('date', 'code')):
+        """
+        批量写入MySQL表：多行 INSERT ... ON DUPLICATE KEY UPDATE，表需以keys为主键或唯一索引
+
+        Returns:
+            bool: 操作是否成功
+        """
+        if df is None or df.empty:
+            return True
+        cols = tuple(df.columns)
+        values = [c for c in cols if c not in keys]
+        column_names = ', '.join(f"`{c}`" for c in cols)
+        placeholders = ', '.join(['%s'] * len(cols))
+        if values:
+            sql = f"INSERT INTO `{table_name}` ({column_names}) VALUES ({placeholders}) " \
+                  f"ON DUPLICATE KEY UPDATE {', '.join(f'`{c}` = VALUES(`{c}`)' for c in values)}"
+        else:
+            sql = f"INSERT IGNORE INTO `{table_name}` ({column_names}) VALUES ({placeholders})"
+        try:
+            with self._ensure_connection().cursor() as cursor:
+                # executemany 把多行合并为少量多值INSERT语句
+                cursor.executemany(sql, self._dataframe_to_rows(df))
+            logger.info(f"成功写入 {len(df)} 条记录到 MySQL 表 {table_name}")
+            return True
+        except Exception as e:
+            logger.error(f"MySQL DataFrame批量写入错误: {e}, 表: {table_name}")
+            return False
+
 # ClickHouse实现
 class ClickHouseDatabase(DatabaseInterface):
     """ClickHouse数据库实现"""
@@ -487,6 +529,43 @@ class ClickHouseDatabase(DatabaseInterface):
             logger.error(f"ClickHouse DataFrame插入错误: {e}, 表: {table_name}")
             return False
     
+    def upsert_from_dataframe(self, df: pd.DataFrame, table_name: str, keys=('date', 'code')):
+        """
+        批量写入ClickHouse表：先一次按keys删除已有的行(一个mutation)再整批插入，不逐行 ALTER UPDATE。
+        ReplacingMergeTree表同样先删除：直接插入的新版本在后台合并前与旧行同时可见，而读取方不使用FINAL
+
+        Returns:
+            bool: 操作是否成功
+        """
+        if df is None or df.empty:
+            return True
+        try:
+            if self._table_exists(table_name):
+                where = self._keys_where(df, list(keys))
+                if not self.execute(f"ALTER TABLE {table_name} DELETE WHERE {where} SETTINGS mutations_sync = 1"):
+                    return False
+            return self.insert_from_dataframe(df, table_name)
+        except Exception as e:
+            logger.error(f"ClickHouse DataFrame批量写入错误: {e}, 表: {table_name}")
+            return False
+
+    @staticmethod
+    def _keys_index(df: pd.DataFrame, keys):
+        """keys列转为字符串的MultiIndex，日期统一为YYYY-MM-DD"""
+        columns = []
+        for k in keys:
+            col = df[k]
+            if col.dtype.name.startswith('datetime'):
+                col = col.dt.strftime('%Y-%m-%d')
+            columns.append(col.astype(str).values)
+        return pd.MultiIndex.from_arrays(columns, names=keys)
+
+    def _keys_where(self, df: pd.DataFrame, keys):
+        """按keys取值的WHERE条件：(k1, k2) IN ((v1, v2), ...)"""
+        index = self._keys_index(df, keys).unique()
+        tuples = ', '.join('(' + ', '.join("'" + str(v).replace("'", "\\'") + "'" for v in t) + ')' for t in index)
+        return f"({', '.join(keys)}) IN ({tuples})"
+
     def _convert_dataframe_for_clickhouse(self, df: pd.DataFrame, cols_type=None):
         """转换DataFrame数据类型以适配ClickHouse，保持原始格式"""
         try:
@@ -806,3 +885,7 @@ def read_sql_to_df(sql: str, params: Optional[Union[Tuple, Dict]] = None) -> pd.
 def insert_db_from_df(data: pd.DataFrame, table_name: str, cols_type=None, write_index=False, primary_keys=None, indexs=None):
     """从DataFrame插入数据（兼容性函数）"""
     return get_database().insert_from_dataframe(data, table_name, cols_type, write_index, primary_keys)
+
+def upsert_db_from_df(data: pd.DataFrame, table_name: str, keys=('date', 'code')):
+    """按keys批量写入：已有的行更新，没有的行插入"""
+    return get_database().upsert_from_dataframe(data, table_name, keys)
@@ -18,6 +18,48 @@ __author__ = 'myh '
 __date__ = '2023/3/10 '
 
 
+# 命令行参数中最早的作业日期，没有日期参数时返回None，用于预先确定需要读取的历史数据范围
+def get_args_start_date():
+    if len(sys.argv) not in (2, 3):
+        return None
+    try:
+        dates = []
+        for date in sys.argv[1].split(','):
+            tmp_year, tmp_month, tmp_day = date.strip().split("-")
+            dates.append(datetime.date(int(tmp_year), int(tmp_month), int(tmp_day)))
+        return min(dates).strftime("%Y-%m-%d")
+    except Exception as e:
+        logger.error(f"run_template.get_args_start_date处理异常：{sys.argv}{e}")
+    return None
+
+
+# 命令行参数对应的全部作业日期(只含交易日)，与 run_with_args 的日期口径一致，用于一次处理多个日期的作业
+def get_run_dates():
+    dates = []
+    try:
+        if len(sys.argv) == 3:
+            tmp_year, tmp_month, tmp_day = sys.argv[1].split("-")
+            run_date = datetime.date(int(tmp_year), int(tmp_month), int(tmp_day))
+            tmp_year, tmp_month, tmp_day = sys.argv[2].split("-")
+            end_date = datetime.date(int(tmp_year), int(tmp_month), int(tmp_day))
+            while run_date <= end_date:
+                if trd.is_trade_date(run_date):
+                    dates.append(run_date)
+                run_date += datetime.timedelta(days=1)
+        elif len(sys.argv) == 2:
+            for date in sys.argv[1].split(','):
+                tmp_year, tmp_month, tmp_day = date.split("-")
+                run_date = datetime.date(int(tmp_year), int(tmp_month), int(tmp_day))
+                if trd.is_trade_date(run_date):
+                    dates.append(run_date)
+        else:
+            run_date, run_date_nph = trd.get_trade_date_last()
+            dates.append(run_date_nph)
+    except Exception as e:
+        logger.error(f"run_template.get_run_dates处理异常：{sys.argv}{e}")
+    return dates
+
+
 # 通用函数，获得日期参数，支持批量作业。
 def run_with_args(run_fun, *args):
     if len(sys.argv) == 3:
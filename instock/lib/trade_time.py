@@ -67,6 +67,26 @@ def get_next_trade_date(date):
     return tmp_date
 
 
+def get_trade_date_before(date, n):
+    """返回date(含)往前第n个交易日，交易日历不可用时按日历天数估算"""
+    trade_date = stock_trade_date().get_data()
+    if trade_date is not None:
+        dates = sorted(d for d in trade_date if d <= date)
+        if len(dates) >= n:
+            return dates[-n]
+    return date + datetime.timedelta(days=-(n * 7 // 5 + 15))
+
+
+def get_trade_date_after(date, n):
+    """返回date(含)往后第n个交易日，交易日历不可用或不够长时按日历天数估算"""
+    trade_date = stock_trade_date().get_data()
+    if trade_date is not None:
+        dates = sorted(d for d in trade_date if d >= date)
+        if len(dates) >= n:
+            return dates[n - 1]
+    return date + datetime.timedelta(days=n * 7 // 5 + 15)
+
+
 OPEN_TIME = (
     (datetime.time(9, 15, 0), datetime.time(11, 30, 0)),
     (datetime.time(13, 0, 0), datetime.time(15, 0, 0)),
@@ -135,10 +155,14 @@ def is_open(now_time):
     return False
 
 
-def get_trade_hist_interval(date):
+def get_trade_hist_interval(date, lookback=None):
     tmp_year, tmp_month, tmp_day = date.split("-")
     date_end = datetime.datetime(int(tmp_year), int(tmp_month), int(tmp_day))
-    date_start = (date_end + datetime.timedelta(days=-(365 * 3))).strftime("%Y%m%d")
+    if lookback is None:
+        date_start = (date_end + datetime.timedelta(days=-(365 * 3))).strftime("%Y%m%d")
+    else:
+        # 只取最近lookback个交易日
+        date_start = get_trade_date_before(date_end.date(), lookback).strftime("%Y%m%d")
 
     now_time = datetime.datetime.now()
     now_date = now_time.date()
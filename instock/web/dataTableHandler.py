@@ -13,6 +13,8 @@ import math
 import numpy as np
 import instock.lib.trade_time as trd
 import instock.core.singleton_stock_web_module_data as sswmd
+import instock.core.tablestructure as tbs
+import instock.core.backtest.rate_stats as rate
 import instock.web.base as webBase
 import pandas as pd
 # 引入数据库工厂
@@ -111,7 +113,7 @@ class GetStockDataHandler(webBase.BaseHandler, ABC):
             params = []
             
             # 日期条件
-            if date is not None:
+            if date is not None and web_module_data.date_filter:
                 if db_config.db_type == DatabaseType.CLICKHOUSE:
                     where_conditions.append("toDate(date) = %s")
                 else:
@@ -189,6 +191,10 @@ class GetStockDataHandler(webBase.BaseHandler, ABC):
                 try:
                     query_params = params + [page_size, offset]
                     data = db.query(sql, *query_params)
+                    # 信号表的N日收益率在读取时按交易日偏移从收盘价面板计算
+                    if web_module_data.rates and data:
+                        data = rate.attach_rates(pd.DataFrame(data), tuple(
+                            tbs.TABLE_CN_STOCK_BACKTEST_DATA['columns'])).to_dict('records')
                     
                     # 清理数据中的 NaN 值
                     cleaned_data = []
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import datetime
+import unittest
+import numpy as np
+import pandas as pd
+import instock.core.tablestructure as tbs
+from instock.core.market_panel import market_panel
+from instock.core.strategy import strategy_panel as stp
+
+__author__ = 'myh '
+__date__ = '2026/10/16 '
+
+
+def make_panel(seed=0, stocks=300, days=420):
+    """
+    合成全市场面板：不同波动、趋势的股票，含涨停/跌停、放量、随机停牌和上市不久的股票
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2022-01-03', periods=days)
+    rows = []
+    for c in range(stocks):
+        kind = c % 6
+        # 每10只中有1只上市不足一个策略窗口，覆盖K线数不足的分支
+        start = days - rng.integers(3, 80) if c % 10 == 9 else rng.integers(0, 200)
+        n = days - start
+        seg = np.repeat(rng.normal(0.0, 0.02, n // 20 + 1), 20)[:n]
+        r = rng.normal(seg, [0.04, 0.02, 0.01, 0.03, 0.005, 0.02][kind], n)
+        if kind == 4:
+            r += 0.012
+        if kind == 5:
+            # 连续大涨一段，供高而窄的旗形等策略选中
+            pos = rng.integers(max(0, n - 200), max(1, n - 40))
+            r[pos:pos + 12] = rng.normal(0.085, 0.01, len(r[pos:pos + 12]))
+        limit_up = rng.random(n) < (0.06 if kind < 4 else 0.0)
+        limit_up[1:] |= limit_up[:-1] & (rng.random(n - 1) < 0.5)
+        r[limit_up] = 0.1
+        r[rng.random(n) < (0.02 if kind < 4 else 0.0)] = -0.1
+        # 在比对的交易日上构造形态：放量跌停(巨量跌停)、小跌后连续涨停(低ATR成长)
+        climax = days - 1 - start if c % 30 == 0 else -1
+        if climax >= 0:
+            r[climax] = -0.1
+        rally = days - 25 - start if c % 30 == 5 else -1
+        if rally >= 9:
+            r[rally - 8] = -0.01
+            r[rally - 7:rally + 1] = 0.1
+        close = 10 * np.exp(np.cumsum(r))
+        preclose = np.concatenate([[close[0]], close[:-1]])
+        open_ = preclose * (1 + rng.normal(0, 0.02, n))
+        volume = rng.lognormal(17, 0.8, n)
+        volume[limit_up] *= 5
+        suspended = rng.random(n) < 0.03
+        if climax >= 0:
+            volume[climax] *= 8
+            suspended[climax] = False
+        if rally >= 9:
+            suspended[rally - 9:rally + 1] = False
+        for k in np.flatnonzero(~suspended):
+            rows.append((f'{600000 + c}', dates[start + k], open_[k], max(open_[k], close[k]) * 1.01,
+                         min(open_[k], close[k]) * 0.99, close[k], preclose[k], volume[k], volume[k] * close[k],
+                         1.0, (close[k] / preclose[k] - 1) * 100))
+    data = pd.DataFrame(rows, columns=['code', 'date', 'open', 'high', 'low', 'close', 'preclose', 'volume',
+                                       'amount', 'turnover', 'p_change'])
+    return market_panel.from_frame(data, date=str(dates[-1].date()))
+
+
+class strategy_panel_test(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.panel = make_panel()
+        cls.tops = set(cls.panel.codes[::3])
+        cls.strategies = [s for s in tbs.TABLE_CN_STOCK_STRATEGIES
+                          if s.get('panel_func') is not None and s['func'] is not None]
+
+    def test_panel_equals_stock(self):
+        """各策略的面板实现与逐股实现在多个交易日上的选股结果逐只一致"""
+        selected = 0
+        for date in self.panel.dates[[-1, -25, -120, -300]]:
+            ctx = stp.strategy_context(self.panel, date.astype(datetime.date),
+                                       length=max(s['lookback'] for s in self.strategies))
+            for strategy in self.strategies:
+                with self.subTest(date=str(date), strategy=strategy['name']):
+                    fast = stp.run_panel(strategy, ctx, self.tops)
+                    slow = stp.run_stock(strategy, ctx, self.tops)
+                    np.testing.assert_array_equal(fast, slow)
+                    selected += int(fast.sum())
+        # 合成数据须让策略实际选出股票，否则比对的只是全False
+        self.assertGreater(selected, 0)
+
+    def test_short_and_suspended(self):
+        """上市不足窗口长度和当日停牌的股票也参与比对"""
+        date = self.panel.dates[-1]
+        t = self.panel.date_loc(date)
+        total = self.panel.valid_count[:, t]
+        self.assertTrue((total < max(s['lookback'] for s in self.strategies)).any())
+        self.assertTrue(np.isnan(self.panel.fields['close'][:, t]).any())
+
+
+if __name__ == '__main__':
+    unittest.main()